@@ -0,0 +1,140 @@
+"""
+Term Project - Bank Account Manager (ATM Style)
+
+This file contains the AccNumAllocator class that gives every new account its
+own account number, and the allocator_for function the account classes call.
+
+Each process claims a block of numbers from the ledger database and hands
+them out locally, so the database is visited once per block rather than once
+per account. Numbers start at 100001 and keep growing past 6 digits. Numbers
+left over in a block when a process exits are never used, which leaves gaps.
+"""
+import os
+import threading
+
+from LedgerStore import LedgerStore, DEFAULT_DB
+
+# Account numbers claimed from the ledger database at a time
+BLOCK_SIZE = 1000
+
+
+class AccNumAllocator():
+    """ Account Number Allocator class - hands out unique account numbers
+    from blocks claimed on a ledger database
+
+    Concurrency Note: Thread-safe. Every process claims its own blocks, and a
+    forked child drops the block it inherited from its parent.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB, block_size=BLOCK_SIZE):
+        """Constructor sets the ledger database and block size. No numbers
+        are claimed until the first one is asked for"""
+
+        self.db_path = db_path
+        self.block_size = block_size
+        self.__reset()
+        os.register_at_fork(after_in_child=self.__reset)
+
+    def __repr__(self):
+        """ Representation of AccNumAllocator"""
+        return f'AccNumAllocator({self.db_path!r}, {self.block_size})'
+
+    def __reset(self):
+        """ Drops the current block, with a fresh lock as the old one may have
+        been held by another thread at fork time"""
+        self.__lock = threading.Lock()
+        self.__next_num = self.__end_num = 0
+
+    def next_acc_num(self):
+        """ Returns the next account number, as a string"""
+
+        with self.__lock:
+            if self.__next_num >= self.__end_num:
+                # Block used up - claim the next one from the database
+                store = LedgerStore(self.db_path)
+                try:
+                    self.__next_num = store.claim_acc_nums(self.block_size)
+                finally:
+                    store.close()
+                self.__end_num = self.__next_num + self.block_size
+            acc_num = self.__next_num
+            self.__next_num += 1
+        return str(acc_num)
+
+
+# One allocator per ledger database in this process
+_allocators = {}
+_allocators_lock = threading.Lock()
+
+
+def allocator_for(db_path=DEFAULT_DB):
+    """ Returns the allocator of this process for a ledger database"""
+
+    key = os.path.abspath(db_path)
+    with _allocators_lock:
+        if key not in _allocators:
+            _allocators[key] = AccNumAllocator(db_path)
+        return _allocators[key]
+
+
+def _acc_nums_in_child(args):
+    """ Helper for the unit tests - allocates numbers in a worker process"""
+    db_path, count = args
+    allocator = allocator_for(db_path)
+    return [allocator.next_acc_num() for _ in range(count)]
+
+
+# Unit Tests
+if __name__ == '__main__':
+    import tempfile
+    import multiprocessing
+    from concurrent.futures import ThreadPoolExecutor
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, 'test_ledger.db')
+
+        # Numbers come from blocks - one database visit per block
+        allocator = AccNumAllocator(db_file, 10)
+        acc_nums = [allocator.next_acc_num() for _ in range(25)]
+        assert acc_nums[0] == '100001', "Account numbers should start at 100001"
+        assert len(set(acc_nums)) == 25, "Account numbers repeated!"
+        store = LedgerStore(db_file)
+        assert store.cur.execute(
+            "SELECT value FROM counters WHERE name = 'acc_num'"
+        ).fetchone()[0] == 100001 + 30, "Should have claimed three blocks"
+
+        # Numbers grow past the 6 digit range
+        store.cur.execute(
+            "UPDATE counters SET value = 999995 WHERE name = 'acc_num'")
+        store.conn.commit()
+        store.close()
+        big_allocator = AccNumAllocator(db_file, 10)
+        big_nums = [int(big_allocator.next_acc_num()) for _ in range(10)]
+        assert big_nums[-1] > 999999, "Account numbers stuck at 6 digits"
+
+        # Allocators share the database without overlapping
+        assert not set(acc_nums) & set(map(str, big_nums)), \
+            "Allocators handed out the same number"
+        assert allocator_for(db_file) is allocator_for(db_file), \
+            "One allocator per database expected"
+
+        # No repeats across threads
+        with ThreadPoolExecutor(8) as pool:
+            thread_nums = list(pool.map(
+                lambda _: [allocator.next_acc_num() for _ in range(500)],
+                range(8)))
+        all_nums = [i for chunk in thread_nums for i in chunk]
+        assert len(set(all_nums)) == len(all_nums), \
+            "Account numbers repeated across threads"
+
+        # No repeats across processes, including after fork
+        allocator_for(db_file).next_acc_num()
+        with multiprocessing.get_context('fork').Pool(4) as pool:
+            proc_nums = pool.map(_acc_nums_in_child, [(db_file, 1500)] * 4)
+        proc_nums.append(_acc_nums_in_child((db_file, 1500)))
+        all_nums = [i for chunk in proc_nums for i in chunk]
+        assert len(set(all_nums)) == len(all_nums), \
+            "Account numbers repeated across processes"
+
+    # All tests passed!
+    print("\nAll AccNumAllocator unit tests passed!")
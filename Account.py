@@ -0,0 +1,594 @@
+"""
+Term Project - Bank Account Manager (ATM Style)
+
+This file contains the Account class - the core shared by CheckingAccount and
+SavingsAccount. It creates accounts on the ledger database, withdraws and
+deposits money and produces the mini statement.
+
+Ensure to call close_db_connection on an account if instantiated!
+"""
+import time
+import sqlite3
+from collections import deque
+from contextlib import contextmanager
+
+import Metrics
+import Profiling
+from AccNumAllocator import allocator_for
+from Money import Money, MAX_CENTS
+from LedgerStore import LedgerStore, DEFAULT_DB, DEFAULT_PROFILE, \
+    STREAM_CHUNK_SIZE, STATEMENT_HEADERS, TRANSFER_OUT_REMARK, \
+    TRANSFER_IN_REMARK
+from StatementExport import export_statement
+from TransIdGenerator import next_id, next_ids
+
+
+# Transactions on the mini statement
+STATEMENT_ROWS = 10
+
+# Deposits and withdrawals refused - overdrafts and invalid amounts
+REJECTED = Metrics.counter('account_rejected_total',
+                           'Deposits and withdrawals refused')
+
+
+class Account():
+    """ Account class - creates account, able to withdraw and deposit money,
+    also print out a mini statement of the last 10 transactions. Subclasses
+    set ACC_PREFIX (used in the account id on the ledger database) and
+    ACC_LABEL (used when the account is printed).
+
+    The balance is kept as integer cents in `cents`; `balance` gives it as
+    Money. Amounts can be passed in as Money or as dollars in any form
+    Money.of reads - a str, int, float or Decimal - and are taken to the
+    exact cent. Instances have no __dict__, only the slots below, so that many
+    accounts can be kept in memory.
+
+    Once the mini statement has been read, its rows are kept in a ring buffer
+    of the last STATEMENT_ROWS transactions, which deposits, withdrawals and
+    transfers made through the instance keep up to date, so later statements
+    are answered without reading the database. statement_version counts the
+    changes, for callers that cache what they make of the statement.
+    Transactions written to the account by other means (another instance,
+    BalanceCache, InterestEngine) are only picked up by refresh() or
+    mini_statement(refresh=True). Deposits and withdrawals move the balance
+    on the database by their amounts, so they never undo such a transaction;
+    the account takes the balance from the database when they are written.
+
+    Concurrency Note: This class is not designed to be thread-safe.
+    - Account numbers: Every instance gets its own account number from
+      AccNumAllocator, unique across threads and processes.
+    - Database operations: By default every instance opens its own connection
+      to the shared ledger database (see LedgerStore). Accounts can also share
+      one LedgerStore. SQLite serializes writes from several connections, but
+      an instance and its connection must not be shared across threads
+      without proper locking mechanisms.
+    """
+
+    __slots__ = ('owner', 'acc_num', 'tb_name', 'cents', '__store',
+                 '__owns_store', '__pending', '__recent', '__version')
+
+    ACC_PREFIX = 'ACC'
+    ACC_LABEL = 'Generic'
+
+    def __init__(self, owner, balance=0, db_path=DEFAULT_DB,
+                 profile=DEFAULT_PROFILE, store=None):
+        """Constructor creates
+      - An account for the owner supplied with the default balance is 0
+        (balance is an amount in dollars, see Money.of)
+      - An entry for the account in the shared ledger database that would
+        store transaction information. profile picks the durability/
+        performance settings of the database connection (see LedgerStore).
+        An open LedgerStore can be passed in as store to use its connection
+        instead of opening a new one"""
+
+        # Open the shared ledger database and register the account on it
+        # under a new account number
+        owns_store = store is None
+        if owns_store:
+            store = self.__open_store(db_path, profile)
+        self.__attach(store, owns_store,
+                      allocator_for(store.db_path).next_acc_num(), owner,
+                      Money.of(balance).cents)
+        store.create_account(self.tb_name, owner, self.cents)
+
+    @classmethod
+    def open_account(cls, acc_num, db_path=DEFAULT_DB,
+                     profile=DEFAULT_PROFILE, store=None):
+        """ Opens an existing account from the ledger database, with its
+        owner, balance and transaction history, without re-creating it.
+        An open LedgerStore can be passed in as store to use its connection
+        instead of opening a new one"""
+
+        owns_store = store is None
+        if owns_store:
+            store = cls.__open_store(db_path, profile)
+        acc_row = store.load_account(cls.ACC_PREFIX + '_' + acc_num)
+        if acc_row is None:
+            if owns_store:
+                store.close()
+            raise KeyError(f'No {cls.ACC_LABEL} Account #{acc_num} in '
+                           f'{store.db_path}')
+
+        acc = cls.__new__(cls)
+        acc.__attach(store, owns_store, acc_num, *acc_row)
+        return acc
+
+    @classmethod
+    def __open_store(cls, db_path, profile):
+        """ Opens the ledger database, exits if it cannot be used"""
+        try:
+            return LedgerStore(db_path, profile)
+        except (OSError, sqlite3.Error):
+            print(
+                f'\nDatabase error on {cls.__name__}. Close any programs '
+                f'that might be using the file "{db_path}" and try '
+                'again. Exiting...')
+            time.sleep(2)
+            exit()
+
+    def __attach(self, store, owns_store, acc_num, owner, cents):
+        """ Sets up the account attributes on top of an open ledger store"""
+
+        self.owner = owner
+        self.cents = cents
+        self.acc_num = acc_num
+        # Rows held back while a group_commit block is open
+        self.__pending = None
+        # Latest transactions, newest first - None until the mini statement
+        # is first read
+        self.__recent = None
+        self.__version = 0
+
+        self.__store = store
+        self.__owns_store = owns_store
+        # Id of the account on the ledger database
+        self.tb_name = self.ACC_PREFIX + '_' + acc_num
+
+    @property
+    def balance(self):
+        """ Available balance as Money"""
+        return Money(self.cents)
+
+    @property
+    def statement_version(self):
+        """ Number of changes to the mini statement so far"""
+        return self.__version
+
+    @property
+    def cur(self):
+        """ Cursor of the ledger database connection"""
+        return self.__store.cur
+
+    def __str__(self):
+        """ User friendly description of Account"""
+        return f'{self.ACC_LABEL} Account #{self.acc_num}\n' \
+               f'Available balance: {self.balance}'
+
+    def __repr__(self):
+        """ Representation of Account"""
+        return f'{type(self).__name__}({self.owner}, {self.balance})\n'
+
+    @Metrics.timed('account_deposit_seconds', 'Time of Account.deposit')
+    @Profiling.profiled('deposit')
+    def deposit(self, dep_amt, store=None):
+        """ Function that verifies the input amount and deposits into Account.
+        The transaction is written through store if one is passed in (e.g.
+        the connection of the calling thread), else through the account's own
+        connection"""
+        return self.__post('deposit', dep_amt, store)
+
+    @Metrics.timed('account_withdraw_seconds', 'Time of Account.withdraw')
+    @Profiling.profiled('withdraw')
+    def withdraw(self, w_amt, store=None):
+        """ Function that verifies the input amount and withdraws from
+        Account. store works as in deposit"""
+        return self.__post('withdraw', w_amt, store)
+
+    def __post(self, trans_type, amt, store):
+        """ Applies and writes a single deposit or withdrawal, restoring the
+        balance if the write fails"""
+
+        orig_cents = self.cents
+        trans_msg, trans_row = self.__apply(trans_type, amt)
+        if trans_row:
+            try:
+                self.__write([trans_row], store)
+            except BaseException:
+                self.cents = orig_cents
+                raise
+        else:
+            REJECTED.inc()
+        return trans_msg
+
+    def post_batch(self, transactions):
+        """ Function that posts a batch of ('deposit' | 'withdraw', amount)
+        transactions. Every item is verified against the running balance in
+        order, the accepted ones are written with a single executemany and
+        commit, and a list with one result message per item is returned"""
+
+        transactions = list(transactions)
+        for trans_type, _ in transactions:
+            if trans_type not in ('deposit', 'withdraw'):
+                raise ValueError(f'Unknown transaction type: {trans_type!r}')
+
+        # An amount that cannot be read stops the batch with nothing written
+        orig_cents = self.cents
+        results, rows = [], []
+        try:
+            for trans_type, amt in transactions:
+                trans_msg, trans_row = self.__apply(trans_type, amt)
+                results.append(trans_msg)
+                if trans_row:
+                    rows.append(trans_row)
+            self.__write(rows)
+        except BaseException:
+            self.cents = orig_cents
+            raise
+        return results
+
+    @contextmanager
+    def group_commit(self):
+        """ Context manager that holds back the commit of every deposit and
+        withdrawal made inside the with block and writes them all in one
+        transaction on exit. If the block raises, nothing is written and the
+        balance is restored"""
+
+        if self.__pending is not None:
+            # Nested group commits join the outer one
+            yield self
+            return
+
+        orig_cents = self.cents
+        self.__pending = []
+        try:
+            yield self
+        except BaseException:
+            self.cents = orig_cents
+            raise
+        else:
+            rows = self.__pending
+            self.__pending = None
+            try:
+                self.__write(rows)
+            except BaseException:
+                self.cents = orig_cents
+                raise
+        finally:
+            self.__pending = None
+
+    @Profiling.profiled('transfer')
+    def transfer(self, dst, amt, store=None):
+        """ Function that moves amt from Account to dst, another account on
+        the same ledger database. The debit here and the credit on dst are
+        written in one transaction, so a transfer is never half applied.
+        store works as in deposit"""
+        return Account.transfer_batch([(self, dst, amt)], store)[0]
+
+    @staticmethod
+    def transfer_batch(transfers, store=None):
+        """ Function that posts a batch of (src, dst, amount) transfers
+        between accounts - e.g. a sweep of many customers' checking into
+        their savings - in one transaction. Every transfer is checked
+        against the source balance on the database at its turn, and a list
+        with one result message per item is returned. store works as in
+        deposit; by default the first source account's connection is
+        used"""
+
+        transfers = list(transfers)
+        if not transfers:
+            return []
+        store = store or transfers[0][0].__store
+        for src, dst, _ in transfers:
+            for acc in (src, dst):
+                if acc.__store.db_path != store.db_path:
+                    raise ValueError(f'{acc.tb_name} is not on '
+                                     f'{store.db_path}')
+                if acc.__pending is not None:
+                    raise RuntimeError(f'{acc.tb_name} has a group_commit '
+                                       f'in progress')
+
+        # Only transfers of a positive amount between two accounts go to the
+        # database, with two transaction ids each - one for every leg
+        amounts = [Money.of(amt) for _, _, amt in transfers]
+        posts = [i for i, (src, dst, _) in enumerate(transfers)
+                 if src.tb_name != dst.tb_name and amounts[i].cents > 0]
+        trans_ids = next_ids(2 * len(posts), store.db_path)
+        leg_ids = {i: (trans_ids[2 * k], trans_ids[2 * k + 1])
+                   for k, i in enumerate(posts)}
+        timestamp = int(time.time())
+        balances = dict(zip(posts, store.post_transfers(
+            (transfers[i][0].tb_name, transfers[i][1].tb_name,
+             amounts[i].cents, trans_ids[2 * k],
+             trans_ids[2 * k + 1], timestamp) for k, i in enumerate(posts))))
+
+        # The database is the judge of the balances; the accounts follow, in
+        # the order of the transfers
+        results = []
+        for i, (src, dst, _) in enumerate(transfers):
+            amt_cents = amounts[i].cents
+            if src.tb_name == dst.tb_name:
+                results.append('Cannot transfer to the same account!')
+            elif amt_cents < 0:
+                results.append(f'Cannot transfer negative amounts! Current '
+                               f'balance is {src.balance}')
+            elif amt_cents == 0:
+                results.append(f'Nothing to transfer. Current balance is '
+                               f'{src.balance}')
+            elif balances[i] is None:
+                results.append(f'Cannot overdraw! Available balance is '
+                               f'{src.balance}')
+            else:
+                src_cents, dst_cents = balances[i]
+                out_id, in_id = leg_ids[i]
+                src.cents -= amt_cents
+                dst.cents += amt_cents
+                src.__follow(src_cents, [(out_id, timestamp,
+                                          TRANSFER_OUT_REMARK, -amt_cents,
+                                          src_cents)])
+                dst.__follow(dst_cents, [(in_id, timestamp,
+                                          TRANSFER_IN_REMARK, amt_cents,
+                                          dst_cents)])
+                results.append(f'Transferred {amounts[i]} to '
+                               f'{dst.ACC_LABEL} Account #{dst.acc_num}. The '
+                               f'new balance is {src.balance}')
+        return results
+
+    def __apply(self, trans_type, amt):
+        """ Verifies a deposit or withdrawal against the balance, updates the
+        balance if accepted and returns the result message along with the
+        transaction row to be inserted (None if it was rejected)"""
+
+        amt = Money.of(amt)
+        amt_cents = amt.cents
+        if trans_type == 'deposit':
+            # Verify if amount being deposited is positive
+            if amt_cents < 0:
+                return f'Cannot deposit negative amounts! Current balance is ' \
+                       f'{self.balance}', None
+            elif amt_cents == 0:
+                return f'Nothing to deposit. Current balance is ' \
+                       f'{self.balance}', None
+            trans_remark = 'Credit'
+        else:
+            # Verify if withdrawal amount is under the balance
+            if amt_cents > self.cents:
+                return f'Cannot overdraw! Available balance is ' \
+                       f'{self.balance}', None
+            trans_remark = 'Debit'
+            amt_cents = -amt_cents
+
+        # The ledger stores balances as 64-bit integers
+        if self.cents + amt_cents > MAX_CENTS:
+            return f'Balance cannot exceed {Money(MAX_CENTS)}! Current ' \
+                   f'balance is {self.balance}', None
+        self.cents += amt_cents
+
+        # Amounts are recorded as signed cents and formatted only for display
+        trans_row = (next_id(self.__store.db_path), int(time.time()),
+                     trans_remark, amt_cents, self.cents)
+        curr_bal = self.balance
+
+        # Return the deposited/withdrawn amount and the new balance
+        if trans_type == 'deposit':
+            return f'Deposit of {amt} accepted! \nThe new balance is ' \
+                   f'{curr_bal}', trans_row
+        return f'Withdrawn {amt}. The new balance is {curr_bal}', trans_row
+
+    def __write(self, rows, store=None):
+        """ Inserts transaction rows with one executemany and commits, or
+        queues them up if a group commit is in progress"""
+
+        if self.__pending is not None:
+            self.__pending.extend(rows)
+            return
+        if not rows:
+            return
+
+        self.__follow(*(store or self.__store).post_transactions(
+            self.tb_name, rows))
+
+    def __follow(self, cents, rows):
+        """ Takes the balance on the ledger once rows were written and adds
+        them to the mini statement. A balance other than the one worked out
+        means the account was written to by other means since it was loaded,
+        so the mini statement is read again when it is next asked for"""
+
+        if cents != self.cents:
+            self.cents = cents
+            self.__recent = None
+            self.__version += 1
+        self.__remember(rows)
+
+    def __remember(self, rows):
+        """ Adds rows written to the ledger, oldest first, to the mini
+        statement"""
+        self.__version += 1
+        if self.__recent is not None:
+            self.__recent.extendleft(rows)
+
+    def refresh(self, store=None):
+        """ Function that reads the balance and mini statement of Account
+        from the database again, through store if one is passed in, else
+        through the account's own connection - e.g. after InterestEngine has
+        accrued interest on it"""
+
+        self.cents = (store or self.__store).load_account(self.tb_name)[1]
+        self.mini_statement(store, refresh=True)
+
+    @Metrics.timed('account_mini_statement_seconds',
+                   'Time of Account.mini_statement')
+    @Profiling.profiled('mini_statement')
+    def mini_statement(self, store=None, refresh=False):
+        """ Function that produces a list of list of the last 10 transactions
+        for Account, newest first. Timestamps are epoch seconds and amounts
+        are signed cents. The transactions are read from the database the
+        first time, through store if one is passed in, else through the
+        account's own connection, and from the ring buffer after that.
+        refresh reads them from the database again"""
+
+        if refresh or self.__recent is None:
+            recent = deque(
+                (store or self.__store).latest_transactions(self.tb_name,
+                                                            STATEMENT_ROWS),
+                maxlen=STATEMENT_ROWS)
+            if self.__recent is not None and recent != self.__recent:
+                self.__version += 1
+            self.__recent = recent
+
+        # If transactions exist, the header goes at index 0
+        if not self.__recent:
+            return []
+        return [list(STATEMENT_HEADERS)] + [list(row) for row in self.__recent]
+
+    def full_statement(self, after_id=None, start_ts=None, end_ts=None,
+                       chunk_size=STREAM_CHUNK_SIZE):
+        """ Generator that yields every transaction of Account, oldest first,
+        in lists of at most chunk_size rows. Rows are in the same form as in
+        mini_statement, without the header row. after_id, start_ts and end_ts
+        filter the rows as in LedgerStore.stream_transactions"""
+        return self.__store.stream_transactions(self.tb_name, after_id,
+                                                start_ts, end_ts, chunk_size)
+
+    def export_statement(self, out_path, fmt=None, after_id=None,
+                         start_ts=None, end_ts=None):
+        """ Function that writes the full statement of Account to a CSV or
+        JSON Lines file (see StatementExport) and returns the number of
+        transactions written"""
+        return export_statement(self.__store, self.tb_name, out_path, fmt,
+                                after_id, start_ts, end_ts)
+
+    def close_db_connection(self):
+        """ Closes the database connection when called. A LedgerStore that
+        was passed in is left open for its owner to close"""
+        if self.__owns_store:
+            self.__store.close()
+
+
+# Unit Tests
+if __name__ == '__main__':
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, 'test_ledger.db')
+
+        # Instances are slotted - no per-instance __dict__
+        acc = Account('John Doe', 10.004, db_file)
+        assert not hasattr(acc, '__dict__'), "Account should not have a __dict__"
+        try:
+            acc.nickname = 'JD'
+        except AttributeError:
+            pass
+        else:
+            raise AssertionError("Account should not accept new attributes")
+
+        # Balances are integer cents
+        assert acc.cents == 1000 and acc.balance == Money(1000), \
+            "Balance should be rounded to whole cents"
+        acc.deposit(0.1)
+        acc.deposit(0.2)
+        assert acc.cents == 1030 and isinstance(acc.cents, int), \
+            "Balance should be kept in integer cents"
+        assert acc.tb_name == 'ACC_' + acc.acc_num, "Invalid account id!"
+
+        # The full statement streams every transaction, oldest first
+        for _ in range(24):
+            acc.withdraw(0.01)
+        full_rows = [row for chunk in acc.full_statement(chunk_size=5)
+                     for row in chunk]
+        assert len(full_rows) == 26 and full_rows[-1][4] == 1006 and \
+            [list(row) for row in full_rows[::-1][:10]] == \
+            acc.mini_statement()[1:], \
+            "Full statement does not match the mini statement"
+        export_file = os.path.join(tmp_dir, 'statement.jsonl')
+        assert acc.export_statement(export_file,
+                                    after_id=full_rows[15][0]) == 10, \
+            "Statement export is missing rows"
+
+        # Transfers move money between accounts in one transaction
+        acc_to = Account('Jim Doe', 0, db_file)
+        assert acc.transfer(acc_to, 2.5) == \
+            f'Transferred $2.50 to Generic Account #{acc_to.acc_num}. The ' \
+            f'new balance is $7.56' and (acc.cents, acc_to.cents) == \
+            (756, 250), "Transfer did not move the money"
+        assert Account.transfer_batch([(acc, acc_to, 7), (acc, acc_to, 1),
+                                       (acc_to, acc, -1), (acc, acc, 1),
+                                       (acc_to, acc, 0.56)]) == \
+            ['Transferred $7.00 to Generic Account #' + acc_to.acc_num +
+             '. The new balance is $0.56',
+             'Cannot overdraw! Available balance is $0.56',
+             'Cannot transfer negative amounts! Current balance is $9.50',
+             'Cannot transfer to the same account!',
+             'Transferred $0.56 to Generic Account #' + acc.acc_num +
+             '. The new balance is $8.94'], \
+            "Batch transfers were not checked in order"
+        assert (acc.cents, acc_to.cents) == (112, 894) and \
+            acc_to.mini_statement()[1][2:] == ['Transfer Out', -56, 894] and \
+            acc.mini_statement()[1][2:] == ['Transfer In', 56, 112], \
+            "Transfer legs do not match the balances"
+
+        # Once read, the mini statement is kept up to date in memory - a
+        # store that cannot be read from is never touched
+        acc_c = Account('Jim Doe', 10, db_file)
+        assert acc_c.mini_statement() == [], "New account has transactions"
+        acc_c.deposit(1)
+        acc_c.withdraw(0.5)
+        acc_c.transfer(acc_to, 0.25)
+        with acc_c.group_commit():
+            acc_c.deposit(0.1)
+        assert acc_c.statement_version == 4, \
+            "Statement version did not count the changes"
+        kept_stmt = acc_c.mini_statement(store=object())
+        assert [row[2:] for row in kept_stmt[1:]] == \
+            [['Credit', 10, 1035], ['Transfer Out', -25, 1025],
+             ['Debit', -50, 1050], ['Credit', 100, 1100]] and \
+            kept_stmt == acc_c.mini_statement(refresh=True), \
+            "Kept mini statement differs from the database"
+
+        # Writes made elsewhere are only seen on refresh
+        acc_c_again = Account.open_account(acc_c.acc_num, db_path=db_file)
+        acc_c_again.deposit(1)
+        acc_c_again.close_db_connection()
+        assert acc_c.mini_statement()[1][4] == 1035 and \
+            acc_c.mini_statement(refresh=True)[1][4] == 1135 and \
+            acc_c.statement_version == 5, \
+            "Refresh did not read the mini statement again"
+        acc_c.close_db_connection()
+        acc_to.close_db_connection()
+
+        # Amounts that cannot be read, or balances the ledger cannot store,
+        # leave the account as it was
+        acc_d = Account('Jim Doe', 10, db_file)
+        for bad_call in (lambda: acc_d.deposit('1' * 25),
+                         lambda: acc_d.post_batch([('deposit', 5),
+                                                   ('deposit', 'abc')])):
+            try:
+                bad_call()
+            except ValueError:
+                pass
+            else:
+                raise AssertionError("Unreadable amount was accepted")
+        assert acc_d.deposit(Money(MAX_CENTS)) == \
+            f'Balance cannot exceed {Money(MAX_CENTS)}! Current balance is ' \
+            f'$10.00' and acc_d.withdraw(Money(-MAX_CENTS)).startswith(
+                'Balance cannot exceed'), "Too large a balance was accepted"
+        assert acc_d.cents == 1000 and acc_d.mini_statement() == [] and \
+            acc_d.cur.execute('SELECT balance FROM accounts WHERE '
+                              'account_id = ?', (acc_d.tb_name,)).fetchone() \
+            == (1000,), "Failed deposits changed the balance"
+        acc_d.close_db_connection()
+
+        # Accounts can share one store, which they leave open
+        store = LedgerStore(db_file)
+        acc_a = Account('Jane Doe', 5, store=store)
+        acc_b = Account.open_account(acc.acc_num, store=store)
+        assert acc_b.cents == 112, "Account opened on a shared store is wrong"
+        acc_a.close_db_connection()
+        acc_b.close_db_connection()
+        assert store.load_account(acc_a.tb_name) == ('Jane Doe', 500), \
+            "Shared store was closed by an account"
+        store.close()
+        acc.close_db_connection()
+
+    # All tests passed!
+    print("\nAll Account unit tests passed!")
@@ -0,0 +1,309 @@
+"""
+Term Project - Bank Account Manager (ATM Style)
+
+This file contains the AccountEngine class that runs deposits and withdrawals
+for many accounts at once on a pool of threads.
+
+Ensure to call AccountEngine.close if instantiated!
+"""
+import threading
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+
+from Account import Account
+from LedgerStore import LedgerStore, DEFAULT_DB, DEFAULT_PROFILE
+
+# Number of locks accounts are spread over
+NUM_STRIPES = 256
+
+
+class AccountEngine():
+    """ Account Engine class - runs deposit and withdraw calls of Account
+    objects on a thread pool.
+
+    Concurrency Note: Thread-safe. Every account maps to one of a fixed set of
+    striped locks, so calls on the same account run one at a time - its
+    balance check and update cannot interleave - while calls on accounts
+    under other locks run in parallel. A transfer takes the locks of both of
+    its accounts, always in the same order, so two transfers can never wait
+    on each other. Every worker thread writes through its
+    own connection to the ledger database. While an engine serves an account,
+    all of that account's deposits and withdrawals must go through the engine.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB, profile=DEFAULT_PROFILE,
+                 max_workers=8, num_stripes=NUM_STRIPES):
+        """Constructor starts the thread pool. Worker connections are opened
+        on first use"""
+
+        self.db_path = db_path
+        self.profile = profile
+        self.__pool = ThreadPoolExecutor(max_workers,
+                                         thread_name_prefix='AccountEngine')
+        self.__stripes = [threading.Lock() for _ in range(num_stripes)]
+        self.__local = threading.local()
+        self.__stores = []
+        self.__stores_lock = threading.Lock()
+
+    def __repr__(self):
+        """ Representation of AccountEngine"""
+        return f'AccountEngine({self.db_path!r}, {self.profile!r})'
+
+    def __enter__(self):
+        """ Lets the engine be used in a with block"""
+        return self
+
+    def __exit__(self, *exc_info):
+        """ Closes the engine at the end of the with block"""
+        self.close()
+
+    def __thread_store(self):
+        """ Returns the ledger connection of the calling worker thread"""
+
+        store = getattr(self.__local, 'store', None)
+        if store is None:
+            store = LedgerStore(self.db_path, self.profile,
+                                check_same_thread=False)
+            self.__local.store = store
+            with self.__stores_lock:
+                self.__stores.append(store)
+        return store
+
+    def lock_for(self, acc):
+        """ Returns the lock that guards an account"""
+        return self.__stripes[hash(acc.tb_name) % len(self.__stripes)]
+
+    def __locks_for(self, accs):
+        """ Returns the locks that guard a set of accounts, each lock once
+        and in stripe order"""
+        stripes = sorted({hash(acc.tb_name) % len(self.__stripes)
+                          for acc in accs})
+        return [self.__stripes[i] for i in stripes]
+
+    def __run(self, acc, trans_type, amt):
+        """ Runs one deposit or withdrawal under the account's lock"""
+
+        with self.lock_for(acc):
+            if trans_type == 'deposit':
+                return acc.deposit(amt, self.__thread_store())
+            return acc.withdraw(amt, self.__thread_store())
+
+    def __transfer(self, transfers):
+        """ Runs a batch of transfers under the locks of all their
+        accounts"""
+
+        with ExitStack() as held:
+            for lock in self.__locks_for(acc for transfer in transfers
+                                         for acc in transfer[:2]):
+                held.enter_context(lock)
+            return Account.transfer_batch(transfers, self.__thread_store())
+
+    def __statement(self, acc):
+        """ Reads the mini statement of an account under its lock"""
+        with self.lock_for(acc):
+            return acc.mini_statement(self.__thread_store())
+
+    def __post_batch(self, acc, transactions):
+        """ Runs deposits and withdrawals of an account in order under its
+        lock and commits them together. If the commit fails none of them is
+        kept"""
+
+        store = self.__thread_store()
+        with self.lock_for(acc):
+            results = []
+            try:
+                with store.hold_commits():
+                    for trans_type, amt in transactions:
+                        version = acc.statement_version
+                        if trans_type == 'deposit':
+                            trans_msg = acc.deposit(amt, store)
+                        else:
+                            trans_msg = acc.withdraw(amt, store)
+                        results.append((trans_msg,
+                                        acc.statement_version != version,
+                                        acc.cents))
+            except BaseException:
+                # hold_commits rolled back every row of the batch - take them
+                # back from the balance and the mini statement too
+                acc.refresh(store)
+                raise
+            return results
+
+    def __create(self, acc_cls, owner, balance):
+        """ Creates an account on the connection of the worker thread"""
+        return acc_cls(owner, balance, store=self.__thread_store())
+
+    def __open(self, acc_cls, acc_num):
+        """ Opens an account on the connection of the worker thread"""
+        return acc_cls.open_account(acc_num, store=self.__thread_store())
+
+    def create_account(self, acc_cls, owner, balance=0):
+        """ Queues the creation of an account of class acc_cls (e.g.
+        CheckingAccount), returns a Future of the new account. The account
+        has no connection of its own - use it through the engine"""
+        return self.__pool.submit(self.__create, acc_cls, owner, balance)
+
+    def open_account(self, acc_cls, acc_num):
+        """ Queues the opening of an existing account of class acc_cls,
+        returns a Future of it (which raises KeyError if there is no such
+        account). Use the account through the engine, as with
+        create_account"""
+        return self.__pool.submit(self.__open, acc_cls, acc_num)
+
+    def mini_statement(self, acc):
+        """ Queues a mini statement of acc, returns a Future of it"""
+        return self.__pool.submit(self.__statement, acc)
+
+    def deposit(self, acc, dep_amt):
+        """ Queues a deposit into acc, returns a Future of the result
+        message"""
+        return self.__pool.submit(self.__run, acc, 'deposit', dep_amt)
+
+    def withdraw(self, acc, w_amt):
+        """ Queues a withdrawal from acc, returns a Future of the result
+        message"""
+        return self.__pool.submit(self.__run, acc, 'withdraw', w_amt)
+
+    def post_batch(self, acc, transactions):
+        """ Queues ('deposit' | 'withdraw', amount) transactions on acc, run
+        in order and committed in one transaction. Returns a Future of a list
+        with (result message, accepted, balance in cents after it) per
+        item"""
+
+        transactions = list(transactions)
+        for trans_type, _ in transactions:
+            if trans_type not in ('deposit', 'withdraw'):
+                raise ValueError(f'Unknown transaction type: {trans_type!r}')
+        return self.__pool.submit(self.__post_batch, acc, transactions)
+
+    def transfer(self, src, dst, amt):
+        """ Queues a transfer of amt from src to dst, returns a Future of the
+        result message"""
+        return self.__pool.submit(
+            lambda: self.__transfer([(src, dst, amt)])[0])
+
+    def transfer_batch(self, transfers):
+        """ Queues a batch of (src, dst, amount) transfers, posted in one
+        transaction, returns a Future of the list of result messages"""
+        return self.__pool.submit(self.__transfer, list(transfers))
+
+    def close(self):
+        """ Waits for queued calls to finish, then stops the threads and
+        closes their database connections"""
+
+        self.__pool.shutdown(wait=True)
+        with self.__stores_lock:
+            for store in self.__stores:
+                store.close()
+            self.__stores.clear()
+
+
+# Unit Tests
+if __name__ == '__main__':
+    import os
+    import tempfile
+    from CheckingAccount import CheckingAccount
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, 'test_ledger.db')
+        accs = [CheckingAccount(f'Owner {i}', 100, db_file) for i in range(4)]
+
+        # Many more withdrawals than the balances cover, from 8 threads
+        with AccountEngine(db_file, max_workers=8) as engine:
+            futures = [engine.withdraw(acc, 1.5)
+                       for _ in range(200) for acc in accs]
+            futures += [engine.deposit(accs[0], 0.5) for _ in range(50)]
+            results = [f.result() for f in futures]
+
+        # No overdraft got through, and every accepted call is on the database
+        assert all(acc.cents >= 0 for acc in accs), "Account overdrawn!"
+        assert [acc.cents for acc in accs[1:]] == [100] * 3, \
+            "Withdrawals should stop exactly when the balance runs out"
+        check_store = LedgerStore(db_file)
+        for acc in accs:
+            net_cents = check_store.cur.execute(
+                'SELECT sum(amount) FROM transactions WHERE account_id = ?',
+                (acc.tb_name,)).fetchone()[0]
+            assert 10000 + net_cents == acc.cents, \
+                "Transactions on the database do not add up to the balance"
+            assert check_store.load_account(acc.tb_name)[1] == acc.cents, \
+                "Balance on the database differs from the account"
+        assert check_store.cur.execute(
+            'SELECT min(balance) FROM transactions').fetchone()[0] >= 0, \
+            "A running balance went negative"
+        accepted = sum(not r.startswith('Cannot') for r in results)
+        assert check_store.cur.execute(
+            'SELECT count(*) FROM transactions').fetchone()[0] == accepted, \
+            "Transactions are missing from the database"
+        check_store.close()
+        for acc in accs:
+            acc.close_db_connection()
+
+        # Transfers in both directions at once neither deadlock nor lose money
+        pair = [CheckingAccount('Jim Doe', 50, db_file) for _ in range(2)]
+        with AccountEngine(db_file, max_workers=8) as engine:
+            futures = [engine.transfer(pair[i % 2], pair[1 - i % 2], 0.75)
+                       for i in range(200)]
+            futures.append(engine.transfer_batch([(pair[0], pair[1], 1)] * 3))
+            assert all(f.result().startswith('Transferred') for f in
+                       futures[:-1]), "Transfer between funded accounts failed"
+            futures[-1].result()
+        check_store = LedgerStore(db_file)
+        assert sum(acc.cents for acc in pair) == 10000 and \
+            [check_store.load_account(acc.tb_name)[1] for acc in pair] == \
+            [acc.cents for acc in pair], "Transfers lost or made money"
+        check_store.close()
+        for acc in pair:
+            acc.close_db_connection()
+
+        # Accounts can be created and read through the engine
+        with AccountEngine(db_file, max_workers=2) as engine:
+            engine_acc = engine.create_account(CheckingAccount, 'Jane Doe',
+                                               20).result()
+            engine.deposit(engine_acc, 5).result()
+            engine_stmt = engine.mini_statement(engine_acc).result()
+        assert engine_acc.cents == 2500 and len(engine_stmt) == 2, \
+            "Account created through the engine does not work"
+
+        # Batches run in order, committed together, with one result per item
+        with AccountEngine(db_file, max_workers=2) as engine:
+            reopened = engine.open_account(CheckingAccount,
+                                           engine_acc.acc_num).result()
+            results = engine.post_batch(reopened, [
+                ('withdraw', 20), ('withdraw', 10), ('deposit', 0),
+                ('deposit', 1.5)]).result()
+            # A batch that fails part way leaves nothing behind
+            try:
+                engine.post_batch(reopened, [('deposit', 5),
+                                             ('deposit', 'abc')]).result()
+            except ValueError:
+                pass
+            else:
+                raise AssertionError("Unreadable amount was accepted")
+            assert reopened.cents == 650 and \
+                engine.mini_statement(reopened).result()[1][4] == 650, \
+                "Failed batch changed the account"
+            try:
+                engine.open_account(CheckingAccount, '999999').result()
+            except KeyError:
+                pass
+            else:
+                raise AssertionError("Missing account was opened")
+        assert [(accepted, cents) for _, accepted, cents in results] == \
+            [(True, 500), (False, 500), (False, 500), (True, 650)], \
+            "Batch results are wrong"
+        assert results[1][0].startswith('Cannot overdraw') and \
+            reopened.cents == 650, "Batch was not run in order"
+        check_store = LedgerStore(db_file)
+        assert check_store.load_account(reopened.tb_name)[1] == 650, \
+            "Batch was not written"
+        check_store.close()
+        try:
+            engine.post_batch(reopened, [('transfer', 1)])
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Unknown transaction type was queued")
+
+    # All tests passed!
+    print("\nAll AccountEngine unit tests passed!")
@@ -0,0 +1,695 @@
+"""
+Term Project - Bank Account Manager (ATM Style)
+
+This file contains the AccountService class - a long-running asyncio service
+that keeps accounts open and runs their deposits, withdrawals, balance
+queries and mini statements, and creates new ones, for clients on a local
+TCP or Unix socket - and AccountClient, the blocking client that lets an ATM
+front end be a thin client.
+
+Accounts stay open in the service between requests, up to
+max_open_accounts of them - past that the least recently used account that
+has no request running is closed. All database work runs on an
+AccountEngine, and each of its pool_size threads holds one ledger
+connection, so however many clients connect the service never has more than
+pool_size connections open.
+
+Protocol: length-prefixed binary frames, in network byte order. A request
+frame carries a batch of requests - a pipeline - and is answered by one
+frame with a reply per request, in order. Requests on one account run in
+order, and the deposits and withdrawals among them are committed together.
+Frames on a connection are answered in the order they were sent, so a
+client may send several before reading the replies.
+  frame:     !I payload length, then the payload
+  string:    !H length, then UTF-8
+  requests:  !H count, then per request !B op code (OPS) followed by
+             deposit, withdraw  account id string, !q amount in cents
+             balance, statement account id string
+             create             account prefix string (e.g. 'CHK'), owner
+                                string, !q opening balance in cents
+  replies:   !H count, then per reply !B status (STATUS_*), !q balance in
+             cents, message string - the ATM's result message, the balance
+             text, the mini statement table or, for create, the new
+             account id
+
+Usage: python AccountService.py --serve [--port PORT | --unix PATH]
+           [--pool-size N] [--max-open N] [--db PATH] [--profile NAME]
+       python AccountService.py      (no arguments runs the unit tests)
+"""
+import sys
+import socket
+import struct
+import sqlite3
+import asyncio
+import argparse
+from collections import OrderedDict
+
+from AccountEngine import AccountEngine
+from CheckingAccount import CheckingAccount
+from SavingsAccount import SavingsAccount
+from LedgerStore import DEFAULT_DB, DEFAULT_PROFILE
+from Money import Money, MAX_CENTS
+from MiniStatement import StatementRenderer
+
+PORT = 5211
+
+# Ledger connections (engine threads) of the service
+POOL_SIZE = 4
+
+# Accounts the service keeps open at most
+MAX_OPEN_ACCOUNTS = 10000
+
+# Connections the OS may queue before the service accepts them
+BACKLOG = 4096
+
+# Largest frame accepted, in bytes
+MAX_FRAME = 1 << 20
+
+# Requests, by op code (1 onwards)
+OPS = ('deposit', 'withdraw', 'balance', 'statement', 'create')
+OP_CODES = {op: code for code, op in enumerate(OPS, 1)}
+
+# Reply statuses
+STATUS_OK = 0
+STATUS_REFUSED = 1
+STATUS_NO_ACCOUNT = 2
+STATUS_ERROR = 3
+
+# Account classes by the prefix of their account ids
+ACCOUNT_CLASSES = {acc_cls.ACC_PREFIX: acc_cls
+                   for acc_cls in (CheckingAccount, SavingsAccount)}
+
+FRAME = struct.Struct('!I')
+COUNT = struct.Struct('!H')
+OP = struct.Struct('!B')
+AMOUNT = struct.Struct('!q')
+STRING = struct.Struct('!H')
+REPLY = struct.Struct('!Bq')
+
+
+def pack_str(text):
+    """ Function that packs a string as its length and UTF-8 bytes"""
+    data = text.encode()
+    return STRING.pack(len(data)) + data
+
+
+def unpack_str(payload, offset):
+    """ Function that unpacks a string at offset, returns it and the offset
+    after it"""
+    (length,) = STRING.unpack_from(payload, offset)
+    offset += STRING.size
+    if offset + length > len(payload):
+        raise ValueError('String runs past the end of the frame')
+    return payload[offset:offset + length].decode(), offset + length
+
+
+def encode_requests(requests):
+    """ Function that packs requests into a frame. Requests are tuples of
+    the op and its arguments, amounts in dollars: ('deposit' | 'withdraw',
+    account id, amount), ('balance' | 'statement', account id) or
+    ('create', account prefix, owner, opening balance). Raises ValueError
+    for an amount Money.of cannot read, e.g. one beyond MAX_CENTS"""
+
+    parts = [COUNT.pack(len(requests))]
+    for op, *args in requests:
+        parts.append(OP.pack(OP_CODES[op]))
+        if op == 'create':
+            prefix, owner, amt = args
+            parts += [pack_str(prefix), pack_str(owner),
+                      AMOUNT.pack(Money.of(amt).cents)]
+        else:
+            parts.append(pack_str(args[0]))
+            if op in ('deposit', 'withdraw'):
+                parts.append(AMOUNT.pack(Money.of(args[1]).cents))
+    payload = b''.join(parts)
+    return FRAME.pack(len(payload)) + payload
+
+
+def decode_requests(payload):
+    """ Function that unpacks the requests of a frame, amounts in cents.
+    Raises ValueError if the frame is malformed"""
+
+    try:
+        (count,), offset = COUNT.unpack_from(payload), COUNT.size
+        requests = []
+        for _ in range(count):
+            (code,) = OP.unpack_from(payload, offset)
+            offset += OP.size
+            if not 1 <= code <= len(OPS):
+                raise ValueError(f'Unknown op code {code}')
+            op = OPS[code - 1]
+            name, offset = unpack_str(payload, offset)
+            request = [op, name]
+            if op == 'create':
+                owner, offset = unpack_str(payload, offset)
+                request.append(owner)
+            if op in ('deposit', 'withdraw', 'create'):
+                request += AMOUNT.unpack_from(payload, offset)
+                offset += AMOUNT.size
+            requests.append(tuple(request))
+    except (struct.error, UnicodeDecodeError) as exc:
+        raise ValueError(f'Malformed request frame: {exc}') from None
+    if offset != len(payload):
+        raise ValueError('Malformed request frame: trailing bytes')
+    return requests
+
+
+def encode_replies(replies):
+    """ Function that packs (status, balance in cents, message) replies into
+    a frame"""
+
+    payload = COUNT.pack(len(replies)) + b''.join(
+        REPLY.pack(status, cents) + pack_str(message)
+        for status, cents, message in replies)
+    return FRAME.pack(len(payload)) + payload
+
+
+def decode_replies(payload):
+    """ Function that unpacks the (status, balance in cents, message)
+    replies of a frame"""
+
+    (count,), offset = COUNT.unpack_from(payload), COUNT.size
+    replies = []
+    for _ in range(count):
+        status, cents = REPLY.unpack_from(payload, offset)
+        message, offset = unpack_str(payload, offset + REPLY.size)
+        replies.append((status, cents, message))
+    return replies
+
+
+class AccountService():
+    """ Account Service class - serves account requests over asyncio
+    streams, with the accounts kept open on an AccountEngine of pool_size
+    threads, one ledger connection each.
+
+    Concurrency Note: An open account is shared by all connections; the
+    engine's locks keep the calls on it from interleaving. An account is
+    only closed while no request runs on it, so there is never more than
+    one open instance of an account. While the service runs, its accounts
+    must not be written to any other way.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB, profile=DEFAULT_PROFILE,
+                 pool_size=POOL_SIZE, max_open_accounts=MAX_OPEN_ACCOUNTS):
+        """Constructor starts the AccountEngine that holds the connection
+        pool"""
+
+        self.engine = AccountEngine(db_path, profile, pool_size)
+        self.pool_size = pool_size
+        self.max_open_accounts = max_open_accounts
+        # account_id: asyncio Future of the account, least recently used
+        # first
+        self.__accounts = OrderedDict()
+        # account_id: number of requests running on the account
+        self.__in_use = {}
+        self.requests_served = 0
+
+    @property
+    def open_accounts(self):
+        """ Number of accounts the service has open"""
+        return len(self.__accounts)
+
+    def __repr__(self):
+        """ Representation of AccountService"""
+        return f'AccountService({self.engine!r}, {self.pool_size}, ' \
+               f'{self.max_open_accounts})'
+
+    async def __call(self, future):
+        """ Waits for an AccountEngine future without blocking the loop"""
+        return await asyncio.wrap_future(future)
+
+    def __keep(self, account_id, opening):
+        """ Keeps the future of an account as the most recently used, and
+        closes the least recently used accounts with no request running
+        while more than max_open_accounts are open"""
+
+        self.__accounts[account_id] = opening
+        self.__accounts.move_to_end(account_id)
+        excess = len(self.__accounts) - self.max_open_accounts
+        if excess <= 0:
+            return
+        idle = []
+        for acc_id in self.__accounts:
+            if acc_id not in self.__in_use:
+                idle.append(acc_id)
+                if len(idle) == excess:
+                    break
+        for acc_id in idle:
+            del self.__accounts[acc_id]
+
+    async def __account(self, account_id):
+        """ Returns the open account of an account id, opening it if it is
+        not open. Raises KeyError if there is no such account"""
+
+        opening = self.__accounts.get(account_id)
+        if opening is None:
+            prefix, _, acc_num = account_id.partition('_')
+            if prefix not in ACCOUNT_CLASSES:
+                raise KeyError(f'Not an account id: {account_id!r}')
+            opening = asyncio.wrap_future(self.engine.open_account(
+                ACCOUNT_CLASSES[prefix], acc_num))
+        self.__keep(account_id, opening)
+        try:
+            return await opening
+        except KeyError:
+            if self.__accounts.get(account_id) is opening:
+                del self.__accounts[account_id]
+            raise
+
+    async def __create(self, prefix, owner, cents):
+        """ Creates an account, returns its reply"""
+
+        if prefix not in ACCOUNT_CLASSES:
+            return STATUS_REFUSED, 0, f'Unknown account type: {prefix!r}'
+        if abs(cents) > MAX_CENTS:
+            return STATUS_REFUSED, 0, f'Not an opening balance: {cents} cents'
+        try:
+            acc = await self.__call(self.engine.create_account(
+                ACCOUNT_CLASSES[prefix], owner, Money(cents)))
+        except Exception as exc:
+            return STATUS_ERROR, 0, f'Request failed: {exc!r}'
+        created = asyncio.get_running_loop().create_future()
+        created.set_result(acc)
+        self.__keep(acc.tb_name, created)
+        return STATUS_OK, acc.cents, acc.tb_name
+
+    async def __run_account(self, account_id, items, statements, replies):
+        """ Runs the (index, op, args) requests of one account in order and
+        puts their replies at their index. Runs of deposits and withdrawals
+        go to the engine as one batch. A request that fails gets a
+        STATUS_ERROR reply; the account is left as it was before it"""
+
+        self.__in_use[account_id] = self.__in_use.get(account_id, 0) + 1
+        try:
+            await self.__run_items(account_id, items, statements, replies)
+        finally:
+            self.__in_use[account_id] -= 1
+            if not self.__in_use[account_id]:
+                del self.__in_use[account_id]
+
+    async def __run_items(self, account_id, items, statements, replies):
+        """ Runs the requests of one account for __run_account, while it
+        is counted as in use"""
+
+        try:
+            acc = await self.__account(account_id)
+        except KeyError:
+            for i, _, _ in items:
+                replies[i] = (STATUS_NO_ACCOUNT, 0,
+                              f'No such account: {account_id}')
+            return
+        except Exception as exc:
+            for i, _, _ in items:
+                replies[i] = (STATUS_ERROR, 0, f'Request failed: {exc!r}')
+            return
+
+        start = 0
+        while start < len(items):
+            i, op, args = items[start]
+            if op in ('deposit', 'withdraw'):
+                end = start + 1
+                while end < len(items) and \
+                        items[end][1] in ('deposit', 'withdraw'):
+                    end += 1
+                batch = items[start:end]
+                try:
+                    results = await self.__call(self.engine.post_batch(
+                        acc, [(trans_type, Money(cents))
+                              for _, trans_type, (cents,) in batch]))
+                except sqlite3.Error as exc:
+                    for j, _, _ in batch:
+                        replies[j] = (STATUS_ERROR, acc.cents,
+                                      f'Database error: {exc}')
+                except Exception as exc:
+                    for j, _, _ in batch:
+                        replies[j] = (STATUS_ERROR, acc.cents,
+                                      f'Request failed: {exc!r}')
+                else:
+                    for (j, _, _), (trans_msg, accepted, cents) in \
+                            zip(batch, results):
+                        replies[j] = (STATUS_OK if accepted
+                                      else STATUS_REFUSED, cents, trans_msg)
+                start = end
+                continue
+
+            if op == 'balance':
+                replies[i] = (STATUS_OK, acc.cents, str(acc))
+            else:
+                try:
+                    stmt_table = statements.render(
+                        acc, await self.__call(
+                            self.engine.mini_statement(acc)))
+                except Exception as exc:
+                    replies[i] = (STATUS_ERROR, acc.cents,
+                                  f'Request failed: {exc!r}')
+                else:
+                    replies[i] = (STATUS_OK, acc.cents, stmt_table)
+            start += 1
+
+    async def run_requests(self, requests, statements):
+        """ Runs the decoded requests of one frame and returns their replies
+        in order. statements keeps the rendered mini statements of the
+        connection"""
+
+        replies = [None] * len(requests)
+        by_account = {}
+        creates = []
+        for i, (op, *args) in enumerate(requests):
+            if op == 'create':
+                creates.append((i, self.__create(*args)))
+            else:
+                by_account.setdefault(args[0], []).append((i, op, args[1:]))
+
+        created = await asyncio.gather(
+            *(create for _, create in creates),
+            *(self.__run_account(account_id, items, statements, replies)
+              for account_id, items in by_account.items()),
+            return_exceptions=True)
+        for (i, _), reply in zip(creates, created):
+            replies[i] = reply
+        # Anything that still got no reply failed unexpectedly - the
+        # connection and the other requests carry on
+        for i, reply in enumerate(replies):
+            if not isinstance(reply, tuple):
+                replies[i] = (STATUS_ERROR, 0, f'Request failed: {reply!r}')
+        self.requests_served += len(requests)
+        return replies
+
+    async def handle_connection(self, reader, writer):
+        """ Answers the frames of one client connection until it closes. A
+        malformed frame closes the connection"""
+
+        statements = StatementRenderer()
+        try:
+            while True:
+                (length,) = FRAME.unpack(await reader.readexactly(FRAME.size))
+                if length > MAX_FRAME:
+                    break
+                requests = decode_requests(await reader.readexactly(length))
+                writer.write(encode_replies(
+                    await self.run_requests(requests, statements)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # Client went away, or sent something it should not have
+            pass
+        finally:
+            writer.close()
+
+    async def start_tcp(self, host='127.0.0.1', port=0):
+        """ Starts serving on a TCP port, returns the asyncio server"""
+        return await asyncio.start_server(self.handle_connection, host, port,
+                                          backlog=BACKLOG)
+
+    async def start_unix(self, path):
+        """ Starts serving on a Unix socket, returns the asyncio server"""
+        return await asyncio.start_unix_server(self.handle_connection, path,
+                                               backlog=BACKLOG)
+
+    def close(self):
+        """ Closes the AccountEngine and its connections"""
+        self.engine.close()
+
+
+class AccountClient():
+    """ Account Client class - a blocking connection to an AccountService.
+
+    Replies are (status, balance in cents, message) tuples. pipeline sends
+    any number of requests in one round trip; send and receive let a client
+    keep several pipelines in flight.
+
+    Concurrency Note: Not thread-safe - use one client per thread.
+    """
+
+    def __init__(self, host='127.0.0.1', port=PORT, unix=None):
+        """Constructor connects to the service, on the Unix socket unix if
+        given, else on host and port"""
+
+        if unix:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(unix)
+        else:
+            self.sock = socket.create_connection((host, port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def __repr__(self):
+        """ Representation of AccountClient"""
+        return f'AccountClient({self.sock.getpeername()!r})'
+
+    def __enter__(self):
+        """ Lets the client be used in a with block"""
+        return self
+
+    def __exit__(self, *exc_info):
+        """ Closes the client at the end of the with block"""
+        self.close()
+
+    def __recv_exactly(self, size):
+        """ Reads exactly size bytes from the service"""
+
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionResetError('AccountService closed the '
+                                           'connection')
+            data += chunk
+        return bytes(data)
+
+    def send(self, requests):
+        """ Sends a pipeline of requests (see encode_requests) without
+        waiting for the replies"""
+        self.sock.sendall(encode_requests(requests))
+
+    def receive(self):
+        """ Returns the replies to the oldest pipeline sent and not yet
+        received"""
+        (length,) = FRAME.unpack(self.__recv_exactly(FRAME.size))
+        return decode_replies(self.__recv_exactly(length))
+
+    def pipeline(self, requests):
+        """ Sends a pipeline of requests and returns their replies"""
+        self.send(requests)
+        return self.receive()
+
+    def create_account(self, prefix, owner, balance=0):
+        """ Creates an account - prefix is 'CHK' or 'SAV' - and returns its
+        account id. Raises ValueError if the service refuses"""
+
+        status, _, message = self.pipeline([('create', prefix, owner,
+                                             balance)])[0]
+        if status != STATUS_OK:
+            raise ValueError(message)
+        return message
+
+    def deposit(self, account_id, dep_amt):
+        """ Deposits into an account, returns the reply"""
+        return self.pipeline([('deposit', account_id, dep_amt)])[0]
+
+    def withdraw(self, account_id, w_amt):
+        """ Withdraws from an account, returns the reply"""
+        return self.pipeline([('withdraw', account_id, w_amt)])[0]
+
+    def balance(self, account_id):
+        """ Returns the reply with the balance of an account"""
+        return self.pipeline([('balance', account_id)])[0]
+
+    def mini_statement(self, account_id):
+        """ Returns the reply with the mini statement table of an account"""
+        return self.pipeline([('statement', account_id)])[0]
+
+    def close(self):
+        """ Closes the connection"""
+        self.sock.close()
+
+
+async def main(args):
+    """ Runs the service until interrupted"""
+
+    service = AccountService(args.db, args.profile, args.pool_size,
+                             args.max_open)
+    if args.unix:
+        server = await service.start_unix(args.unix)
+    else:
+        server = await service.start_tcp(args.host, args.port)
+    print('Serving accounts on', ', '.join(
+        str(sock.getsockname()) for sock in server.sockets))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+# Unit Tests - run with no arguments; the service is started with --serve
+if __name__ == '__main__' and len(sys.argv) == 1:
+    import os
+    import tempfile
+    import threading
+
+    # Frames round trip, and amounts beyond MAX_CENTS are not sent
+    requests = [('deposit', 'CHK_100001', '12.34'),
+                ('withdraw', 'SAV_100001', 5), ('balance', 'CHK_100001'),
+                ('statement', 'SAV_100001'), ('create', 'CHK', 'Jane Doe',
+                                              Money(MAX_CENTS))]
+    assert decode_requests(encode_requests(requests)[FRAME.size:]) == [
+        ('deposit', 'CHK_100001', 1234), ('withdraw', 'SAV_100001', 500),
+        ('balance', 'CHK_100001'), ('statement', 'SAV_100001'),
+        ('create', 'CHK', 'Jane Doe', MAX_CENTS)], "Requests round trip"
+    replies = [(STATUS_OK, 1234, 'ok'), (STATUS_REFUSED, -5, '\u00e9')]
+    assert decode_replies(encode_replies(replies)[FRAME.size:]) == \
+        replies, "Replies round trip"
+    for bad_amt in ('abc', '1e30', 10 ** 20):
+        try:
+            encode_requests([('deposit', 'CHK_100001', bad_amt)])
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"Bad amount was encoded: {bad_amt!r}")
+    for bad_payload in (b'', COUNT.pack(1) + OP.pack(9) + pack_str('x'),
+                        COUNT.pack(1) + OP.pack(1) + STRING.pack(50),
+                        COUNT.pack(0) + b'x'):
+        try:
+            decode_requests(bad_payload)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"Malformed frame decoded: {bad_payload}")
+
+    def raw_frame(*parts):
+        """ Returns a request frame of one request packed by hand"""
+        payload = COUNT.pack(1) + b''.join(parts)
+        return FRAME.pack(len(payload)) + payload
+
+    with tempfile.TemporaryDirectory() as test_dir:
+        # Serve from a loop in another thread, on an ephemeral port
+        service = AccountService(os.path.join(test_dir, 'service_test.db'),
+                                 pool_size=2)
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(service.start_tcp(port=0))
+        port = server.sockets[0].getsockname()[1]
+        loop_thread = threading.Thread(target=loop.run_forever)
+        loop_thread.start()
+        try:
+            with AccountClient(port=port) as client:
+                chk_id = client.create_account('CHK', 'Jane Doe', 100)
+                sav_id = client.create_account('SAV', 'Jane Doe', '250.50')
+                assert chk_id.startswith('CHK_') and \
+                    sav_id.startswith('SAV_'), "Account ids are wrong"
+                assert client.deposit(chk_id, 50)[:2] == (STATUS_OK, 15000), \
+                    "Deposit failed"
+                assert client.withdraw(chk_id, 1000)[:2] == \
+                    (STATUS_REFUSED, 15000), "Overdraft was not refused"
+                status, cents, text = client.balance(sav_id)
+                assert status == STATUS_OK and cents == 25050 and \
+                    '$250.50' in text, "Balance is wrong"
+                status, _, table = client.mini_statement(chk_id)
+                assert status == STATUS_OK and '$50.00' in table, \
+                    "Statement is missing the deposit"
+
+                # A pipeline answers every request, in order
+                replies = client.pipeline([
+                    ('deposit', chk_id, 10), ('withdraw', sav_id, '0.50'),
+                    ('deposit', chk_id, 0), ('balance', chk_id),
+                    ('deposit', 'CHK_999999', 5), ('balance', 'bogus')])
+                assert [reply[:2] for reply in replies] == [
+                    (STATUS_OK, 16000), (STATUS_OK, 25000),
+                    (STATUS_REFUSED, 16000), (STATUS_OK, 16000),
+                    (STATUS_NO_ACCOUNT, 0), (STATUS_NO_ACCOUNT, 0)], \
+                    "Pipeline replies are wrong"
+                try:
+                    client.create_account('XYZ', 'Jane Doe', 5)
+                except ValueError:
+                    pass
+                else:
+                    raise AssertionError("Unknown account type was created")
+
+                # Amounts the client would not send are refused or fail on
+                # their own, and leave the balances as they were
+                for frame in (
+                        raw_frame(OP.pack(OP_CODES['create']),
+                                  pack_str('CHK'), pack_str('Jane Doe'),
+                                  AMOUNT.pack(-(1 << 63))),
+                        raw_frame(OP.pack(OP_CODES['deposit']),
+                                  pack_str(chk_id), AMOUNT.pack(-(1 << 63))),
+                        raw_frame(OP.pack(OP_CODES['withdraw']),
+                                  pack_str(chk_id), AMOUNT.pack(-(1 << 63))),
+                        raw_frame(OP.pack(OP_CODES['deposit']),
+                                  pack_str(chk_id), AMOUNT.pack(MAX_CENTS))):
+                    client.sock.sendall(frame)
+                    [(status, _, message)] = client.receive()
+                    assert status in (STATUS_REFUSED, STATUS_ERROR), \
+                        f"Bad amount was accepted: {message}"
+                assert client.balance(chk_id)[1] == 16000, \
+                    "Bad amounts changed the balance"
+
+                # A malformed frame closes only its own connection
+                client.sock.sendall(raw_frame(OP.pack(9), pack_str(chk_id)))
+                try:
+                    client.receive()
+                except ConnectionResetError:
+                    pass
+                else:
+                    raise AssertionError("Malformed frame was answered")
+
+            with AccountClient(port=port) as client:
+                client.sock.sendall(FRAME.pack(MAX_FRAME + 1))
+                try:
+                    client.receive()
+                except ConnectionResetError:
+                    pass
+                else:
+                    raise AssertionError("Oversized frame was answered")
+
+            # The service still serves, with the accounts it kept open
+            with AccountClient(port=port) as client:
+                assert client.balance(chk_id)[1] == 16000, \
+                    "Balance was lost"
+                assert client.withdraw(sav_id, 50)[:2] == \
+                    (STATUS_OK, 20000), "Withdrawal failed"
+            assert service.requests_served == 20, \
+                "Requests were not counted"
+
+            # Past max_open_accounts the least recently used accounts are
+            # closed, and are opened again with their balances when used
+            service.max_open_accounts = 2
+            with AccountClient(port=port) as client:
+                extra_ids = [client.create_account('CHK', 'John Doe', amt)
+                             for amt in (1, 2, 3)]
+                assert service.open_accounts == 2, \
+                    "Open accounts were not bounded"
+                replies = client.pipeline([('deposit', acc_id, 1) for acc_id
+                                           in (chk_id, sav_id, *extra_ids)])
+                assert [reply[:2] for reply in replies] == [
+                    (STATUS_OK, 16100), (STATUS_OK, 20100), (STATUS_OK, 200),
+                    (STATUS_OK, 300), (STATUS_OK, 400)], \
+                    "Reopened accounts lost their balances"
+                assert client.balance(chk_id)[1] == 16100 and \
+                    service.open_accounts == 2, \
+                    "Open accounts were not bounded after a pipeline"
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            loop_thread.join()
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            loop.close()
+            service.close()
+
+    print("\nAll AccountService unit tests passed!")
+
+if __name__ == '__main__' and len(sys.argv) > 1:
+    parser = argparse.ArgumentParser(description='Local account service')
+    parser.add_argument('--serve', action='store_true', required=True,
+                        help='start the service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--unix', help='serve on this Unix socket instead')
+    parser.add_argument('--pool-size', type=int, default=POOL_SIZE,
+                        help='ledger connections (AccountEngine threads)')
+    parser.add_argument('--max-open', type=int, default=MAX_OPEN_ACCOUNTS,
+                        help='accounts kept open at most')
+    parser.add_argument('--db', default=DEFAULT_DB)
+    parser.add_argument('--profile', default=DEFAULT_PROFILE)
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,376 @@
+"""
+Term Project - Bank Account Manager (ATM Style)
+
+This file contains the AtmServer class - an asyncio server that runs the ATM
+session of bank_acc_mgr for many clients at once over a local TCP or Unix
+socket. Database work is handed to an AccountEngine thread pool, so no
+session ever blocks another.
+
+Protocol: plain text lines. Whenever the server waits for input it sends the
+prompt PROMPT ("> ") without a newline; the client answers with one line.
+Clients may also send their answers ahead of the prompts.
+
+With --metrics PATH the server records metrics (see Metrics) and rewrites
+PATH every METRICS_INTERVAL seconds and on shutdown.
+
+With --profile-ops DIR the slowest account operations are profiled and
+dumped to DIR on shutdown (see Profiling).
+
+Usage: python AtmServer.py --serve [--port PORT | --unix PATH]
+           [--pace SECONDS] [--metrics PATH] [--profile-ops DIR]
+       python AtmServer.py      (no arguments runs the unit tests)
+"""
+import sys
+import time
+import asyncio
+import argparse
+
+import Metrics
+import Profiling
+from AccountEngine import AccountEngine
+from CheckingAccount import CheckingAccount
+from SavingsAccount import SavingsAccount
+from LedgerStore import DEFAULT_DB, DEFAULT_PROFILE
+from Money import Money
+from Helpers import valid_name, random_balance
+from MiniStatement import StatementRenderer
+
+# Sent when the server waits for a line from the client
+PROMPT = '> '
+
+# Connections the OS may queue before the server accepts them
+BACKLOG = 4096
+
+# Seconds between metrics dumps with --metrics
+METRICS_INTERVAL = 10
+
+# ATM options, as in bank_acc_mgr.atm_func
+OPT_DICT = {'1': 'Withdraw Money', '2': 'Deposit Money', '3': 'Check Balance',
+            '4': 'Print Mini Statement', '5': 'Exit Session'}
+SORTED_OPTIONS_STR = '\n'.join('{}: {}'.format(k, v) for
+                               k, v in sorted(OPT_DICT.items()))
+DASHES_STR = "-" * 50
+
+
+class AtmServer():
+    """ ATM Server class - serves ATM sessions over asyncio streams.
+
+    pace is the number of seconds a session pauses after each operation -
+    the non-blocking stand-in for the time.sleep calls of bank_acc_mgr. It
+    defaults to no pause.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB, profile=DEFAULT_PROFILE, pace=0,
+                 max_workers=8):
+        """Constructor starts the AccountEngine used by all sessions"""
+
+        self.pace = pace
+        self.engine = AccountEngine(db_path, profile, max_workers)
+        self.sessions_served = 0
+
+    def __repr__(self):
+        """ Representation of AtmServer"""
+        return f'AtmServer({self.engine!r}, pace={self.pace})'
+
+    async def __call(self, future):
+        """ Waits for an AccountEngine future without blocking the loop"""
+        return await asyncio.wrap_future(future)
+
+    async def __pause(self, factor=1):
+        """ Paces the session without blocking other sessions"""
+        if self.pace:
+            await asyncio.sleep(self.pace * factor)
+
+    async def handle_session(self, reader, writer):
+        """ Runs one ATM session on a client connection"""
+
+        async def send(text):
+            writer.write((text + '\n').encode())
+            await writer.drain()
+
+        async def ask(text):
+            writer.write((text + '\n' + PROMPT).encode())
+            await writer.drain()
+            line = await reader.readline()
+            if not line:
+                raise ConnectionResetError
+            return line.decode().rstrip('\r\n')
+
+        try:
+            await send('\n\t\t \U0001F4B5\U0001F4B5\U0001F4B5 Welcome to ATM '
+                       'at 521 Commonwealth Ave \U0001F4B5\U0001F4B5\U0001F4B5 ')
+
+            # Ask for user's name and generate accounts
+            name_str = await ask('\nTo start, enter your first and last name '
+                                 'to create Checking and Savings accounts: ')
+            while not valid_name(name_str):
+                name_str = await ask('Please enter a valid name as prompted! '
+                                     'Try again..')
+
+            await send('Thanks! Please wait.. Creating and loading '
+                       'accounts...')
+            name_str = name_str.strip().title()
+            chk_acc, sav_acc = await asyncio.gather(
+                self.__call(self.engine.create_account(
+                    CheckingAccount, name_str, random_balance(1000, 5000))),
+                self.__call(self.engine.create_account(
+                    SavingsAccount, name_str, random_balance(5000, 100000))))
+
+            await send(f'\nCongratulations {name_str.split()[0]}! Your '
+                       f'accounts have been created!\n')
+            await send(f'Account owner: {name_str} \n+{DASHES_STR}+')
+            await send(f'{chk_acc}\n\n{sav_acc}\n+{DASHES_STR}+')
+            statements = StatementRenderer()
+
+            # Ask which account before providing ATM options
+            while True:
+                acc_choice = await ask('\nWhich account do you want to use '
+                                       'for this session?\n1: Checking\n'
+                                       '2: Savings \n3: Transfer Between '
+                                       'Accounts\n4: Exit ATM')
+                if acc_choice in ('1', '2'):
+                    acc_type = chk_acc if acc_choice == '1' else sav_acc
+                    await send(f'\n{DASHES_STR} \n{acc_type}')
+                    await self.__atm_session(acc_type, statements, send,
+                                             ask)
+                elif acc_choice == '3':
+                    await self.__transfer_session(chk_acc, sav_acc, send, ask)
+                elif acc_choice == '4':
+                    await send('\n\t\U0001F4B5\U0001F4B5 Thanks for using ATM '
+                               'at 521 Commonwealth Ave! '
+                               '\U0001F4B5\U0001F4B5\n')
+                    self.sessions_served += 1
+                    break
+                else:
+                    await send("Not a valid input! Try again..")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # Client went away mid-session
+            pass
+        finally:
+            writer.close()
+
+    async def __atm_session(self, acc_type, statements, send, ask):
+        """ ATM options for one account - the asyncio twin of
+        bank_acc_mgr.atm_func. statements keeps the rendered mini statements
+        of the session"""
+
+        orig_bal = acc_type.balance
+        while True:
+            input_str = await ask(f'\n{DASHES_STR}\n\nChoose from the '
+                                  f'following options: '
+                                  f'\n{SORTED_OPTIONS_STR} ')
+            if input_str not in OPT_DICT:
+                await send("That's not a valid input! Try again.")
+                continue
+            opt_str = OPT_DICT[input_str]
+            sp_index = opt_str.index(' ')
+            await send(f'{opt_str[:sp_index]}ing{opt_str[sp_index:]}...\n')
+
+            if input_str in ('1', '2'):
+                # Withdrawal or deposit
+                action = 'withdrawn' if input_str == '1' else 'deposited'
+                try:
+                    amt = Money.of(await ask(f'Enter the amount to be '
+                                             f'{action}: '))
+                except ValueError:
+                    await send('Not a valid input! Please enter only numbers.')
+                    continue
+                if input_str == '1':
+                    await send(await self.__call(
+                        self.engine.withdraw(acc_type, amt)))
+                else:
+                    await send(await self.__call(
+                        self.engine.deposit(acc_type, amt)))
+                await self.__pause()
+
+            elif input_str == '3':
+                # Check balance
+                await send(str(acc_type))
+                await self.__pause()
+
+            elif input_str == '4':
+                # Mini Statement
+                stmt_table = statements.render(acc_type, await self.__call(
+                    self.engine.mini_statement(acc_type)))
+                if stmt_table:
+                    await send(f'{acc_type}\nAccount Owner:'
+                               f' {acc_type.owner}\nStatement Printed Time: '
+                               f'{time.asctime()}\n\n{"-" * 77}')
+                    await send(stmt_table)
+                    await send(f'\nBalance at account creation was: '
+                               f'{orig_bal}')
+                else:
+                    await send(f'{DASHES_STR} \nNo activity since account '
+                               f'creation.')
+                await self.__pause(2)
+
+            else:
+                # Exit from current account session
+                await send(f'Exiting from {acc_type}')
+                await self.__pause(2)
+                return
+
+    async def __transfer_session(self, chk_acc, sav_acc, send, ask):
+        """ Transfer between the two accounts - the asyncio twin of
+        bank_acc_mgr.transfer_func"""
+
+        direction = await ask('\nTransfer from\n1: Checking to Savings\n'
+                              '2: Savings to Checking')
+        if direction not in ('1', '2'):
+            await send('Not a valid input! Try again..')
+            return
+        src, dst = (chk_acc, sav_acc) if direction == '1' else \
+            (sav_acc, chk_acc)
+        try:
+            amt = Money.of(await ask('Enter the amount to be '
+                                     'transferred: '))
+        except ValueError:
+            await send('Not a valid input! Please enter only numbers.')
+            return
+        await send(await self.__call(self.engine.transfer(src, dst, amt)))
+        await send(f'\n{chk_acc}\n\n{sav_acc}')
+        await self.__pause()
+
+    async def start_tcp(self, host='127.0.0.1', port=0):
+        """ Starts serving on a TCP port, returns the asyncio server"""
+        return await asyncio.start_server(self.handle_session, host, port,
+                                          backlog=BACKLOG)
+
+    async def start_unix(self, path):
+        """ Starts serving on a Unix socket, returns the asyncio server"""
+        return await asyncio.start_unix_server(self.handle_session, path,
+                                               backlog=BACKLOG)
+
+    def close(self):
+        """ Closes the AccountEngine"""
+        self.engine.close()
+
+
+async def dump_metrics(path):
+    """ Rewrites the metrics file every METRICS_INTERVAL seconds"""
+    while True:
+        await asyncio.sleep(METRICS_INTERVAL)
+        Metrics.dump(path)
+
+
+async def main(args):
+    """ Runs the server until interrupted"""
+
+    if args.profile_ops:
+        Profiling.enable(args.profile_ops)
+    if args.metrics:
+        Metrics.enable()
+        dumper = asyncio.create_task(dump_metrics(args.metrics))
+    atm_server = AtmServer(args.db, args.profile, args.pace, args.workers)
+    if args.unix:
+        server = await atm_server.start_unix(args.unix)
+    else:
+        server = await atm_server.start_tcp(args.host, args.port)
+    print('Serving ATM sessions on', ', '.join(
+        str(sock.getsockname()) for sock in server.sockets))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        atm_server.close()
+        if args.metrics:
+            dumper.cancel()
+            Metrics.dump(args.metrics)
+
+
+# Unit Tests - run with no arguments; the server is started with --serve
+if __name__ == '__main__' and len(sys.argv) == 1:
+    import os
+    import tempfile
+
+    async def run_client(port, lines, hang_up=False):
+        """ Sends a client's answers ahead of the prompts and returns all the
+        server sent until it closed the connection"""
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(''.join(line + '\n' for line in lines).encode())
+        if hang_up:
+            writer.write_eof()
+        output = await asyncio.wait_for(reader.read(), 30)
+        writer.close()
+        return output.decode()
+
+    # Withdraw, deposit, bad amounts, balance, statement and a transfer
+    SESSION_LINES = ['', '!!!', 'jane doe', '1', '2', 'abc', '2', '1e30',
+                     '2', '9' * 30, '2', '50', '1', '20.5', '2',
+                     '92233720368547758.07', '3', '4', '9', '5', '3', '1',
+                     'abc', '3', '1', '10', '7', '4']
+
+    async def test_server(db_path):
+        """ Runs sessions against a server on an ephemeral port"""
+        atm_server = AtmServer(db_path, max_workers=2)
+        server = await atm_server.start_tcp(port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            output = await run_client(port, SESSION_LINES)
+            assert output.count('Please enter a valid name') == 2, \
+                "Bad names were accepted"
+            assert 'Congratulations Jane! Your accounts have been created!' \
+                in output, "Accounts were not created"
+            assert output.count('Please enter only numbers.') == 4, \
+                "Bad amounts were not refused"
+            assert 'Deposit of $50.00 accepted!' in output, \
+                "Deposit failed"
+            assert 'Withdrawn $20.50.' in output, "Withdrawal failed"
+            assert 'Balance cannot exceed $92,233,720,368,547,758.07!' in \
+                output, "Balance above the largest amount was not refused"
+            assert "That's not a valid input! Try again." in output, \
+                "Bad option was accepted"
+            assert 'No activity since account creation.' not in output, \
+                "Statement is missing the session's transactions"
+            assert 'Thanks for using ATM' in output, "Session did not end"
+            assert atm_server.sessions_served == 1, "Session was not counted"
+
+            # A client that hangs up mid-session ends only its own session
+            output = await run_client(port, ['john roe', '1', '2'],
+                                      hang_up=True)
+            assert 'Congratulations John!' in output, \
+                "Accounts were not created"
+            assert atm_server.sessions_served == 1, \
+                "Unfinished session was counted"
+
+            # The server still serves sessions, several at once
+            outputs = await asyncio.gather(*(
+                run_client(port, SESSION_LINES) for _ in range(4)))
+            assert all('Thanks for using ATM' in output
+                       for output in outputs), "Sessions did not end"
+            assert atm_server.sessions_served == 5, \
+                "Sessions were not counted"
+        finally:
+            server.close()
+            await server.wait_closed()
+            atm_server.close()
+
+    with tempfile.TemporaryDirectory() as test_dir:
+        asyncio.run(test_server(os.path.join(test_dir, 'atm_test.db')))
+
+    print("\nAll AtmServer unit tests passed!")
+
+if __name__ == '__main__' and len(sys.argv) > 1:
+    parser = argparse.ArgumentParser(description='asyncio ATM session server')
+    parser.add_argument('--serve', action='store_true', required=True,
+                        help='serve ATM sessions (without it the unit tests '
+                             'run)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5210)
+    parser.add_argument('--unix', help='serve on this Unix socket instead')
+    parser.add_argument('--pace', type=float, default=0,
+                        help='seconds to pause after each operation')
+    parser.add_argument('--db', default=DEFAULT_DB)
+    parser.add_argument('--profile', default=DEFAULT_PROFILE)
+    parser.add_argument('--workers', type=int, default=8,
+                        help='AccountEngine threads')
+    parser.add_argument('--metrics',
+                        help='record metrics and dump them to this file '
+                             '(JSON if it ends in .json)')
+    parser.add_argument('--profile-ops', metavar='DIR',
+                        help='profile the slowest account operations and '
+                             'dump them to this directory on shutdown')
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,424 @@
+"""
+Term Project - Bank Account Manager (ATM Style)
+
+This file contains the BalanceCache class - a write-behind cache of account
+balances, backed by an append-only journal file.
+
+Deposits and withdrawals are checked against the balance kept in memory,
+appended to the journal and acknowledged straight away, without waiting for
+a database commit. A background thread writes the journaled transactions to
+the ledger database in batches. If the process stops before they get there,
+they are replayed from the journal the next time a BalanceCache opens it.
+
+Ensure to call BalanceCache.close if instantiated!
+"""
+import os
+import time
+import threading
+import sqlite3
+
+from LedgerStore import LedgerStore, DEFAULT_DB, DEFAULT_PROFILE
+from TransIdGenerator import next_id, generator_for
+
+# Seconds between writes of the journaled transactions to the ledger, and the
+# number of waiting transactions that starts a write sooner
+FLUSH_INTERVAL = 0.05
+FLUSH_SIZE = 5000
+
+# Durability window - seconds between fsyncs of the journal. With 0 every
+# transaction is synced before it is acknowledged; with None syncing is left
+# to the OS, so the journal survives a crash of the process but not
+# necessarily one of the machine
+SYNC_INTERVAL = 0.01
+
+# Size after which the journal is emptied, once all of it is on the ledger
+JOURNAL_MAX_BYTES = 64 * 1024 * 1024
+
+
+def encode_entry(row):
+    """ Function that turns an (account_id, trans_id, ts, remark, amount,
+    balance) transaction row into a journal line"""
+    return '\t'.join(map(str, row)) + '\n'
+
+
+def decode_entry(line):
+    """ Function that turns a journal line back into a transaction row"""
+
+    account_id, trans_id, ts, remark, amount, balance = \
+        line.rstrip('\n').split('\t')
+    return account_id, int(trans_id), int(ts), remark, int(amount), \
+        int(balance)
+
+
+class BalanceCache():
+    """ Balance Cache class - keeps the balances of the accounts it serves in
+    memory, journals every deposit and withdrawal to an append-only file and
+    writes them to the ledger database behind the caller's back.
+
+    The balance in the cache is the authoritative one; the ledger catches up
+    within flush_interval seconds. flush() writes everything to the ledger at
+    once, e.g. before reading a statement.
+
+    Concurrency Note: Thread-safe - one lock guards the balances and the
+    journal, so the journal holds every account's transactions in the order
+    they were made. While a cache is open it owns the accounts it serves:
+    their deposits and withdrawals must all go through it, and only one
+    cache may use a journal at a time.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB, journal_path=None,
+                 profile=DEFAULT_PROFILE, sync_interval=SYNC_INTERVAL,
+                 flush_interval=FLUSH_INTERVAL, flush_size=FLUSH_SIZE):
+        """Constructor opens the ledger database and the journal (by default
+        the database path with '.journal' appended), replays what a cache
+        that did not close left in the journal and starts the thread that
+        writes to the ledger. recovered holds the number of transactions
+        replayed"""
+
+        self.db_path = db_path
+        self.journal_path = journal_path or db_path + '.journal'
+        self.profile = profile
+        self.sync_interval = sync_interval
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+
+        self.__store = LedgerStore(db_path, profile, check_same_thread=False)
+        # The flusher keeps write transactions open on the ledger, so the
+        # transaction id node is claimed now rather than on the first id
+        generator_for(db_path).claim_node(self.__store)
+        self.recovered = self.__recover()
+        self.__fd = os.open(self.journal_path,
+                            os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+
+        self.__balances = {}
+        # Journaled transactions not written to the ledger yet
+        self.__pending = []
+        # Whether the background thread is writing a batch taken from them
+        self.__in_flight = False
+        self.__unsynced = False
+        self.__closed = False
+        self.__lock = threading.Lock()
+        self.__wake = threading.Condition(self.__lock)
+        self.__landed = threading.Condition(self.__lock)
+        self.__thread = threading.Thread(target=self.__run,
+                                         name='BalanceCache', daemon=True)
+        self.__thread.start()
+
+    def __repr__(self):
+        """ Representation of BalanceCache"""
+        return f'BalanceCache({self.db_path!r}, {self.journal_path!r})'
+
+    def __enter__(self):
+        """ Lets the cache be used in a with block"""
+        return self
+
+    def __exit__(self, *exc_info):
+        """ Closes the cache at the end of the with block"""
+        self.close()
+
+    def __recover(self):
+        """ Replays the journal onto the ledger and empties it, returns the
+        number of transactions replayed"""
+
+        try:
+            with open(self.journal_path, 'rb') as journal:
+                data = journal.read()
+        except FileNotFoundError:
+            return 0
+
+        # A crash in the middle of an append leaves its line without the
+        # newline - that transaction was never acknowledged
+        data = data[:data.rfind(b'\n') + 1]
+        rows = [decode_entry(line) for line in data.decode().splitlines()]
+        if rows:
+            self.__store.replay_transactions(rows)
+        # The journal is only emptied once the ledger is safely on disk;
+        # if it is kept, replaying it again later does no harm
+        os.truncate(self.journal_path,
+                    0 if self.__store.checkpoint() else len(data))
+        return len(rows)
+
+    def __cached(self, account_id):
+        """ Returns the balance of an account, loading it from the ledger on
+        first use - called with the lock held"""
+
+        cents = self.__balances.get(account_id)
+        if cents is None:
+            acc_row = self.__store.load_account(account_id)
+            if acc_row is None:
+                raise KeyError(f'No account {account_id} in {self.db_path}')
+            cents = self.__balances[account_id] = acc_row[1]
+        return cents
+
+    def __journal(self, rows):
+        """ Appends transaction rows to the journal and queues them for the
+        ledger - called with the lock held"""
+
+        if self.__closed:
+            raise ValueError('BalanceCache is closed')
+        os.write(self.__fd, ''.join(map(encode_entry, rows)).encode())
+        if self.sync_interval == 0:
+            os.fsync(self.__fd)
+        elif self.sync_interval is not None:
+            self.__unsynced = True
+        self.__pending.extend(rows)
+        if len(self.__pending) >= self.flush_size:
+            self.__wake.notify()
+
+    def balance(self, account_id):
+        """ Returns the balance of an account in cents. Raises KeyError if
+        there is no such account on the ledger"""
+        with self.__lock:
+            return self.__cached(account_id)
+
+    def deposit(self, account_id, amount):
+        """ Deposits amount cents into an account, returns the new balance in
+        cents - None if amount is not positive"""
+        if amount <= 0:
+            return None
+        return self.__post(account_id, 'Credit', amount)
+
+    def withdraw(self, account_id, amount):
+        """ Withdraws amount cents from an account, returns the new balance in
+        cents - None if amount is not positive or more than the balance"""
+        if amount <= 0:
+            return None
+        return self.__post(account_id, 'Debit', -amount)
+
+    def __post(self, account_id, remark, amount):
+        """ Checks a signed amount against the balance, journals it and
+        updates the balance"""
+
+        with self.__lock:
+            cents = self.__cached(account_id) + amount
+            if cents < 0:
+                return None
+            self.__journal([(account_id, next_id(self.db_path),
+                             int(time.time()), remark, amount, cents)])
+            self.__balances[account_id] = cents
+            return cents
+
+    def post_transactions(self, account_id, rows):
+        """ Journals (trans_id, timestamp, remark, amount, running balance)
+        transaction rows of an account and moves its balance by their
+        amounts, the way LedgerStore.post_transactions writes them - so that
+        Account objects can post through the cache, e.g. acc.deposit(5,
+        cache). Returns the new balance and the rows as journaled"""
+
+        rows = [tuple(row) for row in rows]
+        with self.__lock:
+            balance = self.__cached(account_id) + sum(row[3] for row in rows)
+            shift = balance - rows[-1][4]
+            if shift:
+                rows = [row[:4] + (row[4] + shift,) for row in rows]
+            self.__journal([(account_id,) + row for row in rows])
+            self.__balances[account_id] = balance
+            return balance, rows
+
+    def flush(self):
+        """ Writes every journaled transaction to the ledger now. A batch
+        the background thread is writing is waited for, so everything
+        acknowledged so far is on the ledger when flush returns"""
+
+        with self.__lock:
+            while self.__in_flight:
+                self.__landed.wait()
+            rows, self.__pending = self.__pending, []
+            try:
+                self.__store.replay_transactions(rows)
+            except sqlite3.Error:
+                self.__pending[:0] = rows
+                raise
+
+    def __run(self):
+        """ Background thread - syncs the journal every sync_interval and
+        writes it to the ledger every flush_interval, or as soon as
+        flush_size transactions are waiting"""
+
+        store = LedgerStore(self.db_path, self.profile)
+        tick = min(self.flush_interval, self.sync_interval or
+                   self.flush_interval)
+        last_flush = time.monotonic()
+        try:
+            while True:
+                with self.__lock:
+                    if not self.__closed and \
+                            len(self.__pending) < self.flush_size:
+                        self.__wake.wait(tick)
+                    if self.__closed:
+                        return
+                    unsynced, self.__unsynced = self.__unsynced, False
+                    rows = []
+                    if len(self.__pending) >= self.flush_size or \
+                            time.monotonic() - last_flush >= \
+                            self.flush_interval:
+                        rows, self.__pending = self.__pending, []
+                        self.__in_flight = bool(rows)
+
+                if unsynced:
+                    os.fsync(self.__fd)
+                if rows:
+                    last_flush = time.monotonic()
+                    written = False
+                    try:
+                        store.replay_transactions(rows)
+                        written = True
+                    except sqlite3.Error:
+                        pass
+                    finally:
+                        with self.__lock:
+                            if not written:
+                                # Still in the journal - try again next time
+                                self.__pending[:0] = rows
+                            self.__in_flight = False
+                            self.__landed.notify_all()
+                if os.fstat(self.__fd).st_size > JOURNAL_MAX_BYTES:
+                    self.__rotate(store)
+        finally:
+            store.close()
+
+    def __rotate(self, store):
+        """ Empties the journal once everything in it is on the ledger and
+        the ledger is on disk. Holds the lock throughout, so deposits and
+        withdrawals wait for one batch write"""
+
+        with self.__lock:
+            rows, self.__pending = self.__pending, []
+            try:
+                store.replay_transactions(rows)
+            except sqlite3.Error:
+                self.__pending[:0] = rows
+                return
+            if store.checkpoint():
+                os.ftruncate(self.__fd, 0)
+
+    def close(self):
+        """ Stops the background thread, writes the remaining transactions
+        to the ledger and empties the journal, then closes both"""
+
+        with self.__lock:
+            if self.__closed:
+                return
+            self.__closed = True
+            self.__wake.notify()
+        self.__thread.join()
+
+        self.flush()
+        os.fsync(self.__fd)
+        if self.__store.checkpoint():
+            os.ftruncate(self.__fd, 0)
+        os.close(self.__fd)
+        self.__store.close()
+
+
+# Unit Tests
+if __name__ == '__main__':
+    import tempfile
+    from CheckingAccount import CheckingAccount
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, 'test_ledger.db')
+        journal_file = db_file + '.journal'
+        store = LedgerStore(db_file)
+        # The account number is claimed, so Account objects get other ones
+        assert store.claim_acc_nums(1) == 100001, "Wrong account number"
+        store.create_account('CHK_100001', 'John Doe', 10000)
+        store.create_account('SAV_100001', 'Jane Doe', 0)
+
+        # Balances are answered from memory, the ledger catches up on flush
+        cache = BalanceCache(db_file, flush_interval=60)
+        assert cache.recovered == 0, "Nothing should have been replayed"
+        assert cache.deposit('CHK_100001', 2500) == 12500 and \
+            cache.withdraw('CHK_100001', 500) == 12000, \
+            "Deposit or withdrawal was not applied"
+        assert cache.withdraw('CHK_100001', 12001) is None and \
+            cache.deposit('CHK_100001', 0) is None and \
+            cache.withdraw('CHK_100001', -5) is None, \
+            "Overdraft or invalid amount was accepted"
+        try:
+            cache.balance('CHK_999999')
+        except KeyError:
+            pass
+        else:
+            raise AssertionError("Unknown account should raise KeyError")
+        assert store.load_account('CHK_100001')[1] == 10000, \
+            "Ledger should only be written in the background"
+        with open(journal_file) as journal:
+            assert [decode_entry(line)[3:] for line in journal] == \
+                [('Credit', 2500, 12500), ('Debit', -500, 12000)], \
+                "Transactions were not journaled in order"
+        cache.flush()
+        assert store.load_account('CHK_100001')[1] == 12000 and \
+            [row[2:] for row in store.latest_transactions('CHK_100001')] == \
+            [('Debit', -500, 12000), ('Credit', 2500, 12500)], \
+            "Flush did not write the journaled transactions"
+
+        # A cache that never closes is recovered from its journal, without
+        # the line a crash cut short
+        for _ in range(10):
+            cache.deposit('SAV_100001', 100)
+        cache.withdraw('CHK_100001', 2000)
+        with open(journal_file, 'a') as journal:
+            journal.write('SAV_100001\t99\t1618740000\tCre')
+        cache = BalanceCache(db_file, flush_interval=60)
+        assert cache.recovered == 13, "Journal was not replayed in full"
+        assert store.load_account('SAV_100001')[1] == 1000 and \
+            store.load_account('CHK_100001')[1] == 10000 and \
+            cache.balance('SAV_100001') == 1000, \
+            "Balances were not recovered"
+        assert os.path.getsize(journal_file) == 0, \
+            "Journal was not emptied after recovery"
+        cache.close()
+        with BalanceCache(db_file) as cache:
+            assert cache.recovered == 0, \
+                "Replayed transactions should not be replayed again"
+
+        # Writes reach the ledger in the background, and Account objects
+        # can post through the cache
+        acc = CheckingAccount('Jim Doe', 50, db_file)
+        with BalanceCache(db_file, flush_interval=0.01, sync_interval=0,
+                          flush_size=4) as cache:
+            for _ in range(10):
+                cache.deposit('SAV_100001', 10)
+            acc.deposit(5, cache)
+            acc.withdraw(20, cache)
+            assert cache.balance(acc.tb_name) == acc.cents == 3500, \
+                "Account posting through the cache is out of step"
+            deadline = time.monotonic() + 5
+            while store.load_account('SAV_100001')[1] != 1100 and \
+                    time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert store.load_account('SAV_100001')[1] == 1100, \
+                "Background thread did not write to the ledger"
+        assert store.load_account(acc.tb_name)[1] == 3500 and \
+            acc.mini_statement()[1][2:] == ['Debit', -2000, 3500], \
+            "Closing the cache did not write everything to the ledger"
+        assert os.path.getsize(journal_file) == 0, \
+            "Journal was not emptied on close"
+        try:
+            cache.deposit('SAV_100001', 10)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Closed cache should not take deposits")
+        acc.close_db_connection()
+
+        # Flush waits for a batch the background thread is still writing -
+        # here one held up by another connection's write transaction
+        blocker = LedgerStore(db_file, check_same_thread=False)
+        with BalanceCache(db_file, flush_interval=0.01,
+                          flush_size=1) as cache:
+            blocker.cur.execute('BEGIN IMMEDIATE')
+            cache.deposit('SAV_100001', 10)
+            time.sleep(0.2)
+            release = threading.Timer(0.3, blocker.conn.rollback)
+            release.start()
+            cache.flush()
+            assert store.load_account('SAV_100001')[1] == 1110, \
+                "Flush returned before the background batch was written"
+            release.join()
+        blocker.close()
+        store.close()
+
+    # All tests passed!
+    print("\nAll BalanceCache unit tests passed!")
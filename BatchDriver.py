@@ -0,0 +1,419 @@
+"""
+Term Project - Bank Account Manager (ATM Style)
+
+This file contains the BatchDriver class - a headless driver that runs a
+workload of scripted ATM sessions against the account classes, the way
+bank_acc_mgr runs them but without prompts or pauses, and reports the
+throughput and the latency of every kind of operation.
+
+A workload is a JSON Lines file with one session per line:
+    {"name": "Jane Doe", "checking": 1200.5, "savings": 8000,
+     "ops": [["deposit", "checking", 50], ["withdraw", "savings", 20.5],
+             ["balance", "checking"], ["statement", "savings"],
+             ["transfer", "checking", 10]]}
+- name is checked the way the ATM checks it; sessions with a name the ATM
+  would refuse are counted and skipped
+- checking and savings are the opening balances in dollars, random in the
+  ATM's ranges if left out
+- ops run in order, each on the account it names. transfer moves the
+  amount from that account to the other one
+
+Sessions can be spread over several processes, each with its own ledger
+connection. generate_workload writes a random workload to replay.
+
+Usage: python BatchDriver.py WORKLOAD [--db PATH] [--profile NAME]
+           [--processes N] [--output FILE]
+       python BatchDriver.py WORKLOAD --generate SESSIONS [--ops N]
+           [--seed N]
+       python BatchDriver.py            (runs the unit tests)
+"""
+import sys
+import json
+import time
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from CheckingAccount import CheckingAccount
+from SavingsAccount import SavingsAccount
+from LedgerStore import LedgerStore, DEFAULT_DB, DEFAULT_PROFILE
+from Money import Money
+from MiniStatement import StatementRenderer
+from Helpers import valid_name, random_balance, percentile
+
+# Operations of a session, and how often generate_workload picks each
+OP_WEIGHTS = {'withdraw': 25, 'deposit': 25, 'balance': 20, 'statement': 20,
+              'transfer': 10}
+ACCOUNTS = ('checking', 'savings')
+
+# Sessions handed to a process at a time
+CHUNK_SESSIONS = 500
+
+
+def parse_amount(value, what):
+    """ Function that returns an amount of a session in dollars as Money,
+    raising ValueError if it is not a number of dollars"""
+
+    # Whole dollars are ints; JSON true and false are not amounts
+    if type(value) is bool or not isinstance(value, (int, Money)):
+        raise ValueError(f'{what} is not an amount: {value!r}')
+    return Money.of(value)
+
+
+def parse_session(line, line_no):
+    """ Function that reads one session of a workload, raising ValueError
+    with the line number if it is malformed"""
+
+    try:
+        # Amounts with decimals are read straight into Money, not floats
+        session = json.loads(line, parse_float=Money.of)
+        if not isinstance(session, dict):
+            raise ValueError(f'session is not an object: {session!r}')
+        if not isinstance(session['name'], str):
+            raise ValueError(f'name is not text: {session["name"]!r}')
+        for acc_name in ACCOUNTS:
+            if acc_name in session:
+                session[acc_name] = parse_amount(session[acc_name], acc_name)
+        if not isinstance(session['ops'], list):
+            raise ValueError(f'ops is not a list: {session["ops"]!r}')
+        for op in session['ops']:
+            if not isinstance(op, list) or len(op) < 2 or \
+                    not isinstance(op[0], str) or op[0] not in OP_WEIGHTS or \
+                    op[1] not in ACCOUNTS or \
+                    len(op) != (2 if op[0] in ('balance', 'statement')
+                                else 3):
+                raise ValueError(f'bad operation {op!r}')
+            if len(op) == 3:
+                op[2] = parse_amount(op[2], op[0])
+    except KeyError as exc:
+        raise ValueError(f'Line {line_no} of the workload: no {exc.args[0]}'
+                         ) from None
+    except (ValueError, TypeError, IndexError) as exc:
+        raise ValueError(f'Line {line_no} of the workload: {exc}') from None
+    return session
+
+
+def run_sessions(db_path, profile, lines):
+    """ Function that runs the sessions of (line number, line) pairs on one
+    ledger connection. Returns the numbers of sessions run and skipped and
+    the latencies in seconds by operation - 'open' is creating the two
+    accounts"""
+
+    store = LedgerStore(db_path, profile)
+    num_run = num_skipped = 0
+    samples = {op: [] for op in ('open', *OP_WEIGHTS)}
+    clock = time.perf_counter
+    try:
+        for line_no, line in lines:
+            session = parse_session(line, line_no)
+            name_str = session['name']
+            if not valid_name(name_str):
+                num_skipped += 1
+                continue
+
+            # Accounts are created as bank_acc_mgr creates them
+            name_str = name_str.strip().title()
+            start = clock()
+            chk_bal = session['checking'] if 'checking' in session \
+                else random_balance(1000, 5000)
+            sav_bal = session['savings'] if 'savings' in session \
+                else random_balance(5000, 100000)
+            accs = {'checking': CheckingAccount(name_str, chk_bal,
+                                                store=store),
+                    'savings': SavingsAccount(name_str, sav_bal, store=store)}
+            samples['open'].append(clock() - start)
+            statements = StatementRenderer()
+
+            for op, acc_name, *amt in session['ops']:
+                acc = accs[acc_name]
+                start = clock()
+                if op == 'withdraw':
+                    acc.withdraw(amt[0])
+                elif op == 'deposit':
+                    acc.deposit(amt[0])
+                elif op == 'balance':
+                    str(acc)
+                elif op == 'statement':
+                    statements.render(acc)
+                else:
+                    other = accs['savings' if acc_name == 'checking'
+                                 else 'checking']
+                    acc.transfer(other, amt[0])
+                samples[op].append(clock() - start)
+            num_run += 1
+    finally:
+        store.close()
+    return num_run, num_skipped, samples
+
+
+def generate_workload(path, num_sessions, ops_per_session=10, seed=1):
+    """ Function that writes a random workload of num_sessions sessions with
+    ops_per_session operations each, picked by OP_WEIGHTS"""
+
+    rng = random.Random(seed)
+    ops, weights = zip(*OP_WEIGHTS.items())
+    with open(path, 'w') as workload_file:
+        for i in range(num_sessions):
+            session_ops = []
+            for op in rng.choices(ops, weights, k=ops_per_session):
+                session_op = [op, rng.choice(ACCOUNTS)]
+                if op not in ('balance', 'statement'):
+                    session_op.append(rng.randrange(100, 50000) / 100)
+                session_ops.append(session_op)
+            workload_file.write(json.dumps(
+                {'name': f'Batch User{i}',
+                 'checking': rng.randrange(100000, 500000) / 100,
+                 'savings': rng.randrange(500000, 10000000) / 100,
+                 'ops': session_ops}) + '\n')
+
+
+class BatchDriver():
+    """ Batch Driver class - runs workload files against a ledger database,
+    in this process or spread over a pool of processes, and reports on
+    them.
+
+    Concurrency Note: Every process has its own ledger connection and works
+    on the accounts of its own sessions only; SQLite serializes their
+    writes.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB, profile=DEFAULT_PROFILE,
+                 processes=1, chunk_sessions=CHUNK_SESSIONS):
+        """Constructor sets the ledger database and the number of processes
+        - 1 runs the sessions in this process"""
+
+        self.db_path = db_path
+        self.profile = profile
+        self.processes = processes
+        self.chunk_sessions = chunk_sessions
+
+    def __repr__(self):
+        """ Representation of BatchDriver"""
+        return f'BatchDriver({self.db_path!r}, processes={self.processes})'
+
+    def __chunks(self, workload_path):
+        """ Generator that yields the sessions of a workload file as lists of
+        (line number, line), chunk_sessions at a time"""
+
+        chunk = []
+        with open(workload_path) as workload_file:
+            for line_no, line in enumerate(workload_file, 1):
+                if line.strip():
+                    chunk.append((line_no, line))
+                if len(chunk) == self.chunk_sessions:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+    def __run_chunks(self, chunks):
+        """ Generator that runs chunks of sessions and yields their results.
+        With several processes at most two chunks per process are handed
+        out at a time, so a workload is never read into memory whole"""
+
+        if self.processes == 1:
+            for chunk in chunks:
+                yield run_sessions(self.db_path, self.profile, chunk)
+            return
+
+        with ProcessPoolExecutor(self.processes) as pool:
+            running = set()
+            for chunk in chunks:
+                if len(running) >= 2 * self.processes:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+                running.add(pool.submit(run_sessions, self.db_path,
+                                        self.profile, chunk))
+            for future in running:
+                yield future.result()
+
+    def run(self, workload_path):
+        """ Runs every session of a workload file and returns the report - a
+        dictionary of the sessions run and skipped, operations, seconds,
+        rates and, per operation, the count and p50/p99/p999/max latency in
+        microseconds"""
+
+        start = time.perf_counter()
+        num_run = num_skipped = 0
+        samples = {}
+        for chunk_run, chunk_skipped, chunk_samples in \
+                self.__run_chunks(self.__chunks(workload_path)):
+            num_run += chunk_run
+            num_skipped += chunk_skipped
+            for op, op_samples in chunk_samples.items():
+                samples.setdefault(op, []).extend(op_samples)
+        elapsed = time.perf_counter() - start
+
+        latency = {}
+        for op, op_samples in samples.items():
+            if op_samples:
+                op_samples.sort()
+                latency[op] = {'count': len(op_samples)}
+                for name, pct in (('p50_us', 50), ('p99_us', 99),
+                                  ('p999_us', 99.9), ('max_us', 100)):
+                    latency[op][name] = round(
+                        percentile(op_samples, pct) * 1e6, 1)
+        num_ops = sum(len(op_samples) for op, op_samples in samples.items()
+                      if op != 'open')
+        return {'processes': self.processes, 'sessions': num_run,
+                'skipped_sessions': num_skipped, 'operations': num_ops,
+                'seconds': round(elapsed, 3),
+                'sessions_per_s': round(num_run / elapsed, 1),
+                'ops_per_s': round(num_ops / elapsed, 1),
+                'latency': latency}
+
+
+def print_report(report):
+    """ Function that prints a report of BatchDriver.run"""
+
+    print(f'{report["sessions"]:,} sessions ({report["skipped_sessions"]:,} '
+          f'skipped), {report["operations"]:,} operations in '
+          f'{report["seconds"]:,.2f}s on {report["processes"]} '
+          f'process(es): {report["sessions_per_s"]:,.0f} sessions/s, '
+          f'{report["ops_per_s"]:,.0f} ops/s')
+    print(f'{"Operation":<12}{"Count":>10}{"p50 (us)":>10}{"p99 (us)":>10}'
+          f'{"p999 (us)":>11}{"max (us)":>11}')
+    for op, op_latency in report['latency'].items():
+        print(f'{op:<12}{op_latency["count"]:>10,}'
+              f'{op_latency["p50_us"]:>10,.1f}{op_latency["p99_us"]:>10,.1f}'
+              f'{op_latency["p999_us"]:>11,.1f}'
+              f'{op_latency["max_us"]:>11,.1f}')
+
+
+# Unit Tests - run with no arguments
+if __name__ == '__main__' and len(sys.argv) == 1:
+    import os
+    import tempfile
+
+    # Sessions are read with amounts as Money
+    session = parse_session('{"name": "Jane Doe", "checking": 1200.5, '
+                            '"ops": [["deposit", "checking", 50], '
+                            '["withdraw", "savings", 20.5], '
+                            '["balance", "checking"]]}', 1)
+    assert session['name'] == 'Jane Doe', "Name was not read"
+    assert session['checking'] == Money(120050), "Opening balance wrong"
+    assert 'savings' not in session, "Savings balance was made up"
+    assert session['ops'] == [['deposit', 'checking', Money(5000)],
+                              ['withdraw', 'savings', Money(2050)],
+                              ['balance', 'checking']], "Operations wrong"
+
+    # Malformed sessions raise ValueError naming their line
+    bad_lines = [
+        'not json',
+        '[1, 2]',
+        '{"ops": []}',
+        '{"name": "Jane Doe"}',
+        '{"name": 5, "ops": []}',
+        '{"name": ["Jane"], "ops": []}',
+        '{"name": "Jane Doe", "ops": 5}',
+        '{"name": "Jane Doe", "checking": "100", "ops": []}',
+        '{"name": "Jane Doe", "savings": 1e300, "ops": []}',
+        '{"name": "Jane Doe", "checking": NaN, "ops": []}',
+        '{"name": "Jane Doe", "ops": [5]}',
+        '{"name": "Jane Doe", "ops": [["deposit"]]}',
+        '{"name": "Jane Doe", "ops": [["fly", "checking", 5]]}',
+        '{"name": "Jane Doe", "ops": [[["deposit"], "checking", 5]]}',
+        '{"name": "Jane Doe", "ops": [["deposit", "loan", 5]]}',
+        '{"name": "Jane Doe", "ops": [["deposit", "checking"]]}',
+        '{"name": "Jane Doe", "ops": [["balance", "checking", 5]]}',
+        '{"name": "Jane Doe", "ops": [["deposit", "checking", true]]}',
+        '{"name": "Jane Doe", "ops": [["deposit", "checking", "5"]]}',
+        '{"name": "Jane Doe", "ops": [["deposit", "checking", 1e30]]}',
+        '{"name": "Jane Doe", "ops": [["withdraw", "checking", ' +
+        '9' * 30 + ']]}']
+    for bad_line in bad_lines:
+        try:
+            parse_session(bad_line, 7)
+        except ValueError as exc:
+            assert str(exc).startswith('Line 7 of the workload: '), \
+                f"Error does not name the line: {exc}"
+        else:
+            raise AssertionError(f"Malformed session was read: {bad_line}")
+
+    with tempfile.TemporaryDirectory() as test_dir:
+        # The same seed writes the same workload, of valid sessions
+        paths = [os.path.join(test_dir, f'workload{i}.jsonl')
+                 for i in range(3)]
+        generate_workload(paths[0], 20, ops_per_session=5, seed=3)
+        generate_workload(paths[1], 20, ops_per_session=5, seed=3)
+        generate_workload(paths[2], 20, ops_per_session=5, seed=4)
+        with open(paths[0]) as workload_file:
+            lines = workload_file.readlines()
+        with open(paths[1]) as workload_file:
+            assert workload_file.readlines() == lines, \
+                "Same seed wrote different workloads"
+        with open(paths[2]) as workload_file:
+            assert workload_file.readlines() != lines, \
+                "Different seeds wrote the same workload"
+        assert len(lines) == 20, "Wrong number of sessions written"
+        for line_no, line in enumerate(lines, 1):
+            assert len(parse_session(line, line_no)['ops']) == 5, \
+                "Wrong number of operations written"
+
+        # Round trip: sessions with a name the ATM refuses are skipped
+        with open(paths[0], 'a') as workload_file:
+            workload_file.write(json.dumps({'name': 'Jane Doe !', 'ops': [
+                ['deposit', 'checking', 5]]}) + '\n\n')
+        db_path = os.path.join(test_dir, 'batch_test.db')
+        for processes in (1, 2):
+            report = BatchDriver(db_path, processes=processes,
+                                 chunk_sessions=8).run(paths[0])
+            assert report['processes'] == processes, "Processes not reported"
+            assert report['sessions'] == 20, "Not every session was run"
+            assert report['skipped_sessions'] == 1, "Bad name was not skipped"
+            assert report['operations'] == 100, "Operations were lost"
+            assert report['latency']['open']['count'] == 20, \
+                "Accounts opened were not timed"
+            assert sum(op_latency['count'] for op, op_latency in
+                       report['latency'].items() if op != 'open') == 100, \
+                "Operations were not timed"
+            for op_latency in report['latency'].values():
+                assert op_latency['p50_us'] <= op_latency['p99_us'] <= \
+                    op_latency['p999_us'] <= op_latency['max_us'], \
+                    "Latency percentiles out of order"
+
+        # A malformed session stops the run with its line number
+        with open(paths[0], 'a') as workload_file:
+            workload_file.write('{"name": 5, "ops": []}\n')
+        try:
+            BatchDriver(db_path).run(paths[0])
+        except ValueError as exc:
+            assert str(exc).startswith('Line 23 of the workload: '), \
+                f"Error names the wrong line: {exc}"
+        else:
+            raise AssertionError("Malformed workload was run")
+
+    print("\nAll BatchDriver unit tests passed!")
+
+if __name__ == '__main__' and len(sys.argv) > 1:
+    parser = argparse.ArgumentParser(
+        description='Headless ATM driver - runs a JSON Lines workload of '
+                    'sessions against the account classes')
+    parser.add_argument('workload', help='workload file (JSON Lines)')
+    parser.add_argument('--db', default=DEFAULT_DB)
+    parser.add_argument('--profile', default=DEFAULT_PROFILE)
+    parser.add_argument('--processes', type=int, default=1,
+                        help='processes to spread the sessions over')
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--generate', type=int, metavar='SESSIONS',
+                        help='write a random workload of this many sessions '
+                             'instead of running one')
+    parser.add_argument('--ops', type=int, default=10,
+                        help='operations per generated session')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='seed of the generated workload')
+    args = parser.parse_args()
+
+    if args.generate:
+        generate_workload(args.workload, args.generate, args.ops, args.seed)
+        sys.exit()
+    try:
+        report = BatchDriver(args.db, args.profile, args.processes).run(
+            args.workload)
+    except ValueError as exc:
+        sys.exit(str(exc))
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as out_file:
+            json.dump(report, out_file, indent=2)
@@ -0,0 +1,52 @@
+"""
+Term Project - Bank Account Manager (ATM Style)
+
+This file contains the small helpers shared by the ATM front ends, the batch
+driver and the benchmarks: checking a customer name, drawing a random
+opening balance and taking a percentile of latency samples.
+
+It is imported before the first prompt of bank_acc_mgr, so re and random
+are imported only when first used, not at import.
+"""
+from Money import Money
+
+
+def valid_name(name_str):
+    """ Checks the name entered by the user"""
+    import re as regex
+    # Note: This regex only checks if the string *ends* with a word character.
+    # It doesn't strictly validate "first and last name" format or disallow
+    # internal numbers/symbols.
+    return regex.search(r"(\w+)$", name_str) is not None
+
+
+def random_balance(low, high):
+    """ Returns a random opening balance - whole dollars from low up to high
+    divided by 1.11, to the cent"""
+    import random
+    return Money.of(random.randrange(low, high)).scale(100, 111)
+
+
+def percentile(samples, pct):
+    """ Returns the pct-th percentile of a sorted list of samples"""
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+# Unit Tests
+if __name__ == '__main__':
+    # Only the end of the name is checked
+    assert valid_name('John Doe') and valid_name('  Jane Doe') and \
+        not valid_name('') and not valid_name('John Doe!') and \
+        not valid_name('Jane Doe  '), "Names were not checked"
+
+    # $1,000 to $4,999 divided by 1.11
+    assert all(90090 <= random_balance(1000, 5000).cents <= 450360
+               for _ in range(100)), "Opening balance out of range"
+
+    samples = list(range(1, 1001))
+    assert [percentile(samples, pct) for pct in (0, 50, 99, 99.9, 100)] == \
+        [1, 501, 991, 1000, 1000], "Percentiles are wrong"
+    assert percentile([7], 99) == 7, "Single sample should be every percentile"
+
+    # All tests passed!
+    print("\nAll Helpers unit tests passed!")
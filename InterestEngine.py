@@ -0,0 +1,229 @@
+"""
+Term Project - Bank Account Manager (ATM Style)
+
+This file contains the InterestEngine class that accrues daily interest on
+every savings account, and the daily_interest function it works with.
+
+Savings accounts are split into shards of consecutive account ids and the
+shards are spread over a pool of processes. Each process works out the
+interest of its accounts with exact integer arithmetic and posts all of
+them in one write transaction. An account is accrued at most once a day, so
+a run that is stopped part way can simply be started again.
+
+Run it nightly. Account objects in memory keep the interest credited on the
+database - their deposits, withdrawals and transfers move the balance by
+their amounts and take the balance the database ends up with - and
+Account.refresh reads it straight away.
+"""
+import time
+from decimal import Decimal
+from concurrent.futures import ProcessPoolExecutor
+
+from LedgerStore import LedgerStore, DEFAULT_DB, DEFAULT_PROFILE
+from SavingsAccount import SavingsAccount
+from TransIdGenerator import next_ids
+from Money import scale_half_even
+
+# Accounts per shard - the unit of work of a process, and of a write
+# transaction
+SHARD_SIZE = 10000
+
+# Days in a year for interest - actual/365
+DAY_COUNT = 365
+SECONDS_PER_DAY = 86400
+
+# Remark of the interest transactions
+INTEREST_REMARK = 'Interest'
+
+
+def daily_interest(balance, annual_rate, day_count=DAY_COUNT):
+    """ Function that returns a day's interest on a balance in cents at
+    annual_rate (a Decimal, e.g. Decimal('0.015') for 1.5%), in whole cents
+    rounded half to even"""
+
+    numerator, denominator = annual_rate.as_integer_ratio()
+    return scale_half_even(balance, numerator, denominator * day_count)
+
+
+def accrue_shard(db_path, profile, annual_rate, day, first_id, last_id):
+    """ Function that accrues the interest for day on the accounts with ids
+    from first_id to last_id that have not had it yet, and returns the
+    number of accounts accrued and the interest credited in cents. Accounts
+    whose balance changes while the interest is worked out are worked out
+    again"""
+
+    store = LedgerStore(db_path, profile)
+    try:
+        num_accrued = total = 0
+        balances = store.accrual_balances(first_id, last_id, day)
+        while balances:
+            timestamp = int(time.time())
+            credits = [(account_id, balance, trans_id, timestamp,
+                        INTEREST_REMARK, daily_interest(balance, annual_rate))
+                       for (account_id, balance), trans_id in
+                       zip(balances, next_ids(len(balances), db_path))]
+            accrued, changed = store.post_accruals(day, credits)
+            num_accrued += len(accrued)
+            total += sum(amt for _, amt in accrued)
+            balances = [row for account_id in changed
+                        for row in store.accrual_balances(account_id,
+                                                          account_id, day)]
+        return num_accrued, total
+    finally:
+        store.close()
+
+
+class InterestEngine():
+    """ Interest Engine class - accrues daily interest on every savings
+    account of a ledger database, shard by shard on a pool of processes.
+
+    Concurrency Note: Shards are worked out in parallel; their write
+    transactions are serialized by sqlite. Deposits and withdrawals made
+    while an accrual runs are safe - an account whose balance changes before
+    its interest is posted is worked out again - and accounts held in memory
+    pick the interest up when they are next written to or refreshed.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB, profile=DEFAULT_PROFILE,
+                 annual_rate=SavingsAccount.INTEREST_RATE, max_workers=None,
+                 shard_size=SHARD_SIZE):
+        """Constructor sets the ledger database, the annual rate (a Decimal)
+        and the number of processes - by default one per CPU"""
+
+        self.db_path = db_path
+        self.profile = profile
+        self.annual_rate = Decimal(annual_rate)
+        self.max_workers = max_workers
+        self.shard_size = shard_size
+
+    def __repr__(self):
+        """ Representation of InterestEngine"""
+        return f'InterestEngine({self.db_path!r}, {self.annual_rate})'
+
+    def shards(self):
+        """ Returns (first_id, last_id) of every shard of savings accounts"""
+
+        store = LedgerStore(self.db_path, self.profile)
+        try:
+            acc_ids = store.account_ids(SavingsAccount.ACC_PREFIX + '_')
+        finally:
+            store.close()
+        return [(acc_ids[i], acc_ids[min(i + self.shard_size,
+                                         len(acc_ids)) - 1])
+                for i in range(0, len(acc_ids), self.shard_size)]
+
+    def accrue(self, day=None):
+        """ Accrues the interest for day - a UTC day number, today by
+        default - on every savings account, and returns the number of
+        accounts accrued and the interest credited in cents"""
+
+        if day is None:
+            day = int(time.time()) // SECONDS_PER_DAY
+        shards = self.shards()
+        if not shards:
+            return 0, 0
+
+        with ProcessPoolExecutor(self.max_workers) as pool:
+            results = list(pool.map(
+                accrue_shard, *zip(*[(self.db_path, self.profile,
+                                      self.annual_rate, day, first_id,
+                                      last_id)
+                                     for first_id, last_id in shards])))
+        return (sum(num_accrued for num_accrued, _ in results),
+                sum(total for _, total in results))
+
+
+# Unit Tests
+if __name__ == '__main__':
+    import os
+    import tempfile
+    from CheckingAccount import CheckingAccount
+    from LedgerStore import TRANSFER_OUT_REMARK, TRANSFER_IN_REMARK
+
+    # Exact rounding - half a cent goes to the even cent
+    assert daily_interest(36500, Decimal('0.01')) == 1, \
+        "Interest on $365 at 1% should be a cent a day"
+    assert daily_interest(18250, Decimal('0.01')) == 0 and \
+        daily_interest(54750, Decimal('0.01')) == 2, \
+        "Half cents should round to the even cent"
+    assert daily_interest(0, SavingsAccount.INTEREST_RATE) == 0, \
+        "No interest on an empty account"
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, 'test_ledger.db')
+        sav_accs = [SavingsAccount(f'Owner {i}', 1000 * (i + 1), db_file)
+                    for i in range(25)]
+        chk_acc = CheckingAccount('Owner 0', 5000, db_file)
+
+        # Shards cover the savings accounts only, in order
+        engine = InterestEngine(db_file, annual_rate=Decimal('0.0365'),
+                                max_workers=3, shard_size=10)
+        shards = engine.shards()
+        assert [len(shards), shards[0][0], shards[-1][1]] == \
+            [3, sav_accs[0].tb_name, sav_accs[-1].tb_name], \
+            "Savings accounts were not split into shards"
+
+        # $1,000 at 3.65% earns 10 cents a day
+        expected = sum(daily_interest(acc.cents, Decimal('0.0365'))
+                       for acc in sav_accs)
+        assert engine.accrue(18718) == (25, expected), "Accrual totals wrong"
+        assert expected == sum(10 * (i + 1) for i in range(25)), \
+            "Interest should be 10 cents a day per $1,000"
+
+        # Interest is credited once a day and compounds the next day
+        assert engine.accrue(18718) == (0, 0), "Day was accrued twice"
+        for acc in sav_accs:
+            acc.close_db_connection()
+        reopened = SavingsAccount.open_account(sav_accs[0].acc_num, db_file)
+        assert reopened.cents == 100010 and \
+            reopened.mini_statement()[1][2:] == ['Interest', 10, 100010], \
+            "Interest was not credited to the account"
+        assert engine.accrue(18719)[1] == expected, \
+            "Second day should accrue on the credited balances"
+        assert CheckingAccount.open_account(
+            chk_acc.acc_num, db_file).cents == 500000, \
+            "Checking account should not earn interest"
+        reopened.close_db_connection()
+        chk_acc.close_db_connection()
+
+        # A loaded account keeps interest accrued on it meanwhile when it
+        # posts, and picks it up on refresh
+        loaded = SavingsAccount.open_account(sav_accs[1].acc_num, db_file)
+        loaded.mini_statement()
+        before = loaded.cents
+        interest = daily_interest(before, Decimal('0.0365'))
+        engine.accrue(18720)
+        loaded.withdraw(5)
+        stmt = loaded.mini_statement()
+        assert loaded.cents == before + interest - 500 and \
+            stmt[1][2:] == ['Debit', -500, loaded.cents] and \
+            stmt[2][2:] == ['Interest', interest, before + interest], \
+            "Withdrawal wrote back the balance from before the interest"
+
+        # Transfers take the balances on the ledger in the same way
+        other = SavingsAccount.open_account(sav_accs[2].acc_num, db_file)
+        other.mini_statement()
+        other_before = other.cents
+        engine.accrue(18721)
+        loaded.transfer(other, 1)
+        assert [row[2] for row in loaded.mini_statement()[1:3]] == \
+            [TRANSFER_OUT_REMARK, 'Interest'] and \
+            loaded.mini_statement()[1][4] == loaded.cents and \
+            other.cents == other_before + 100 + daily_interest(
+                other_before, Decimal('0.0365')) and \
+            [row[2] for row in other.mini_statement()[1:3]] == \
+            [TRANSFER_IN_REMARK, 'Interest'], \
+            "Transfer wrote back the balance from before the interest"
+        engine.accrue(18722)
+        loaded.refresh()
+        reopened = SavingsAccount.open_account(sav_accs[1].acc_num, db_file)
+        assert loaded.cents == reopened.cents and \
+            loaded.mini_statement()[1][2] == 'Interest' and \
+            loaded.mini_statement() == reopened.mini_statement(), \
+            "Refresh did not pick up the interest"
+        reopened.close_db_connection()
+        other.close_db_connection()
+        loaded.close_db_connection()
+
+    # All tests passed!
+    print("\nAll InterestEngine unit tests passed!")
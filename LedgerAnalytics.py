@@ -0,0 +1,276 @@
+"""
+Term Project - Bank Account Manager (ATM Style)
+
+This file contains the month-end analytics of the ledger - running balances,
+daily closing balances, average daily balances and interest accrual for
+every account at once - computed with NumPy on LedgerColumns (see
+LedgerArchive), without a Python loop over transactions.
+
+The ledger columns come from a memory-mapped archive (load_ledger) or
+straight from the database (read_ledger). Transactions are grouped by
+account and oldest first within each account, as they are in every
+LedgerColumns. Amounts and balances are integer cents. Days are UTC days
+numbered from the epoch (see day_of) and periods run from start_day up to,
+not including, end_day.
+
+Requires numpy: pip install numpy
+"""
+import calendar
+
+import numpy as np
+
+SECONDS_PER_DAY = 86400
+
+# Days in a year for interest - actual/365
+DAY_COUNT = 365
+
+
+def day_of(timestamp):
+    """ Function that returns the UTC day number of epoch seconds"""
+    return timestamp // SECONDS_PER_DAY
+
+
+def month_days(year, month):
+    """ Function that returns (start_day, end_day) of a calendar month"""
+
+    start_day = day_of(calendar.timegm((year, month, 1, 0, 0, 0)))
+    return start_day, start_day + calendar.monthrange(year, month)[1]
+
+
+def account_mask(ledger, prefix):
+    """ Function that returns a boolean array that is True for the accounts
+    whose id starts with prefix, e.g. 'SAV_' for savings accounts"""
+    return np.char.startswith(ledger.account_ids, prefix)
+
+
+def account_bounds(ledger):
+    """ Function that returns (starts, ends) - for every account, the slice
+    of the transaction columns that holds its transactions"""
+
+    starts = np.searchsorted(ledger.account,
+                             np.arange(len(ledger.account_ids)))
+    ends = np.append(starts[1:], len(ledger))
+    return starts, ends
+
+
+def sum_by_account(values, account, num_accounts):
+    """ Function that sums values per account, exactly, for rows grouped by
+    account in ascending order. Accounts without rows sum to 0"""
+
+    starts = np.searchsorted(account, np.arange(num_accounts))
+    ends = np.append(starts[1:], len(values))
+    # The appended 0 lets trailing accounts without rows start past the end
+    sums = np.add.reduceat(np.append(values, 0), starts)
+    sums[starts == ends] = 0
+    return sums
+
+
+def opening_balances(ledger):
+    """ Function that returns the balance of every account before its first
+    transaction in the ledger. Accounts without transactions have their
+    current balance"""
+
+    starts, ends = account_bounds(ledger)
+    opening = np.array(ledger.balances, dtype=np.int64)
+    first = starts[ends > starts]
+    opening[ends > starts] = ledger.balance[first] - ledger.amount[first]
+    return opening
+
+
+def running_balances(ledger):
+    """ Function that recomputes the running balance after every transaction
+    from the opening balances and amounts - a grouped cumulative sum. It
+    matches the balance column for a consistent ledger"""
+
+    starts, _ = account_bounds(ledger)
+    totals = np.cumsum(ledger.amount, dtype=np.int64)
+    # Turn the overall cumulative sum into one per account, starting from
+    # its opening balance
+    before = np.append(0, totals)[starts] - opening_balances(ledger)
+    totals -= before[ledger.account]
+    return totals
+
+
+def daily_closing_balances(ledger):
+    """ Function that returns (account, day, balance) arrays with the
+    balance of an account at the end of each day it has transactions on,
+    grouped by account, oldest day first"""
+
+    days = day_of(np.asarray(ledger.ts)).astype(np.int32)
+    last = np.ones(len(days), dtype=bool)
+    last[:-1] = (ledger.account[1:] != ledger.account[:-1]) | \
+        (days[1:] != days[:-1])
+    last = np.flatnonzero(last)
+    return (np.asarray(ledger.account[last]), days[last],
+            np.asarray(ledger.balance[last]))
+
+
+def group_edges(account):
+    """ Function that returns (first, last) boolean arrays marking the first
+    and the last row of every account in rows grouped by account"""
+
+    first = np.ones(len(account), dtype=bool)
+    first[1:] = account[1:] != account[:-1]
+    last = np.ones(len(account), dtype=bool)
+    last[:-1] = first[1:]
+    return first, last
+
+
+def balance_day_sums(ledger, start_day, end_day):
+    """ Function that returns, for every account, the sum of its end of day
+    balances over the days of the period, in cents. The balance at the end
+    of a day without transactions is the one of the day before"""
+
+    acc, days, closing = daily_closing_balances(ledger)
+    num_accounts = len(ledger.account_ids)
+
+    # Every closing balance holds until the next day with transactions on
+    # the same account, or the end of the period
+    first_in_acc, last_in_acc = group_edges(acc)
+    next_days = np.append(days[1:], end_day)
+    next_days[last_in_acc] = end_day
+    held = np.clip(next_days, start_day, end_day) - \
+        np.clip(days, start_day, end_day)
+    sums = sum_by_account(closing * held, acc, num_accounts)
+
+    # Before its first transaction an account holds its opening balance
+    first_days = np.full(num_accounts, end_day, dtype=np.int64)
+    first_days[acc[first_in_acc]] = days[first_in_acc]
+    sums += opening_balances(ledger) * \
+        (np.clip(first_days, start_day, end_day) - start_day)
+    return sums
+
+
+def average_daily_balances(ledger, start_day, end_day):
+    """ Function that returns the average end of day balance of every
+    account over the period, in cents"""
+    day_sums = balance_day_sums(ledger, start_day, end_day)
+    return day_sums / (end_day - start_day)
+
+
+def balances_at(ledger, end_day):
+    """ Function that returns the balance of every account at the start of
+    end_day, i.e. after the last transaction before it"""
+
+    acc, days, closing = daily_closing_balances(ledger)
+    before = days < end_day
+    acc, closing = acc[before], closing[before]
+    balances = opening_balances(ledger)
+    _, last_in_acc = group_edges(acc)
+    balances[acc[last_in_acc]] = closing[last_in_acc]
+    return balances
+
+
+def accrued_interest(ledger, annual_rate, start_day, end_day,
+                     day_count=DAY_COUNT):
+    """ Function that returns the interest every account earns over the
+    period at annual_rate (0.02 for 2%), in cents: simple daily interest on
+    the end of day balance, rounded half to even once for the period"""
+
+    return interest_on(balance_day_sums(ledger, start_day, end_day),
+                       annual_rate, day_count)
+
+
+def interest_on(day_sums, annual_rate, day_count=DAY_COUNT):
+    """ Function that turns sums of end of day balances into interest in
+    cents, rounded half to even"""
+    return np.rint(day_sums * (annual_rate / day_count)).astype(np.int64)
+
+
+def month_end(ledger, year, month, savings_rate, savings_prefix='SAV_'):
+    """ Function that runs the month-end figures of every account and
+    returns them as a dictionary of arrays, in account order: the closing
+    balance, the average daily balance and the interest earned (savings
+    accounts only, at savings_rate)"""
+
+    start_day, end_day = month_days(year, month)
+    day_sums = balance_day_sums(ledger, start_day, end_day)
+    interest = interest_on(day_sums, savings_rate)
+    interest[~account_mask(ledger, savings_prefix)] = 0
+    return {'account_id': ledger.account_ids,
+            'closing_balance': balances_at(ledger, end_day),
+            'average_daily_balance': day_sums / (end_day - start_day),
+            'interest': interest}
+
+
+# Unit Tests
+if __name__ == '__main__':
+    from LedgerArchive import LedgerColumns
+
+    # Three accounts - the middle one without transactions. Days below are
+    # offsets from the start of April 2021
+    april_start, april_end = month_days(2021, 4)
+    assert (april_start, april_end - april_start) == (18718, 30), \
+        "Month days are wrong"
+    trans = [  # account, day, amount
+        (0, -3, 5000), (0, 2, -1000), (0, 2, 2500), (0, 10, 500),
+        (0, 31, 100),
+        (2, 0, 100000), (2, 15, -40000)]
+    opening = [10000, 777, 0]
+    running, balance_now = [], list(opening)
+    for acc, _, amt in trans:
+        balance_now[acc] += amt
+        running.append(balance_now[acc])
+    ledger = LedgerColumns(
+        {'trans_id': np.arange(len(trans)),
+         'account': np.array([i[0] for i in trans], dtype=np.int32),
+         'ts': np.array([(april_start + i[1]) * SECONDS_PER_DAY + 3600
+                         for i in trans]),
+         'remark': np.array([int(i[2] < 0) for i in trans], dtype=np.int8),
+         'amount': np.array([i[2] for i in trans]),
+         'balance': np.array(running),
+         'account_id': np.array(['CHK_100001', 'CHK_100002', 'SAV_100003']),
+         'owner': np.array(['John Doe'] * 3),
+         'account_balance': np.array(balance_now)},
+        ['Credit', 'Debit'])
+
+    # Running balances match the balance column
+    assert opening_balances(ledger).tolist() == opening, \
+        "Opening balances are wrong"
+    assert running_balances(ledger).tolist() == running, \
+        "Running balances are wrong"
+    acc, days, closing = daily_closing_balances(ledger)
+    assert list(zip(acc.tolist(), (days - april_start).tolist(),
+                    closing.tolist())) == \
+        [(0, -3, 15000), (0, 2, 16500), (0, 10, 17000), (0, 31, 17100),
+         (2, 0, 100000), (2, 15, 60000)], "Daily closing balances are wrong"
+
+    # Average daily balance - compared with a day by day loop
+    def loop_day_sums(acc_num):
+        total = 0
+        for day in range(april_start, april_end):
+            bal = opening[acc_num]
+            for (acc_t, day_t, _), bal_t in zip(trans, running):
+                if acc_t == acc_num and april_start + day_t <= day:
+                    bal = bal_t
+            total += bal
+        return total
+    day_sums = balance_day_sums(ledger, april_start, april_end)
+    assert day_sums.tolist() == [loop_day_sums(i) for i in range(3)], \
+        "Balance day sums differ from a day by day count"
+    assert average_daily_balances(ledger, april_start, april_end)[1] == 777, \
+        "Account without transactions should average its balance"
+    assert balances_at(ledger, april_end).tolist() == [17000, 777, 60000], \
+        "Balances at month end are wrong"
+
+    # Interest - 2% a year on SAV_100003 for April:
+    # (15 days at $1,000 + 15 days at $600) * 0.02 / 365 = $1.3150...
+    report = month_end(ledger, 2021, 4, 0.02)
+    assert report['interest'].tolist() == [0, 0, 132], \
+        "Interest should be $1.32 for savings only"
+    assert accrued_interest(ledger, 0.02, april_start,
+                            april_end).tolist()[2] == 132, \
+        "Accrued interest is wrong"
+    empty = LedgerColumns(
+        {name: np.array([], dtype=np.int64) for name in
+         ('trans_id', 'account', 'ts', 'remark', 'amount', 'balance')} |
+        {'account_id': np.array(['SAV_100004']), 'owner': np.array(['']),
+         'account_balance': np.array([3650])}, [])
+    assert month_end(empty, 2021, 4, 0.05)['interest'].tolist() == [15], \
+        "Ledger without transactions should accrue on current balances"
+    assert sum_by_account(np.array([1, 2, 3]), np.array([1, 1, 3]),
+                          5).tolist() == [0, 3, 0, 3, 0], \
+        "Sums of accounts without rows should be 0"
+
+    # All tests passed!
+    print("\nAll LedgerAnalytics unit tests passed!")
@@ -0,0 +1,432 @@
+"""
+Term Project - Bank Account Manager (ATM Style)
+
+This file contains the functions that snapshot the whole ledger database to a
+columnar archive and restore it, and the LedgerColumns class that holds a
+loaded archive.
+
+An archive is a directory with one file per column - NumPy .npy arrays by
+default, or Parquet files when pyarrow is installed - and a manifest.json
+describing it. Transactions are kept in the order of the covering index:
+grouped by account, oldest first within each account. Accounts are numbered
+in account id order and transactions refer to them by that number; remarks
+are stored as small integer codes. .npy archives are memory-mapped when
+loaded, so a ledger of any size opens at once and only the pages that are
+read are loaded.
+
+Requires numpy: pip install numpy
+"""
+import os
+import json
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from LedgerStore import SCHEMA_VERSION
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:
+    # Parquet archives need pyarrow - .npy archives work without it
+    parquet = None
+
+# Version of the archive layout, kept in the manifest
+ARCHIVE_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+
+# Archive formats
+FORMATS = ('npy', 'parquet')
+
+# Transaction columns and their types
+TRANSACTION_DTYPES = {'trans_id': np.int64, 'account': np.int32,
+                      'ts': np.int64, 'remark': np.int8, 'amount': np.int64,
+                      'balance': np.int64}
+
+# Rows read from or written to the database at a time
+ARCHIVE_CHUNK_SIZE = 100000
+
+
+class LedgerColumns():
+    """ Ledger Columns class - the columns of a loaded ledger archive as
+    NumPy arrays, memory-mapped for .npy archives
+
+    Transaction columns: trans_id, account (index into the account columns),
+    ts, remark (index into remarks), amount and balance. Account columns:
+    account_ids, owners and balances. Amounts and balances are integer cents
+    and timestamps are epoch seconds, as on the ledger database.
+    """
+
+    def __init__(self, columns, remarks):
+        """Constructor takes a dictionary of column arrays and the list of
+        remarks the remark codes stand for"""
+
+        self.trans_id = columns['trans_id']
+        self.account = columns['account']
+        self.ts = columns['ts']
+        self.remark = columns['remark']
+        self.amount = columns['amount']
+        self.balance = columns['balance']
+        self.account_ids = columns['account_id']
+        self.owners = columns['owner']
+        self.balances = columns['account_balance']
+        self.remarks = remarks
+
+    def __repr__(self):
+        """ Representation of LedgerColumns"""
+        return f'LedgerColumns({len(self.account_ids)} accounts, ' \
+               f'{len(self)} transactions)'
+
+    def __len__(self):
+        """ Number of transactions"""
+        return len(self.trans_id)
+
+    def account_rows(self, account_id):
+        """ Returns the slice of the transaction columns that holds the
+        transactions of an account. The slice is empty for an unknown id"""
+
+        acc = np.searchsorted(self.account_ids, account_id)
+        if acc == len(self.account_ids) or self.account_ids[acc] != account_id:
+            return slice(0, 0)
+        return slice(*np.searchsorted(self.account, [acc, acc + 1]))
+
+    def transaction_chunks(self, chunk_size=ARCHIVE_CHUNK_SIZE):
+        """ Generator that yields (account_id, trans_id, ts, remark, amount,
+        balance) rows, in transaction id order, as lists of at most
+        chunk_size rows"""
+
+        order = np.argsort(self.trans_id, kind='stable')
+        account_ids = np.asarray(self.account_ids, dtype=object)
+        remarks = np.asarray(self.remarks, dtype=object)
+        for first in range(0, len(order), chunk_size):
+            rows = order[first:first + chunk_size]
+            yield list(zip(account_ids[self.account[rows]].tolist(),
+                           self.trans_id[rows].tolist(),
+                           self.ts[rows].tolist(),
+                           remarks[self.remark[rows]].tolist(),
+                           self.amount[rows].tolist(),
+                           self.balance[rows].tolist()))
+
+
+def check_format(fmt):
+    """ Function that verifies an archive format can be used here"""
+
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown archive format: {fmt!r}. '
+                         f'Choose from {", ".join(FORMATS)}')
+    if fmt == 'parquet' and parquet is None:
+        raise ImportError('Parquet archives need pyarrow: '
+                          'pip install pyarrow')
+
+
+def export_ledger(store, archive_dir, fmt='npy',
+                  chunk_size=ARCHIVE_CHUNK_SIZE):
+    """ Function that writes every account and transaction of an open
+    LedgerStore to an archive directory and returns the manifest. The
+    database is read in chunks from a single snapshot, so writes made while
+    the export runs are left out and memory use does not depend on the size
+    of the ledger"""
+
+    check_format(fmt)
+    os.makedirs(archive_dir, exist_ok=True)
+
+    with store.read_snapshot():
+        accounts = store.all_accounts().fetchall()
+        num_rows = store.count_transactions()
+        remark_codes = {}
+        chunks = _column_chunks(store, accounts, remark_codes, chunk_size)
+
+        if fmt == 'npy':
+            ledger = new_archive(archive_dir, _account_columns(accounts),
+                                 num_rows)
+            _fill_columns(ledger, chunks)
+            for name in TRANSACTION_DTYPES:
+                getattr(ledger, name).flush()
+            del ledger
+        else:
+            parquet.write_table(pyarrow.table(_account_columns(accounts)),
+                                os.path.join(archive_dir, 'accounts.parquet'))
+            with parquet.ParquetWriter(
+                    os.path.join(archive_dir, 'transactions.parquet'),
+                    pyarrow.schema([
+                        (name, pyarrow.from_numpy_dtype(dtype))
+                        for name, dtype in TRANSACTION_DTYPES.items()])
+            ) as writer:
+                for chunk in chunks:
+                    writer.write_table(pyarrow.table(chunk))
+
+    return _write_manifest(archive_dir, fmt, len(accounts), num_rows,
+                           list(remark_codes))
+
+
+def read_ledger(store, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """ Function that reads every account and transaction of an open
+    LedgerStore, from a single snapshot, into in-memory LedgerColumns - the
+    same columns an archive holds, without writing one"""
+
+    with store.read_snapshot():
+        accounts = store.all_accounts().fetchall()
+        num_rows = store.count_transactions()
+        remark_codes = {}
+        columns = _account_columns(accounts)
+        columns.update((name, np.empty(num_rows, dtype=dtype))
+                       for name, dtype in TRANSACTION_DTYPES.items())
+        ledger = LedgerColumns(columns, [])
+        _fill_columns(ledger, _column_chunks(store, accounts, remark_codes,
+                                             chunk_size))
+    ledger.remarks = list(remark_codes)
+    return ledger
+
+
+def new_archive(archive_dir, account_columns, num_rows, remarks=()):
+    """ Function that starts a .npy archive of num_rows transactions for the
+    accounts given as account_id, owner and account_balance columns (in
+    account id order), and returns its LedgerColumns with the transaction
+    columns memory-mapped for writing. The caller fills them in - grouped by
+    account, oldest first within each account - and flushes them"""
+
+    os.makedirs(archive_dir, exist_ok=True)
+    for name in ('account_id', 'owner', 'account_balance'):
+        np.save(os.path.join(archive_dir, name + '.npy'),
+                account_columns[name])
+    columns = dict(account_columns)
+    columns.update(
+        (name, open_memmap(os.path.join(archive_dir, name + '.npy'),
+                           mode='w+', dtype=dtype, shape=(num_rows,)))
+        for name, dtype in TRANSACTION_DTYPES.items())
+    _write_manifest(archive_dir, 'npy', len(account_columns['account_id']),
+                    num_rows, list(remarks))
+    return LedgerColumns(columns, list(remarks))
+
+
+def save_ledger(ledger, archive_dir):
+    """ Function that writes LedgerColumns - e.g. built or filtered in
+    memory - to a .npy archive directory and returns the manifest"""
+
+    os.makedirs(archive_dir, exist_ok=True)
+    for name, array in (('account_id', ledger.account_ids),
+                        ('owner', ledger.owners),
+                        ('account_balance', ledger.balances)):
+        np.save(os.path.join(archive_dir, name + '.npy'), array)
+    for name, dtype in TRANSACTION_DTYPES.items():
+        np.save(os.path.join(archive_dir, name + '.npy'),
+                np.asarray(getattr(ledger, name), dtype=dtype))
+    return _write_manifest(archive_dir, 'npy', len(ledger.account_ids),
+                           len(ledger), list(ledger.remarks))
+
+
+def _account_columns(accounts):
+    """ Turns (account_id, owner, balance) rows into account columns"""
+
+    return {'account_id': np.array([account[0] for account in accounts],
+                                   dtype=str),
+            'owner': np.array([account[1] or '' for account in accounts],
+                              dtype=str),
+            'account_balance': np.array([account[2] for account in accounts],
+                                        dtype=np.int64)}
+
+
+def _column_chunks(store, accounts, remark_codes, chunk_size):
+    """ Generator that reads the transactions of a store in chunks and
+    yields each as a dictionary of column arrays. New remarks are given the
+    next code in remark_codes"""
+
+    acc_index = {account[0]: i for i, account in enumerate(accounts)}
+    for rows in store.stream_ledger(chunk_size):
+        acc_col, id_col, ts_col, remark_col, amt_col, bal_col = zip(*rows)
+        yield {'trans_id': np.array(id_col, dtype=np.int64),
+               'account': np.array([acc_index[i] for i in acc_col],
+                                   dtype=np.int32),
+               'ts': np.array(ts_col, dtype=np.int64),
+               'remark': np.array([remark_codes.setdefault(i, len(
+                   remark_codes)) for i in remark_col], dtype=np.int8),
+               'amount': np.array(amt_col, dtype=np.int64),
+               'balance': np.array(bal_col, dtype=np.int64)}
+
+
+def _fill_columns(ledger, chunks):
+    """ Copies chunks of column arrays into the transaction columns of
+    LedgerColumns, one after another"""
+
+    pos = 0
+    for chunk in chunks:
+        end = pos + len(chunk['trans_id'])
+        for name, array in chunk.items():
+            getattr(ledger, name)[pos:end] = array
+        pos = end
+
+
+def _write_manifest(archive_dir, fmt, num_accounts, num_rows, remarks):
+    """ Writes the manifest of an archive and returns it"""
+
+    manifest = {'archive_version': ARCHIVE_VERSION,
+                'schema_version': SCHEMA_VERSION, 'format': fmt,
+                'num_accounts': num_accounts, 'num_transactions': num_rows,
+                'remarks': remarks}
+    with open(os.path.join(archive_dir, MANIFEST_FILE), 'w') as out_file:
+        json.dump(manifest, out_file, indent=2)
+    return manifest
+
+
+def read_manifest(archive_dir):
+    """ Function that reads and verifies the manifest of an archive"""
+
+    with open(os.path.join(archive_dir, MANIFEST_FILE)) as in_file:
+        manifest = json.load(in_file)
+    if manifest.get('archive_version') != ARCHIVE_VERSION:
+        raise ValueError(f'{archive_dir} is not a ledger archive of version '
+                         f'{ARCHIVE_VERSION}')
+    check_format(manifest['format'])
+    return manifest
+
+
+def load_ledger(archive_dir, mmap=True):
+    """ Function that opens an archive and returns its LedgerColumns. With
+    mmap, .npy columns are memory-mapped read-only instead of read into
+    memory, and Parquet files are read through a memory map"""
+
+    manifest = read_manifest(archive_dir)
+    if manifest['format'] == 'npy':
+        columns = {
+            name: np.load(os.path.join(archive_dir, name + '.npy'),
+                          mmap_mode='r' if mmap else None)
+            for name in ('account_id', 'owner', 'account_balance',
+                         *TRANSACTION_DTYPES)}
+    else:
+        columns = {}
+        for file_name in ('accounts.parquet', 'transactions.parquet'):
+            table = parquet.read_table(os.path.join(archive_dir, file_name),
+                                       memory_map=mmap)
+            for name in table.column_names:
+                columns[name] = table.column(name).to_numpy()
+        columns['account_id'] = columns['account_id'].astype(str)
+        columns['owner'] = columns['owner'].astype(str)
+    return LedgerColumns(columns, manifest['remarks'])
+
+
+def restore_ledger(archive_dir, store, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """ Function that loads an archive into an open LedgerStore in one bulk
+    transaction (see LedgerStore.restore_accounts) and returns the number of
+    transactions restored. Accounts with the same ids are replaced. Account
+    numbers handed out afterwards do not clash with the restored accounts -
+    except for numbers a process had already reserved, so restore before
+    creating new accounts"""
+
+    ledger = load_ledger(archive_dir)
+    acc_nums = [int(acc_id.rsplit('_', 1)[-1])
+                for acc_id in ledger.account_ids.tolist()
+                if acc_id.rsplit('_', 1)[-1].isdigit()]
+    store.restore_accounts(
+        zip(ledger.account_ids.tolist(), ledger.owners.tolist(),
+            ledger.balances.tolist()),
+        ledger.transaction_chunks(chunk_size),
+        max(acc_nums, default=0) + 1)
+    return len(ledger)
+
+
+# Unit Tests
+if __name__ == '__main__':
+    import tempfile
+    from LedgerStore import LedgerStore
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = LedgerStore(os.path.join(tmp_dir, 'test_ledger.db'))
+        for acc_id, owner in (('SAV_100002', 'Jane Doe'),
+                              ('CHK_100001', 'John Doe'),
+                              ('CHK_100003', 'Jim Doe')):
+            store.create_account(acc_id, owner, 0)
+        # Interleaved transactions, as several accounts post at once
+        for i in range(30):
+            acc_id = ('SAV_100002', 'CHK_100001')[i % 2]
+            is_debit = i % 3 == 2
+            store.insert_transactions(
+                acc_id, [(5000 + i, 1618740000 + i,
+                          'Debit' if is_debit else 'Credit',
+                          -100 if is_debit else 100, i * 10)], i * 10)
+
+        # Export - accounts in id order, transactions grouped by account
+        archive_dir = os.path.join(tmp_dir, 'archive')
+        manifest = export_ledger(store, archive_dir, chunk_size=7)
+        assert manifest['num_accounts'] == 3 and \
+            manifest['num_transactions'] == 30, "Manifest counts are wrong"
+        ledger = load_ledger(archive_dir)
+        assert isinstance(ledger.amount, np.memmap), \
+            "Columns should be memory-mapped"
+        assert ledger.account_ids.tolist() == \
+            ['CHK_100001', 'CHK_100003', 'SAV_100002'], \
+            "Accounts are not in id order"
+        assert ledger.account.tolist() == [0] * 15 + [2] * 15, \
+            "Transactions are not grouped by account"
+        assert ledger.amount.sum() == store.cur.execute(
+            'SELECT sum(amount) FROM transactions').fetchone()[0], \
+            "Amounts differ from the database"
+
+        # Rows of one account, the same as on the database
+        chk_rows = ledger.account_rows('CHK_100001')
+        db_rows = [row for chunk in store.stream_transactions('CHK_100001')
+                   for row in chunk]
+        assert list(zip(ledger.trans_id[chk_rows].tolist(),
+                        ledger.ts[chk_rows].tolist(),
+                        [ledger.remarks[i] for i in ledger.remark[chk_rows]],
+                        ledger.amount[chk_rows].tolist(),
+                        ledger.balance[chk_rows].tolist())) == db_rows, \
+            "Archived account rows differ from the database"
+        assert ledger.account_rows('CHK_100003') == slice(15, 15) and \
+            ledger.account_rows('CHK_999999') == slice(0, 0), \
+            "Accounts without transactions should have empty rows"
+
+        # Restore into a new database gives back the same ledger
+        new_store = LedgerStore(os.path.join(tmp_dir, 'restored.db'))
+        assert restore_ledger(archive_dir, new_store, chunk_size=4) == 30, \
+            "Not every transaction was restored"
+        for acc_id in ledger.account_ids.tolist():
+            assert new_store.load_account(acc_id) == \
+                store.load_account(acc_id), "Restored account differs"
+            assert list(new_store.stream_transactions(acc_id)) == \
+                list(store.stream_transactions(acc_id)), \
+                "Restored history differs"
+        assert new_store.claim_acc_nums(1) == 100004, \
+            "New account numbers would clash with restored accounts"
+        index_names = [i[1] for i in new_store.cur.execute(
+            "PRAGMA index_list('transactions')")]
+        assert 'ix_transactions_account_id' in index_names, \
+            "Covering index was not rebuilt"
+        new_store.close()
+
+        # Ledgers can be read straight into memory
+        mem_ledger = read_ledger(store, chunk_size=8)
+        assert mem_ledger.remarks == ledger.remarks and \
+            mem_ledger.amount.tolist() == ledger.amount.tolist() and \
+            mem_ledger.account_ids.tolist() == ledger.account_ids.tolist(), \
+            "Ledger read into memory differs from the archive"
+
+        # Columns can be saved straight from memory
+        copy_dir = os.path.join(tmp_dir, 'copy')
+        save_ledger(ledger, copy_dir)
+        copy_ledger = load_ledger(copy_dir, mmap=False)
+        assert not isinstance(copy_ledger.amount, np.memmap) and \
+            copy_ledger.balance.tolist() == ledger.balance.tolist() and \
+            copy_ledger.owners.tolist() == ledger.owners.tolist(), \
+            "Saved ledger differs"
+
+        # Parquet archives when pyarrow is available
+        parquet_dir = os.path.join(tmp_dir, 'parquet_archive')
+        if parquet is None:
+            try:
+                export_ledger(store, parquet_dir, 'parquet')
+            except ImportError:
+                pass
+            else:
+                raise AssertionError("Parquet export should need pyarrow")
+        else:
+            export_ledger(store, parquet_dir, 'parquet')
+            parquet_ledger = load_ledger(parquet_dir)
+            assert parquet_ledger.trans_id.tolist() == \
+                ledger.trans_id.tolist() and \
+                parquet_ledger.account_ids.tolist() == \
+                ledger.account_ids.tolist(), "Parquet archive differs"
+        del ledger
+        store.close()
+
+    # All tests passed!
+    print("\nAll LedgerArchive unit tests passed!")
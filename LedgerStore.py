@@ -0,0 +1,923 @@
+"""
+Term Project - Bank Account Manager (ATM Style)
+
+This file contains the LedgerStore class - a single sqlite database shared by
+every Checking and Savings account. Accounts live in one table keyed by
+account id and their transactions in another, so the database keeps growing
+across runs instead of being deleted and recreated for each account.
+
+Ensure to call LedgerStore.close if instantiated!
+"""
+import sqlite3
+from contextlib import contextmanager
+
+import Metrics
+
+# Default database file shared by all accounts
+DEFAULT_DB = 'BankLedger.db'
+
+# Durability/performance profiles for the ledger connections. All of them
+# use the write-ahead log, so readers do not block the writer and a commit
+# appends to the log instead of rewriting the database pages:
+# - strict: fsync on every commit, nothing committed is ever lost
+# - balanced: fsync only at checkpoints, a power loss (not an application
+#   crash) may lose the last few commits
+# - bulk: no fsync at all, for loads that can be re-run if the machine fails
+# cache_size is in KiB (negative) and mmap_size in bytes. wal_autocheckpoint
+# is the number of log pages after which the log is copied back into the
+# database, i.e. the checkpoint cadence.
+PROFILES = {
+    'strict': {'journal_mode': 'WAL', 'synchronous': 'FULL',
+               'cache_size': -8000, 'mmap_size': 0,
+               'wal_autocheckpoint': 1000},
+    'balanced': {'journal_mode': 'WAL', 'synchronous': 'NORMAL',
+                 'cache_size': -32000, 'mmap_size': 64 * 1024 * 1024,
+                 'wal_autocheckpoint': 1000},
+    'bulk': {'journal_mode': 'WAL', 'synchronous': 'OFF',
+             'cache_size': -128000, 'mmap_size': 256 * 1024 * 1024,
+             'wal_autocheckpoint': 10000},
+}
+DEFAULT_PROFILE = 'balanced'
+
+# Version of the schema below, kept in the database's user_version pragma
+SCHEMA_VERSION = 5
+
+# Schema - amounts and balances are integer cents and timestamps are epoch
+# seconds. The accounts table keeps the current balance so that an existing
+# account opens with a single primary key lookup. trans_id is the rowid; ids
+# come from TransIdGenerator and are time-ordered, so new rows are appended
+# at the end of the table and of the index. The covering index on
+# (account_id, trans_id) holds every column a statement needs - the latest
+# transactions of an account are read straight off the index. The counters
+# table holds the next account number that has not been handed out yet,
+# and the transaction id node number to try leasing next. The accruals
+# table holds the last day interest was accrued for each account that earns
+# interest (see InterestEngine). The node_leases table holds the process
+# (host and process id) every transaction id node number is leased to (see
+# TransIdGenerator).
+TRANSACTIONS_INDEX_SQL = 'CREATE INDEX IF NOT EXISTS ' \
+                         'ix_transactions_account_id ON transactions ' \
+                         '(account_id, trans_id, ts, remark, amount, balance)'
+ACCRUALS_TABLE_SQL = 'CREATE TABLE IF NOT EXISTS accruals (' \
+                     'account_id text PRIMARY KEY, day integer NOT NULL)'
+NODE_LEASES_TABLE_SQL = 'CREATE TABLE IF NOT EXISTS node_leases (' \
+                        'node_id integer PRIMARY KEY, host text NOT NULL, ' \
+                        'pid integer NOT NULL)'
+NODE_COUNTER_SQL = "INSERT OR IGNORE INTO counters VALUES ('node_id', 0)"
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS accounts (
+    account_id text PRIMARY KEY,
+    owner text,
+    balance integer NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    trans_id integer PRIMARY KEY,
+    account_id text NOT NULL,
+    ts integer NOT NULL,
+    remark text NOT NULL,
+    amount integer NOT NULL,
+    balance integer NOT NULL
+);
+{TRANSACTIONS_INDEX_SQL};
+CREATE TABLE IF NOT EXISTS counters (
+    name text PRIMARY KEY,
+    value integer NOT NULL
+);
+INSERT OR IGNORE INTO counters VALUES ('acc_num', 100001);
+{NODE_COUNTER_SQL};
+{ACCRUALS_TABLE_SQL};
+{NODE_LEASES_TABLE_SQL};
+'''
+
+# Statements that bring a database of an earlier schema version up to the
+# next one, by version
+MIGRATIONS = {3: (ACCRUALS_TABLE_SQL,),
+              4: (NODE_COUNTER_SQL, NODE_LEASES_TABLE_SQL)}
+
+# Statement columns, named the way they are shown to the user
+STATEMENT_FIELDS = (('trans_id', 'Trans.ID'), ('ts', 'Timestamp'),
+                    ('remark', 'Remark'), ('amount', 'Trans. Amt'),
+                    ('balance', 'Running Bal.'))
+STATEMENT_COLUMNS = ', '.join(f'{column} AS "{header}"'
+                              for column, header in STATEMENT_FIELDS)
+STATEMENT_HEADERS = [header for _, header in STATEMENT_FIELDS]
+
+# Remarks of the two legs of a transfer
+TRANSFER_OUT_REMARK = 'Transfer Out'
+TRANSFER_IN_REMARK = 'Transfer In'
+
+# Rows fetched at a time when a full statement is streamed
+STREAM_CHUNK_SIZE = 1000
+
+# Ledger reads and writes. The SQL text never changes and values are always
+# bound as ? parameters, so sqlite parses and plans each statement once per
+# connection and reuses it from the connection's statement cache afterwards.
+# Never build these by pasting values into the text - every new text is a
+# new statement to prepare, and an injection risk.
+INSERT_ACCOUNT_SQL = 'INSERT INTO accounts VALUES (?, ?, ?)'
+DELETE_HISTORY_SQL = 'DELETE FROM transactions WHERE account_id = ?'
+REPLACE_ACCOUNT_SQL = 'INSERT OR REPLACE INTO accounts VALUES (?, ?, ?)'
+CLAIM_ACC_NUMS_SQL = "UPDATE counters SET value = value + ? " \
+                     "WHERE name = 'acc_num' RETURNING value - ?"
+# Transaction id node leases - read, and one taken, in one write transaction
+NEXT_NODE_SQL = "SELECT value FROM counters WHERE name = 'node_id'"
+NODE_LEASES_SQL = 'SELECT node_id, host, pid FROM node_leases'
+LEASE_NODE_SQL = 'INSERT OR REPLACE INTO node_leases VALUES (?, ?, ?)'
+SET_NEXT_NODE_SQL = "UPDATE counters SET value = ? WHERE name = 'node_id'"
+LOAD_ACCOUNT_SQL = 'SELECT owner, balance FROM accounts WHERE account_id = ?'
+INSERT_TRANSACTION_SQL = 'INSERT INTO transactions (account_id, trans_id, ' \
+                         'ts, remark, amount, balance) ' \
+                         'VALUES (?, ?, ?, ?, ?, ?)'
+UPDATE_BALANCE_SQL = 'UPDATE accounts SET balance = ? WHERE account_id = ?'
+# Deposits and withdrawals of a loaded account move the balance by their
+# amounts, so a credit posted meanwhile (e.g. interest) is kept
+POST_BALANCE_SQL = 'UPDATE accounts SET balance = balance + ? ' \
+                   'WHERE account_id = ? RETURNING balance'
+# Journal replay (see BalanceCache) - rows already on the ledger are skipped,
+# so a journal can be replayed more than once, and a balance is only set
+# from an account's latest transaction
+REPLAY_TRANSACTION_SQL = 'INSERT OR IGNORE INTO transactions (account_id, ' \
+                         'trans_id, ts, remark, amount, balance) ' \
+                         'VALUES (?, ?, ?, ?, ?, ?)'
+REPLAY_BALANCE_SQL = 'UPDATE accounts SET balance = ? WHERE account_id = ? ' \
+                     'AND NOT EXISTS (SELECT 1 FROM transactions ' \
+                     'WHERE account_id = ? AND trans_id > ?)'
+LATEST_TRANSACTIONS_SQL = 'SELECT ' + STATEMENT_COLUMNS + ' FROM ' \
+                          'transactions WHERE account_id = ? ' \
+                          'ORDER BY trans_id DESC LIMIT ?'
+# Full history, oldest first. Filters that are not asked for are bound to
+# values that let every row through, so the text stays the same
+STREAM_TRANSACTIONS_SQL = 'SELECT ' + STATEMENT_COLUMNS + ' FROM ' \
+                          'transactions WHERE account_id = ? ' \
+                          'AND trans_id > ? AND ts >= ? AND ts < ? ' \
+                          'ORDER BY trans_id'
+# Whole ledger, for archives - accounts in id order and transactions in the
+# order of the covering index
+ALL_ACCOUNTS_SQL = 'SELECT account_id, owner, balance FROM accounts ' \
+                   'ORDER BY account_id'
+COUNT_TRANSACTIONS_SQL = 'SELECT count(*) FROM transactions'
+ALL_TRANSACTIONS_SQL = 'SELECT account_id, trans_id, ts, remark, amount, ' \
+                       'balance FROM transactions ' \
+                       'ORDER BY account_id, trans_id'
+RAISE_ACC_NUM_SQL = "UPDATE counters SET value = max(value, ?) " \
+                    "WHERE name = 'acc_num'"
+# Interest accrual - ids in a range are fetched with their balance and last
+# accrual day, and posted in one write transaction per shard
+ACCOUNT_IDS_SQL = 'SELECT account_id FROM accounts ' \
+                  'WHERE account_id >= ? AND account_id < ? ' \
+                  'ORDER BY account_id'
+# Number of accounts and their balances in total, of all accounts or of the
+# ids in a range
+TOTAL_BALANCE_SQL = 'SELECT count(*), coalesce(sum(balance), 0) ' \
+                    'FROM accounts'
+TOTAL_BALANCE_RANGE_SQL = TOTAL_BALANCE_SQL + \
+    ' WHERE account_id >= ? AND account_id < ?'
+ACCRUAL_BALANCES_SQL = 'SELECT account_id, balance FROM accounts ' \
+                       'LEFT JOIN accruals USING (account_id) ' \
+                       'WHERE account_id BETWEEN ? AND ? ' \
+                       'AND (day IS NULL OR day < ?) ORDER BY account_id'
+ACCRUAL_STATE_SQL = 'SELECT balance, day FROM accounts ' \
+                    'LEFT JOIN accruals USING (account_id) ' \
+                    'WHERE account_id = ?'
+CREDIT_ACCOUNT_SQL = 'UPDATE accounts SET balance = balance + ? ' \
+                     'WHERE account_id = ?'
+# Transfers - the source is only debited if its balance covers the amount,
+# checked and applied in one statement. Both return the new balance
+TRANSFER_OUT_SQL = 'UPDATE accounts SET balance = balance - ? ' \
+                   'WHERE account_id = ? AND balance >= ? RETURNING balance'
+TRANSFER_IN_SQL = 'UPDATE accounts SET balance = balance + ? ' \
+                  'WHERE account_id = ? RETURNING balance'
+MARK_ACCRUAL_SQL = 'INSERT OR REPLACE INTO accruals VALUES (?, ?)'
+DELETE_ACCRUAL_SQL = 'DELETE FROM accruals WHERE account_id = ?'
+MIN_INTEGER = -(1 << 63)
+MAX_INTEGER = (1 << 63) - 1
+
+# Prepared statements each connection keeps - room for every statement above
+# plus the ones callers run themselves
+STATEMENT_CACHE_SIZE = 64
+
+
+class LedgerStore():
+    """ Ledger Store class - opens (or creates) the shared ledger database
+    and provides the reads and writes the account classes need
+
+    All ledger reads and writes go through the fixed, parameterized
+    statements above.
+
+    Concurrency Note: Each LedgerStore owns one sqlite connection and is not
+    thread-safe. Several LedgerStore objects (e.g. one per account) can be
+    open on the same file; sqlite serializes their writes.
+    """
+
+    @Metrics.timed('ledger_connect_seconds',
+                   'Time to open and set up a ledger connection')
+    def __init__(self, db_path=DEFAULT_DB, profile=DEFAULT_PROFILE,
+                 check_same_thread=True):
+        """Constructor opens a connection to the ledger database, tunes it as
+        per the durability/performance profile and creates the tables and
+        index if they do not exist yet. check_same_thread=False lets the
+        store be closed from another thread than the one that opened it"""
+
+        if profile not in PROFILES:
+            raise ValueError(f'Unknown ledger profile: {profile!r}. '
+                             f'Choose from {", ".join(PROFILES)}')
+
+        self.db_path = db_path
+        self.profile = profile
+        # True while hold_commits holds back the commits
+        self.__holding = False
+        # Wait up to 30 seconds for other connections to finish writing
+        self.conn = sqlite3.connect(db_path, timeout=30,
+                                    check_same_thread=check_same_thread,
+                                    cached_statements=STATEMENT_CACHE_SIZE)
+        self.cur = self.conn.cursor()
+        for pragma, value in PROFILES[profile].items():
+            self.cur.execute(f'PRAGMA {pragma} = {value}')
+
+        db_version = self.cur.execute('PRAGMA user_version').fetchone()[0]
+        if db_version != SCHEMA_VERSION:
+            db_version = self.__upgrade_schema()
+        if db_version != SCHEMA_VERSION:
+            self.conn.close()
+            raise sqlite3.DatabaseError(
+                f'{db_path} does not have ledger schema version '
+                f'{SCHEMA_VERSION}')
+
+    def __upgrade_schema(self):
+        """ Creates the tables of a new database, or migrates one of an
+        earlier schema version, and returns the schema version found. Runs as
+        one write transaction, so connections opening the same database at
+        once create or migrate it only once"""
+
+        self.cur.execute('BEGIN IMMEDIATE')
+        try:
+            db_version = self.cur.execute(
+                'PRAGMA user_version').fetchone()[0]
+            if db_version == 0:
+                # Refuse to build on top of tables from an older layout
+                if self.cur.execute("SELECT count(*) FROM sqlite_master "
+                                    "WHERE type = 'table'").fetchone()[0]:
+                    db_version = None
+                else:
+                    for create_str in SCHEMA.split(';'):
+                        if create_str.strip():
+                            self.cur.execute(create_str)
+                    self.cur.execute(
+                        f'PRAGMA user_version = {SCHEMA_VERSION}')
+                    db_version = SCHEMA_VERSION
+            while db_version in MIGRATIONS:
+                for migrate_str in MIGRATIONS[db_version]:
+                    self.cur.execute(migrate_str)
+                db_version += 1
+                self.cur.execute(f'PRAGMA user_version = {db_version}')
+            self.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        return db_version
+
+    def __repr__(self):
+        """ Representation of LedgerStore"""
+        return f'LedgerStore({self.db_path!r}, {self.profile!r})'
+
+    @Metrics.timed('ledger_commit_seconds', 'Time of ledger commits')
+    def commit(self):
+        """ Commits the open transaction of the connection, unless
+        hold_commits is holding commits back"""
+        if not self.__holding:
+            self.conn.commit()
+
+    @contextmanager
+    def hold_commits(self):
+        """ Context manager that holds back the commits of the writes made
+        inside the with block and commits them all at once on exit, or rolls
+        them all back if the block raises. Methods that start a transaction
+        of their own (post_transfers, post_accruals, replay_transactions,
+        restore_accounts, read_snapshot, claim_node_id) cannot be called
+        inside it"""
+
+        if self.__holding:
+            # Nested blocks join the outer one
+            yield self
+            return
+
+        self.__holding = True
+        try:
+            yield self
+        except BaseException:
+            self.__holding = False
+            self.conn.rollback()
+            raise
+        self.__holding = False
+        self.commit()
+
+    def create_account(self, account_id, owner, balance):
+        """ Registers a new account with a balance in cents. Raises
+        ValueError if there already is an account with that id - it is left
+        as it was, history and all"""
+
+        try:
+            self.cur.execute(INSERT_ACCOUNT_SQL, (account_id, owner, balance))
+        except sqlite3.IntegrityError:
+            raise ValueError(f'Account {account_id} already exists in '
+                             f'{self.db_path}') from None
+        self.commit()
+
+    def claim_acc_nums(self, count):
+        """ Reserves count consecutive account numbers and returns the first
+        one. Every call gets its own block, also across processes"""
+
+        first_num = self.cur.execute(CLAIM_ACC_NUMS_SQL,
+                                     (count, count)).fetchone()[0]
+        self.commit()
+        return first_num
+
+    def claim_node_id(self, host, pid, num_nodes, is_live):
+        """ Leases a transaction id node number, 0 to num_nodes - 1, to the
+        process pid on host and returns it. Numbers are leased in turn, so
+        the one leased longest ago is reused first. A number leased to
+        another process is only taken over once is_live(host, pid) says that
+        process has ended. Raises RuntimeError if every number is leased to
+        a live process"""
+
+        self.cur.execute('BEGIN IMMEDIATE')
+        try:
+            next_node = self.cur.execute(NEXT_NODE_SQL).fetchone()[0]
+            leases = {node: (lease_host, lease_pid) for node, lease_host,
+                      lease_pid in self.cur.execute(NODE_LEASES_SQL)}
+            for i in range(num_nodes):
+                node = (next_node + i) % num_nodes
+                if node not in leases or not is_live(*leases[node]):
+                    break
+            else:
+                raise RuntimeError(f'All {num_nodes} transaction id nodes of '
+                                   f'{self.db_path} are leased to live '
+                                   f'processes')
+            self.cur.execute(LEASE_NODE_SQL, (node, host, pid))
+            self.cur.execute(SET_NEXT_NODE_SQL, (node + 1,))
+            self.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        return node
+
+    def load_account(self, account_id):
+        """ Returns (owner, balance in cents) of an existing account, None if
+        there is no account with that id"""
+
+        return self.cur.execute(LOAD_ACCOUNT_SQL, (account_id,)).fetchone()
+
+    def insert_transactions(self, account_id, rows, balance):
+        """ Inserts (trans_id, timestamp, remark, amount, running balance)
+        transaction rows for an account and saves its new balance in one
+        transaction. Amounts are signed cents - negative for debits"""
+
+        self.cur.executemany(INSERT_TRANSACTION_SQL,
+                             ((account_id,) + tuple(row) for row in rows))
+        self.cur.execute(UPDATE_BALANCE_SQL, (balance, account_id))
+        self.commit()
+
+    def post_transactions(self, account_id, rows):
+        """ Posts (trans_id, timestamp, remark, amount, running balance)
+        transaction rows of an account in one transaction, moving its balance
+        by their amounts rather than setting it. If the balance was changed
+        meanwhile (e.g. by InterestEngine), the running balances of the rows
+        are moved by the difference. Returns the new balance and the rows as
+        written"""
+
+        rows = [tuple(row) for row in rows]
+        (balance,) = self.cur.execute(
+            POST_BALANCE_SQL, (sum(row[3] for row in rows),
+                               account_id)).fetchone()
+        shift = balance - rows[-1][4]
+        if shift:
+            rows = [row[:4] + (row[4] + shift,) for row in rows]
+        self.cur.executemany(INSERT_TRANSACTION_SQL,
+                             ((account_id,) + row for row in rows))
+        self.commit()
+        return balance, rows
+
+    def replay_transactions(self, rows):
+        """ Writes (account_id, trans_id, ts, remark, amount, balance)
+        transaction rows, in the order they were made, in one transaction,
+        and saves the running balance of the last row of every account as
+        its balance - unless the account has a later transaction on the
+        ledger. Rows whose trans_id is already on the ledger are skipped, so
+        the same rows can be replayed again safely"""
+
+        last_rows = {row[0]: row for row in rows}
+        self.cur.execute('BEGIN IMMEDIATE')
+        try:
+            self.cur.executemany(REPLAY_TRANSACTION_SQL, rows)
+            self.cur.executemany(REPLAY_BALANCE_SQL,
+                                 ((row[5], account_id, account_id, row[1])
+                                  for account_id, row in last_rows.items()))
+            self.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def latest_transactions(self, account_id, limit=10):
+        """ Returns a cursor over the latest transactions of an account, newest
+        first. cursor.description holds the column names"""
+
+        return self.cur.execute(LATEST_TRANSACTIONS_SQL, (account_id, limit))
+
+    def stream_transactions(self, account_id, after_id=None, start_ts=None,
+                            end_ts=None, chunk_size=STREAM_CHUNK_SIZE):
+        """ Generator that yields the transactions of an account, oldest
+        first, as lists of at most chunk_size rows fetched with fetchmany, so
+        memory use does not depend on the length of the history.
+        - after_id: only transactions after this trans_id. Pass the last id
+          of a chunk already seen to pick up where it left off (keyset
+          pagination - no rows are skipped or repeated)
+        - start_ts/end_ts: only transactions with start_ts <= timestamp <
+          end_ts, in epoch seconds
+        The rows come from a single read of the database; writes committed
+        while the generator runs are not included"""
+
+        trans_cur = self.conn.execute(STREAM_TRANSACTIONS_SQL, (
+            account_id,
+            MIN_INTEGER if after_id is None else after_id,
+            MIN_INTEGER if start_ts is None else start_ts,
+            MAX_INTEGER if end_ts is None else end_ts))
+        try:
+            while True:
+                rows = trans_cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            # Ends the read as well if the caller stops early
+            trans_cur.close()
+
+    @contextmanager
+    def read_snapshot(self):
+        """ Context manager - every read made inside the with block sees the
+        database as it was when the block started, even while other
+        connections write to it"""
+
+        self.cur.execute('BEGIN')
+        try:
+            yield self
+        finally:
+            self.commit()
+
+    def all_accounts(self):
+        """ Returns a cursor over (account_id, owner, balance) of every
+        account, in account id order"""
+        return self.conn.execute(ALL_ACCOUNTS_SQL)
+
+    def count_transactions(self):
+        """ Returns the number of transactions of all accounts"""
+        return self.cur.execute(COUNT_TRANSACTIONS_SQL).fetchone()[0]
+
+    def stream_ledger(self, chunk_size=STREAM_CHUNK_SIZE):
+        """ Generator that yields the (account_id, trans_id, ts, remark,
+        amount, balance) rows of every account, ordered by account id and
+        then transaction id, as lists of at most chunk_size rows"""
+
+        trans_cur = self.conn.execute(ALL_TRANSACTIONS_SQL)
+        try:
+            while True:
+                rows = trans_cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            trans_cur.close()
+
+    def restore_accounts(self, accounts, transaction_chunks, min_acc_num=0):
+        """ Bulk loads (account_id, owner, balance) accounts and lists of
+        (account_id, trans_id, ts, remark, amount, balance) transaction rows
+        in one write transaction. Accounts with the same id are replaced,
+        along with their history. The covering index is dropped during the
+        load and built again once at the end, which is much faster than
+        updating it row by row. Account numbers handed out from then on
+        start at min_acc_num or above"""
+
+        accounts = list(accounts)
+        self.cur.execute('BEGIN IMMEDIATE')
+        try:
+            self.cur.executemany(DELETE_HISTORY_SQL,
+                                 ((account[0],) for account in accounts))
+            self.cur.executemany(DELETE_ACCRUAL_SQL,
+                                 ((account[0],) for account in accounts))
+            self.cur.execute('DROP INDEX ix_transactions_account_id')
+            self.cur.executemany(REPLACE_ACCOUNT_SQL, accounts)
+            for rows in transaction_chunks:
+                self.cur.executemany(INSERT_TRANSACTION_SQL, rows)
+            self.cur.execute(TRANSACTIONS_INDEX_SQL)
+            self.cur.execute(RAISE_ACC_NUM_SQL, (min_acc_num,))
+            self.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def account_ids(self, prefix):
+        """ Returns the ids of all accounts that start with prefix (e.g.
+        'SAV_'), in order"""
+
+        # Every id starting with prefix sorts between prefix and prefix with
+        # its last character bumped
+        end = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return [row[0] for row in
+                self.conn.execute(ACCOUNT_IDS_SQL, (prefix, end))]
+
+    def total_balance(self, prefix=''):
+        """ Returns the number of accounts whose id starts with prefix (e.g.
+        'SAV_'), all accounts by default, and their balances in total in
+        cents"""
+
+        if not prefix:
+            return self.cur.execute(TOTAL_BALANCE_SQL).fetchone()
+        end = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return self.cur.execute(TOTAL_BALANCE_RANGE_SQL,
+                                (prefix, end)).fetchone()
+
+    def accrual_balances(self, first_id, last_id, day):
+        """ Returns (account_id, balance) of the accounts with ids from
+        first_id to last_id that have not been accrued interest for day
+        yet"""
+        return self.conn.execute(ACCRUAL_BALANCES_SQL,
+                                 (first_id, last_id, day)).fetchall()
+
+    def post_accruals(self, day, credits):
+        """ Posts interest for day in one write transaction. credits are
+        (account_id, balance, trans_id, ts, remark, amount) items, with the
+        balance the amount was worked out on. Accounts whose balance has
+        changed since are left out, to be worked out again; accounts accrued
+        for day in the meantime are skipped. Every other account gets a
+        transaction row (if the amount is not 0) and is marked as accrued for
+        day. Returns (accrued, changed) - the (account_id, amount) of every
+        account accrued and the ids of the changed ones"""
+
+        accrued, changed, trans_rows, balances = [], [], [], []
+        self.cur.execute('BEGIN IMMEDIATE')
+        try:
+            for account_id, balance, trans_id, ts, remark, amt in credits:
+                state = self.cur.execute(ACCRUAL_STATE_SQL,
+                                         (account_id,)).fetchone()
+                if state is None or state[1] is not None and state[1] >= day:
+                    continue
+                if state[0] != balance:
+                    changed.append(account_id)
+                    continue
+                if amt:
+                    trans_rows.append((account_id, trans_id, ts, remark, amt,
+                                       balance + amt))
+                    balances.append((amt, account_id))
+                accrued.append((account_id, amt))
+            self.cur.executemany(INSERT_TRANSACTION_SQL, trans_rows)
+            self.cur.executemany(CREDIT_ACCOUNT_SQL, balances)
+            self.cur.executemany(MARK_ACCRUAL_SQL,
+                                 ((account_id, day) for account_id, _ in
+                                  accrued))
+            self.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        return accrued, changed
+
+    def post_transfers(self, transfers):
+        """ Posts (src_id, dst_id, amount, out_trans_id, in_trans_id, ts)
+        transfers in one write transaction, in order. Each moves amount
+        cents from src_id to dst_id and records both legs, if the source
+        balance covers it at that point. Returns, per transfer, the new
+        (src_balance, dst_balance), or None if it was refused - amount not
+        positive, source and destination the same, an account missing or
+        the source short of funds"""
+
+        results, trans_rows = [], []
+        self.cur.execute('BEGIN IMMEDIATE')
+        try:
+            for src_id, dst_id, amt, out_id, in_id, ts in transfers:
+                if amt <= 0 or src_id == dst_id:
+                    results.append(None)
+                    continue
+                src_row = self.cur.execute(TRANSFER_OUT_SQL,
+                                           (amt, src_id, amt)).fetchone()
+                if src_row is None:
+                    results.append(None)
+                    continue
+                dst_row = self.cur.execute(TRANSFER_IN_SQL,
+                                           (amt, dst_id)).fetchone()
+                if dst_row is None:
+                    # No such destination - give the money back
+                    self.cur.execute(TRANSFER_IN_SQL, (amt, src_id))
+                    results.append(None)
+                    continue
+                trans_rows += [(src_id, out_id, ts, TRANSFER_OUT_REMARK, -amt,
+                                src_row[0]),
+                               (dst_id, in_id, ts, TRANSFER_IN_REMARK, amt,
+                                dst_row[0])]
+                results.append((src_row[0], dst_row[0]))
+            self.cur.executemany(INSERT_TRANSACTION_SQL, trans_rows)
+            self.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        return results
+
+    def checkpoint(self):
+        """ Copies the write-ahead log back into the database and truncates
+        it, e.g. at the end of a bulk load. Returns False if readers or
+        writers on other connections kept it from finishing"""
+        return self.cur.execute(
+            'PRAGMA wal_checkpoint(TRUNCATE)').fetchone()[0] == 0
+
+    def close(self):
+        """ Closes the database connection when called"""
+        self.conn.close()
+
+
+# Unit Tests
+if __name__ == '__main__':
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, 'test_ledger.db')
+        store = LedgerStore(db_file)
+
+        # Constructor tests
+        assert os.path.exists(db_file), "Database was not created!"
+        assert store.cur.execute('PRAGMA journal_mode').fetchone()[0] == \
+            'wal', "Ledger database is not in WAL mode!"
+        # synchronous NORMAL is 1
+        assert store.cur.execute('PRAGMA synchronous').fetchone()[0] == 1, \
+            "Default profile did not set synchronous = NORMAL"
+        index_names = [i[1] for i in store.cur.execute(
+            "PRAGMA index_list('transactions')")]
+        assert 'ix_transactions_account_id' in index_names, \
+            "Covering index on (account_id, trans_id) was not created!"
+
+        # Accounts are kept side by side in one schema
+        store.create_account('CHK_100001', 'John Doe', 10000)
+        store.create_account('SAV_100001', 'John Doe', 50000)
+        store.insert_transactions(
+            'CHK_100001',
+            [(1001, 1618740000, 'Credit', 5000, 15000),
+             (1002, 1618740000, 'Debit', -2500, 12500)],
+            12500)
+        assert store.load_account('CHK_100001') == ('John Doe', 12500), \
+            "Balance was not saved with the transaction"
+        assert store.load_account('SAV_100001') == ('John Doe', 50000), \
+            "Accounts are not kept apart"
+        assert store.load_account('CHK_999999') is None, \
+            "Unknown account should load as None"
+        assert store.latest_transactions('CHK_100001').fetchall() == \
+            [(1002, 1618740000, 'Debit', -2500, 12500),
+             (1001, 1618740000, 'Credit', 5000, 15000)], \
+            "Transactions were not returned newest first"
+        assert len(store.latest_transactions('SAV_100001').fetchall()) == 0, \
+            "Transaction recorded against the wrong account"
+        assert store.cur.execute(
+            'SELECT sum(amount) FROM transactions').fetchone()[0] == 2500, \
+            "Amounts should be stored as numbers"
+
+        # Account numbers are handed out in blocks that never overlap
+        first_block = store.claim_acc_nums(100)
+        assert first_block == 100001, "Account numbers should start at 100001"
+        assert store.claim_acc_nums(10) == first_block + 100, \
+            "Account number blocks overlap"
+
+        # Node numbers are leased in turn, and only taken over from processes
+        # that have ended
+        live_pids = {1, 2, 3}
+
+        def lease(pid):
+            """ Leases one of 3 node numbers to a process on 'host'"""
+            return store.claim_node_id('host', pid, 3,
+                                       lambda host, pid: pid in live_pids)
+
+        assert [lease(pid) for pid in (1, 2, 3)] == [0, 1, 2], \
+            "Node numbers were not leased in turn"
+        try:
+            lease(4)
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("Node number of a live process was taken")
+        live_pids.discard(2)
+        assert lease(4) == 1, "Node number of an ended process was not reused"
+        assert store.cur.execute(
+            'SELECT pid FROM node_leases ORDER BY node_id').fetchall() == \
+            [(1,), (4,), (3,)], "Lease was not recorded"
+
+        # Statements are read from the covering index, without a sort
+        query_plan = ' '.join(i[3] for i in store.cur.execute(
+            'EXPLAIN QUERY PLAN ' + LATEST_TRANSACTIONS_SQL,
+            ('CHK_100001', 10)))
+        assert 'COVERING INDEX ix_transactions_account_id' in query_plan \
+            and 'TEMP B-TREE' not in query_plan, \
+            f"Statement query does not use the covering index: {query_plan}"
+
+        # Full statements stream in chunks, with keyset pagination and
+        # timestamp filters
+        store.insert_transactions(
+            'SAV_100001',
+            [(2000 + i, 1618740000 + i * 3600, 'Credit', 100, 50100 + i * 100)
+             for i in range(25)], 52500)
+        chunks = list(store.stream_transactions('SAV_100001', chunk_size=10))
+        assert [len(chunk) for chunk in chunks] == [10, 10, 5], \
+            "Statement was not streamed in chunks"
+        assert [row[0] for chunk in chunks for row in chunk] == \
+            list(range(2000, 2025)), "Streamed statement is not oldest first"
+        resumed = [row for chunk in store.stream_transactions(
+            'SAV_100001', after_id=chunks[0][-1][0]) for row in chunk]
+        assert resumed == chunks[1] + chunks[2], \
+            "Keyset pagination skipped or repeated rows"
+        in_range = [row[1] for chunk in store.stream_transactions(
+            'SAV_100001', start_ts=1618740000 + 3600,
+            end_ts=1618740000 + 4 * 3600) for row in chunk]
+        assert in_range == [1618740000 + i * 3600 for i in (1, 2, 3)], \
+            "Timestamp filter returned the wrong rows"
+        assert list(store.stream_transactions('CHK_999999')) == [], \
+            "Unknown account should stream nothing"
+        stream = store.stream_transactions('SAV_100001', chunk_size=1)
+        next(stream)
+        stream.close()
+
+        # Interest is posted only on the balance it was worked out on, and
+        # once a day
+        store.create_account('SAV_100002', 'Jane Doe', 1000)
+        assert store.account_ids('SAV_') == ['SAV_100001', 'SAV_100002'], \
+            "Account ids by prefix are wrong"
+        assert store.accrual_balances('SAV_', 'SAV_999999', 18718) == \
+            [('SAV_100001', 52500), ('SAV_100002', 1000)], \
+            "Accrual balances are wrong"
+        assert store.post_accruals(18718, [
+            ('SAV_100001', 52500, 3001, 1618740000, 'Interest', 3),
+            ('SAV_100002', 999, 3002, 1618740000, 'Interest', 1)]) == \
+            ([('SAV_100001', 3)], ['SAV_100002']), \
+            "Changed balance was not caught"
+        assert store.post_accruals(18718, [
+            ('SAV_100001', 52500, 3003, 1618740000, 'Interest', 3),
+            ('SAV_100002', 1000, 3004, 1618740000, 'Interest', 0)]) == \
+            ([('SAV_100002', 0)], []), "Accrual was not posted"
+        assert store.load_account('SAV_100001')[1] == 52503 and \
+            store.latest_transactions('SAV_100001', 1).fetchall() == \
+            [(3001, 1618740000, 'Interest', 3, 52503)], \
+            "Interest was not credited exactly once"
+        assert store.accrual_balances('SAV_', 'SAV_999999', 18718) == [], \
+            "Accrued accounts should be left out"
+
+        # Replayed rows are written once, however often they are replayed
+        replay_rows = [('SAV_100002', 4001, 1618740000, 'Credit', 500, 1500),
+                       ('SAV_100002', 4002, 1618740000, 'Debit', -200, 1300)]
+        store.replay_transactions(replay_rows[:1])
+        store.replay_transactions(replay_rows)
+        assert store.load_account('SAV_100002')[1] == 1300 and \
+            store.cur.execute('SELECT count(*) FROM transactions WHERE '
+                              'trans_id > 4000').fetchone()[0] == 2, \
+            "Replayed rows were written twice or the balance is wrong"
+        store.replay_transactions(replay_rows[:1])
+        assert store.load_account('SAV_100002')[1] == 1300, \
+            "Replaying older rows set the balance back"
+
+        # Transfers post both legs or neither
+        store.create_account('CHK_100002', 'Jane Doe', 5000)
+        assert store.post_transfers([
+            ('CHK_100002', 'SAV_100002', 2000, 5001, 5002, 1618740000),
+            ('CHK_100002', 'SAV_100002', 3001, 5003, 5004, 1618740000),
+            ('CHK_100002', 'SAV_999999', 100, 5005, 5006, 1618740000),
+            ('CHK_100002', 'CHK_100002', 100, 5007, 5008, 1618740000),
+            ('CHK_100002', 'SAV_100002', 3000, 5009, 5010, 1618740000)]) == \
+            [(3000, 3300), None, None, None, (0, 6300)], \
+            "Transfers were not checked in order"
+        assert store.load_account('CHK_100002')[1] == 0 and \
+            store.cur.execute('SELECT count(*), sum(amount) FROM transactions '
+                              'WHERE trans_id BETWEEN 5001 AND 5010'
+                              ).fetchone() == (4, 0), \
+            "Refused transfers left a leg behind"
+        assert store.latest_transactions('SAV_100002', 1).fetchall() == \
+            [(5010, 1618740000, 'Transfer In', 3000, 6300)], \
+            "Transfer leg was not recorded"
+
+        # Posts move the balance by their amounts, so a credit written in
+        # between is kept and the running balances follow it
+        assert store.post_transactions(
+            'CHK_100002', [(5011, 1618740000, 'Credit', 500, 500)]) == \
+            (500, [(5011, 1618740000, 'Credit', 500, 500)]), \
+            "Post was not written"
+        store.cur.execute(CREDIT_ACCOUNT_SQL, (7, 'CHK_100002'))
+        assert store.post_transactions(
+            'CHK_100002', [(5012, 1618740000, 'Credit', 100, 600),
+                           (5013, 1618740000, 'Debit', -200, 400)]) == \
+            (407, [(5012, 1618740000, 'Credit', 100, 607),
+                   (5013, 1618740000, 'Debit', -200, 407)]), \
+            "Post overwrote a credit made in between"
+        assert store.load_account('CHK_100002')[1] == 407, \
+            "Posted balance was not saved"
+
+        # Values are bound, never pasted into the SQL
+        store.create_account("CHK_'); DROP TABLE accounts; --", 'Mallory', 0)
+        assert store.load_account("CHK_'); DROP TABLE accounts; --") == \
+            ('Mallory', 0), "Account id was not stored as a plain value"
+        assert store.load_account('CHK_100001') is not None, \
+            "Account id was run as SQL"
+
+        # Accounts and history survive reopening the database
+        store.close()
+        store = LedgerStore(db_file)
+        assert store.load_account('CHK_100001') == ('John Doe', 12500), \
+            "Account was not persisted"
+        assert len(store.latest_transactions('CHK_100001').fetchall()) == 2, \
+            "Transactions were not persisted"
+
+        # Creating an account id that exists fails and leaves the account,
+        # and its history, as they were
+        try:
+            store.create_account('CHK_100001', 'Jane Doe', 1000)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Existing account was created again")
+        store.close()
+        store = LedgerStore(db_file)
+        assert store.load_account('CHK_100001') == ('John Doe', 12500), \
+            "Existing account was replaced"
+        assert len(store.latest_transactions('CHK_100001').fetchall()) == 2, \
+            "Existing account lost its history"
+        store.close()
+
+        # Profiles set their own pragmas on the connection
+        for profile_name, sync_level in (('strict', 2), ('bulk', 0)):
+            store = LedgerStore(db_file, profile_name)
+            assert store.cur.execute('PRAGMA synchronous').fetchone()[0] == \
+                sync_level, f"Profile {profile_name} has the wrong synchronous"
+            assert store.cur.execute(
+                'PRAGMA wal_autocheckpoint').fetchone()[0] == \
+                PROFILES[profile_name]['wal_autocheckpoint'], \
+                f"Profile {profile_name} has the wrong checkpoint cadence"
+            assert store.checkpoint(), "Checkpoint did not finish"
+            store.close()
+        try:
+            LedgerStore(db_file, 'fastest')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Unknown profile should raise ValueError")
+
+        # Held commits are made once at the end of the block, or rolled back
+        held_file = os.path.join(tmp_dir, 'held_ledger.db')
+        store = LedgerStore(held_file)
+        other = LedgerStore(held_file)
+        with store.hold_commits():
+            store.create_account('CHK_100001', 'John Doe', 100)
+            store.create_account('SAV_100001', 'John Doe', 200)
+            with store.hold_commits():
+                store.insert_transactions(
+                    'CHK_100001', [(1001, 1618740000, 'Credit', 50, 150)], 150)
+            assert other.total_balance() == (0, 0), \
+                "Held commit was visible before the end of the block"
+        assert other.total_balance() == (2, 350) and \
+            other.total_balance('SAV_') == (1, 200), \
+            "Held commits were not made at the end of the block"
+        try:
+            with store.hold_commits():
+                store.create_account('CHK_100002', 'Jane Doe', 100)
+                raise ValueError
+        except ValueError:
+            pass
+        assert other.total_balance('CHK_') == (1, 150), \
+            "Writes of a failed block were not rolled back"
+        store.create_account('CHK_100003', 'Jane Doe', 100)
+        assert other.total_balance('CHK_') == (2, 250), \
+            "Commits are still held after the block"
+        store.close()
+        other.close()
+
+        # Databases of schema version 3 are migrated
+        v3_file = os.path.join(tmp_dir, 'v3_ledger.db')
+        v3_conn = sqlite3.connect(v3_file)
+        for create_str in SCHEMA.split(';'):
+            if create_str.strip() and 'accruals' not in create_str and \
+                    'node_' not in create_str:
+                v3_conn.execute(create_str)
+        v3_conn.commit()
+        v3_conn.execute('PRAGMA user_version = 3')
+        v3_conn.close()
+        store = LedgerStore(v3_file)
+        assert store.cur.execute('PRAGMA user_version').fetchone()[0] == \
+            SCHEMA_VERSION and store.account_ids('SAV_') == [], \
+            "Version 3 database was not migrated"
+        assert store.claim_node_id('host', 1, 1024, lambda *owner: True) == \
+            0, "Node leases were not migrated"
+        store.close()
+
+        # Databases with another layout are refused
+        old_file = os.path.join(tmp_dir, 'old_ledger.db')
+        old_conn = sqlite3.connect(old_file)
+        old_conn.execute('CREATE TABLE CHK_100001 ("Trans.ID" text)')
+        old_conn.close()
+        try:
+            LedgerStore(old_file)
+        except sqlite3.DatabaseError:
+            pass
+        else:
+            raise AssertionError("Database with an old layout was accepted")
+
+    # All tests passed!
+    print("\nAll LedgerStore unit tests passed!")
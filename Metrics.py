@@ -0,0 +1,362 @@
+"""
+Term Project - Bank Account Manager (ATM Style)
+
+This file contains the in-process metrics registry - counters and latency
+histograms of the account operations (deposit, withdraw, mini_statement),
+ledger connects and commits, transaction id generation and statement
+rendering.
+
+Metrics are off by default and are turned on and off at runtime with
+enable() and disable(). While they are off, an instrumented call costs one
+extra function call and a flag check. The registry can be dumped in the
+Prometheus text format or as JSON at any time.
+
+Setting the environment variable BANK_METRICS to a file path turns metrics
+on from the start and dumps them to that file when the program exits.
+"""
+import os
+import atexit
+import time
+import bisect
+import threading
+import functools
+
+# Environment variable naming the file metrics are dumped to at exit
+METRICS_ENV = 'BANK_METRICS'
+
+# Upper bounds of the latency histogram buckets, in seconds - 10 microseconds
+# to 10 seconds
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                   0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+
+class Counter():
+    """ Counter class - a count that only goes up, e.g. of rejected
+    withdrawals. Thread-safe"""
+
+    def __init__(self, registry, name, help_text):
+        """Constructor registers nothing - use MetricsRegistry.counter"""
+
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+        self.__lock = threading.Lock()
+
+    def __repr__(self):
+        """ Representation of Counter"""
+        return f'Counter({self.name!r}, {self.value})'
+
+    def inc(self, amount=1):
+        """ Adds amount to the count, if metrics are enabled"""
+        if self.registry.enabled:
+            with self.__lock:
+                self.value += amount
+
+    def reset(self):
+        """ Sets the count back to 0"""
+        with self.__lock:
+            self.value = 0
+
+    def prometheus_lines(self):
+        """ Returns the counter in the Prometheus text format"""
+        return [f'# HELP {self.name} {self.help_text}',
+                f'# TYPE {self.name} counter', f'{self.name} {self.value}']
+
+    def as_dict(self):
+        """ Returns the counter as a dictionary, for JSON"""
+        return {'type': 'counter', 'help': self.help_text,
+                'value': self.value}
+
+
+class Histogram():
+    """ Histogram class - counts observations (e.g. latencies in seconds)
+    into buckets with fixed upper bounds and keeps their count and sum.
+    Thread-safe"""
+
+    def __init__(self, registry, name, help_text, buckets=LATENCY_BUCKETS):
+        """Constructor registers nothing - use MetricsRegistry.histogram"""
+
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def __repr__(self):
+        """ Representation of Histogram"""
+        return f'Histogram({self.name!r}, count={self.count})'
+
+    def observe(self, value):
+        """ Records one observation, if metrics are enabled"""
+        if self.registry.enabled:
+            # The last slot counts observations above every bound
+            slot = bisect.bisect_left(self.buckets, value)
+            with self.__lock:
+                self.counts[slot] += 1
+                self.count += 1
+                self.sum += value
+
+    def reset(self):
+        """ Clears every observation"""
+        with self.__lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.count = 0
+            self.sum = 0.0
+
+    def cumulative_counts(self):
+        """ Returns (upper bound, observations up to it) of every bucket,
+        ending with ('+Inf', count)"""
+
+        with self.__lock:
+            counts, count = list(self.counts), self.count
+        running, cumulative = 0, []
+        for bound, bucket_count in zip(self.buckets, counts):
+            running += bucket_count
+            cumulative.append((bound, running))
+        return cumulative + [('+Inf', count)]
+
+    def prometheus_lines(self):
+        """ Returns the histogram in the Prometheus text format"""
+
+        lines = [f'# HELP {self.name} {self.help_text}',
+                 f'# TYPE {self.name} histogram']
+        lines += [f'{self.name}_bucket{{le="{bound}"}} {bucket_count}'
+                  for bound, bucket_count in self.cumulative_counts()]
+        return lines + [f'{self.name}_sum {self.sum!r}',
+                        f'{self.name}_count {self.count}']
+
+    def as_dict(self):
+        """ Returns the histogram as a dictionary, for JSON. mean is in the
+        unit of the observations, None before the first one"""
+
+        return {'type': 'histogram', 'help': self.help_text,
+                'count': self.count, 'sum': self.sum,
+                'mean': self.sum / self.count if self.count else None,
+                'buckets': {str(bound): bucket_count for bound, bucket_count
+                            in self.cumulative_counts()}}
+
+
+class MetricsRegistry():
+    """ Metrics Registry class - holds the counters and histograms of a
+    process by name and dumps them. Recording is off until enable() is
+    called.
+
+    Concurrency Note: Thread-safe. Metrics are per process; worker processes
+    (e.g. of InterestEngine) keep their own.
+    """
+
+    def __init__(self):
+        """Constructor starts an empty, disabled registry"""
+
+        self.enabled = False
+        self.__metrics = {}
+        self.__lock = threading.Lock()
+
+    def __repr__(self):
+        """ Representation of MetricsRegistry"""
+        return f'MetricsRegistry({len(self.__metrics)} metrics, ' \
+               f'enabled={self.enabled})'
+
+    def __get(self, metric_cls, name, help_text, *args):
+        """ Returns the metric registered under name, creating it first if
+        needed"""
+
+        with self.__lock:
+            metric = self.__metrics.get(name)
+            if metric is None:
+                metric = self.__metrics[name] = metric_cls(self, name,
+                                                           help_text, *args)
+            elif type(metric) is not metric_cls:
+                raise ValueError(f'{name} is already registered as a '
+                                 f'{type(metric).__name__}')
+        return metric
+
+    def counter(self, name, help_text=''):
+        """ Returns the counter registered under name"""
+        return self.__get(Counter, name, help_text)
+
+    def histogram(self, name, help_text='', buckets=LATENCY_BUCKETS):
+        """ Returns the histogram registered under name"""
+        return self.__get(Histogram, name, help_text, buckets)
+
+    def enable(self):
+        """ Starts recording"""
+        self.enabled = True
+
+    def disable(self):
+        """ Stops recording; what was recorded so far is kept"""
+        self.enabled = False
+
+    def reset(self):
+        """ Clears every metric"""
+        with self.__lock:
+            metrics = list(self.__metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+    def prometheus_text(self):
+        """ Returns every metric in the Prometheus text exposition format"""
+        with self.__lock:
+            metrics = sorted(self.__metrics.items())
+        return ''.join(line + '\n' for _, metric in metrics
+                       for line in metric.prometheus_lines())
+
+    def as_dict(self):
+        """ Returns every metric as a dictionary keyed by name"""
+        with self.__lock:
+            metrics = sorted(self.__metrics.items())
+        return {name: metric.as_dict() for name, metric in metrics}
+
+    def to_json(self):
+        """ Returns every metric as a JSON string"""
+        import json  # only needed for dumps, kept off the startup path
+        return json.dumps(self.as_dict(), indent=2)
+
+    def timed(self, name, help_text=''):
+        """ Decorator that records the time every call of the function takes
+        in the histogram name, in seconds. While metrics are disabled the
+        function is called straight through"""
+
+        histogram = self.histogram(name, help_text)
+
+        def decorate(func):
+            @functools.wraps(func)
+            def timed_func(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+            return timed_func
+        return decorate
+
+
+# Registry of the process - the account classes, LedgerStore and the ATM
+# record into it
+REGISTRY = MetricsRegistry()
+
+
+def enable():
+    """ Function that starts recording into the process registry"""
+    REGISTRY.enable()
+
+
+def disable():
+    """ Function that stops recording into the process registry"""
+    REGISTRY.disable()
+
+
+def timed(name, help_text=''):
+    """ Function that returns a decorator timing calls into a histogram of
+    the process registry (see MetricsRegistry.timed)"""
+    return REGISTRY.timed(name, help_text)
+
+
+def counter(name, help_text=''):
+    """ Function that returns a counter of the process registry"""
+    return REGISTRY.counter(name, help_text)
+
+
+def dump(path, registry=REGISTRY):
+    """ Function that writes the metrics to path - as JSON if it ends in
+    .json, else in the Prometheus text format (e.g. for the node exporter's
+    textfile collector). The file is replaced in one step, so readers never
+    see half of it"""
+
+    text = registry.to_json() if path.endswith('.json') else \
+        registry.prometheus_text()
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as dump_file:
+        dump_file.write(text)
+    os.replace(tmp_path, path)
+
+
+if os.environ.get(METRICS_ENV):
+    enable()
+    atexit.register(dump, os.environ[METRICS_ENV])
+
+
+# Unit Tests
+if __name__ == '__main__':
+    import json
+
+    registry = MetricsRegistry()
+    rejected = registry.counter('account_rejected_total', 'Rejected calls')
+
+    @registry.timed('op_seconds', 'Time of op')
+    def op(wait):
+        """ Instrumented test function"""
+        time.sleep(wait)
+        return wait
+
+    # Nothing is recorded while disabled
+    assert op(0) == 0 and op.__name__ == 'op', "Decorator changed the call"
+    rejected.inc()
+    assert registry.as_dict()['op_seconds']['count'] == 0 and \
+        rejected.value == 0, "Disabled registry recorded a metric"
+
+    # Enabled, every call is timed into its bucket
+    registry.enable()
+    for wait in (0, 0.002, 0.02):
+        op(wait)
+    rejected.inc(2)
+    op_metric = registry.as_dict()['op_seconds']
+    assert op_metric['count'] == 3 and op_metric['sum'] >= 0.022, \
+        "Calls were not timed"
+    assert op_metric['buckets']['0.0025'] >= 1 and \
+        op_metric['buckets']['0.01'] == 2 and \
+        op_metric['buckets']['+Inf'] == 3, "Buckets are not cumulative"
+    assert registry.counter('account_rejected_total') is rejected and \
+        rejected.value == 2, "Counter was not shared by name"
+    try:
+        registry.histogram('account_rejected_total')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Name of another metric type was reused")
+
+    # Prometheus text and JSON dumps
+    prom_lines = registry.prometheus_text().splitlines()
+    assert prom_lines[:3] == ['# HELP account_rejected_total Rejected calls',
+                              '# TYPE account_rejected_total counter',
+                              'account_rejected_total 2'], \
+        "Counter dump is wrong"
+    assert '# TYPE op_seconds histogram' in prom_lines and \
+        'op_seconds_bucket{le="+Inf"} 3' in prom_lines and \
+        'op_seconds_count 3' in prom_lines, "Histogram dump is wrong"
+    assert json.loads(registry.to_json())['account_rejected_total'][
+        'value'] == 2, "JSON dump is wrong"
+
+    # Disabling keeps what was recorded, reset clears it
+    registry.disable()
+    op(0)
+    assert registry.as_dict()['op_seconds']['count'] == 3, \
+        "Disabled registry recorded a call"
+    registry.reset()
+    assert registry.as_dict()['op_seconds']['count'] == 0 and \
+        rejected.value == 0, "Reset did not clear the metrics"
+
+    # Dumps replace the file in one step
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        registry.enable()
+        op(0)
+        dump(os.path.join(tmp_dir, 'metrics.prom'), registry)
+        dump(os.path.join(tmp_dir, 'metrics.json'), registry)
+        with open(os.path.join(tmp_dir, 'metrics.prom')) as prom_file:
+            assert 'op_seconds_count 1\n' in prom_file.read(), \
+                "Prometheus dump file is wrong"
+        with open(os.path.join(tmp_dir, 'metrics.json')) as json_file:
+            assert json.load(json_file)['op_seconds']['count'] == 1, \
+                "JSON dump file is wrong"
+        assert sorted(os.listdir(tmp_dir)) == ['metrics.json',
+                                               'metrics.prom'], \
+            "Dump left a temporary file behind"
+
+    # All tests passed!
+    print("\nAll Metrics unit tests passed!")
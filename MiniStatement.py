@@ -0,0 +1,182 @@
+"""
+Term Project - Bank Account Manager (ATM Style)
+
+This file contains the rendering of the mini statement for the terminal -
+formatting its rows and laying them out with tabulate in its "presto"
+format - and the StatementRenderer class, which keeps the tables it has
+rendered so that an unchanged statement is not rendered again.
+
+tabulate is imported when the first statement is rendered, not at import.
+"""
+import time
+from collections import OrderedDict
+
+import Metrics
+import Profiling
+from Money import format_cents
+from TransIdGenerator import encode as encode_id
+
+# Rendered tables a StatementRenderer keeps
+STATEMENT_CACHE_SIZE = 1024
+
+
+def format_statement(stmt_list):
+    """ Function that formats the rows of a mini statement for display -
+    transaction ids in their base32 form, epoch timestamps as local date and
+    time and cents as dollar amounts. Debits and outgoing transfers are
+    recorded as negative amounts and are shown without the sign"""
+
+    # Keep the header row as is
+    return [stmt_list[0]] + [format_row(row) for row in stmt_list[1:]]
+
+
+def format_row(stmt_row):
+    """ Function that formats one transaction of a mini statement (see
+    format_statement)"""
+
+    trans_id, timestamp, trans_remark, trans_amt, curr_bal = stmt_row
+    if trans_amt < 0:
+        trans_amt = -trans_amt
+    return [encode_id(trans_id),
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)),
+            trans_remark,
+            format_cents(trans_amt),
+            format_cents(curr_bal)]
+
+
+def render_statement(stmt_list):
+    """ Function that renders a mini statement as a table for the terminal
+    with tabulate"""
+    from tabulate import tabulate
+    return tabulate(format_statement(stmt_list), headers="firstrow",
+                    numalign="center", stralign="center", tablefmt="presto")
+
+
+class StatementRenderer():
+    """ Statement Renderer class - renders the mini statements of accounts
+    with render_statement and keeps the tables, least recently used first,
+    up to max_tables of them.
+
+    A table is kept under the account id and the id of the newest
+    transaction on it. Transaction ids are never reused and the rows of a
+    transaction never change, so the pair stands for the whole statement:
+    asking again for a statement with no new transaction returns the kept
+    table, whichever Account instance it is read from.
+    """
+
+    def __init__(self, max_tables=STATEMENT_CACHE_SIZE):
+        """Constructor starts with nothing rendered"""
+
+        self.max_tables = max_tables
+        # (tb_name, newest trans_id): table
+        self.__tables = OrderedDict()
+
+    def __repr__(self):
+        """ Representation of StatementRenderer"""
+        return f'StatementRenderer({len(self.__tables)} tables)'
+
+    def __len__(self):
+        """ Number of tables kept"""
+        return len(self.__tables)
+
+    @Metrics.timed('atm_statement_renderer_seconds',
+                   'Time of StatementRenderer.render, kept tables included')
+    @Profiling.profiled('statement_renderer')
+    def render(self, acc, stmt_list=None):
+        """ Returns the mini statement of acc as a table, '' if it has no
+        transactions. stmt_list, if given, is the current mini statement of
+        acc (e.g. read on another thread); by default it is read here"""
+
+        if stmt_list is None:
+            stmt_list = acc.mini_statement()
+        if not stmt_list:
+            return ''
+
+        key = (acc.tb_name, stmt_list[1][0])
+        table = self.__tables.get(key)
+        if table is None:
+            table = self.__tables[key] = render_statement(stmt_list)
+            if len(self.__tables) > self.max_tables:
+                self.__tables.popitem(last=False)
+        else:
+            self.__tables.move_to_end(key)
+        return table
+
+
+# Unit Tests
+if __name__ == '__main__':
+    import random
+
+    class FakeAccount():
+        """ Account stand-in with a mini statement kept in a list"""
+
+        def __init__(self, tb_name='CHK_100001'):
+            self.tb_name = tb_name
+            self.rows = []
+            self.reads = 0
+
+        def add(self, amt):
+            """ Records a transaction"""
+            balance = (self.rows[0][4] if self.rows else 0) + amt
+            self.rows = [[random.getrandbits(62), 1700000000 + len(self.rows),
+                          random.choice(['Credit', 'Debit', 'Transfer In']),
+                          amt, balance]] + self.rows[:9]
+
+        def mini_statement(self):
+            """ Returns the header and the rows, newest first"""
+            self.reads += 1
+            if not self.rows:
+                return []
+            return [['Trans.ID', 'Timestamp', 'Remark', 'Trans. Amt',
+                     'Running Bal.']] + [list(row) for row in self.rows]
+
+    # Amounts are shown without the sign, ids in base32
+    fmt_list = format_statement([['Trans.ID', 'Timestamp', 'Remark',
+                                  'Trans. Amt', 'Running Bal.'],
+                                 [1, 0, 'Debit', -12345, 100]])
+    assert fmt_list[1][0] == encode_id(1) and \
+        fmt_list[1][2:] == ['Debit', '$123.45', '$1.00'], \
+        "Statement row was not formatted"
+
+    renderer = StatementRenderer()
+    acc = FakeAccount()
+    assert renderer.render(acc) == '', "Empty statement was rendered"
+
+    # An unchanged statement is answered from the kept table
+    random.seed(1)
+    acc.add(500)
+    table = renderer.render(acc)
+    assert table == render_statement(acc.mini_statement()) and \
+        renderer.render(acc) is table, "Unchanged statement was rendered again"
+    acc.add(-200)
+    assert renderer.render(acc) == render_statement(acc.mini_statement()) \
+        and renderer.render(acc) is not table, "Changed statement was kept"
+
+    # A statement read elsewhere can be passed in
+    acc.add(5)
+    stmt_list = acc.mini_statement()
+    reads = acc.reads
+    assert renderer.render(acc, stmt_list) == render_statement(stmt_list) \
+        and acc.reads == reads, "Passed in statement was read again"
+
+    # Another instance of the same account with other transactions gets its
+    # own table
+    other = FakeAccount()
+    other.add(500)
+    assert renderer.render(other) == render_statement(other.mini_statement()), \
+        "Table of another instance of the account was returned"
+
+    # Only max_tables are kept, the least recently used is dropped
+    renderer = StatementRenderer(max_tables=2)
+    accs = [FakeAccount(f'CHK_10000{i}') for i in range(3)]
+    for acc in accs:
+        acc.add(100)
+    tables = [renderer.render(acc) for acc in accs[:2]]
+    renderer.render(accs[0])
+    renderer.render(accs[2])
+    assert len(renderer) == 2 and renderer.render(accs[0]) is tables[0] and \
+        renderer.render(accs[1]) is not tables[1], \
+        "Tables were not dropped least recently used first"
+
+    # All tests passed!
+    print("\nAll MiniStatement unit tests passed!")
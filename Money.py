@@ -0,0 +1,363 @@
+"""
+Term Project - Bank Account Manager (ATM Style)
+
+This file contains the Money class - an amount of money held as a whole
+number of cents - and the functions that read, format and scale amounts of
+cents without going through floats.
+
+Amounts typed at the ATM or passed in as floats or Decimals are read into
+cents exactly as written, rounded half to even if they have more than two
+decimals. Floats are read as their shortest repr, so 0.1 is 10 cents and
+2000.458 is 2000.46 dollars. Formatting looks up the cents in a table and
+keeps the strings of the most recent amounts.
+
+decimal is imported only for amounts with more than two decimals, exponents
+and the like, not at import.
+"""
+from functools import lru_cache
+
+_new_object = object.__new__
+
+# Largest amount, either way, in cents - balances are stored in the ledger
+# as SQLite INTEGERs, which are 64-bit
+MAX_CENTS = (1 << 63) - 1
+
+# Amounts formatted by format_cents that are kept
+FORMAT_CACHE_SIZE = 65536
+
+# '.00' to '.99'
+CENT_SUFFIXES = tuple(f'.{cents:02d}' for cents in range(100))
+
+
+def parse_cents(value):
+    """ Function that returns an amount in dollars - a str such as '12.5',
+    '$1,234.56' or '-3', an int, a float, a Decimal or a Money - in whole
+    cents. Raises ValueError if it is not a finite amount or is more than
+    MAX_CENTS either way"""
+
+    if isinstance(value, Money):
+        return value.cents
+    if isinstance(value, int):
+        cents = value * 100
+    elif isinstance(value, (str, float)):
+        if isinstance(value, float):
+            value = repr(value)
+        # Most common - digits with at most two decimals, read in one int
+        # call
+        whole, _, frac = value.partition('.')
+        if len(frac) <= 2 and whole.isdigit() and \
+                (frac.isdigit() or not frac) and value.isascii():
+            cents = int(whole + frac.ljust(2, '0'))
+        else:
+            cents = _parse_text(value)
+    else:
+        cents = _parse_decimal(value)
+
+    if -MAX_CENTS <= cents <= MAX_CENTS:
+        return cents
+    raise ValueError(f'Amount out of range: {value!r}')
+
+
+def _parse_text(value):
+    """ Reads an amount in a str with a sign, '$', commas or spaces, or in a
+    form only Decimal reads"""
+
+    # Signs, '$', commas and spaces - still without Decimal
+    text = value.strip()
+    sign = 1
+    if text[:1] in ('-', '+'):
+        sign = -1 if text[0] == '-' else 1
+        text = text[1:]
+    if text[:1] == '$':
+        text = text[1:]
+    whole, _, frac = text.replace(',', '').partition('.')
+    if (whole or frac) and len(frac) <= 2 and text.isascii() and \
+            (not whole or whole.isdigit()) and (not frac or frac.isdigit()):
+        return sign * int((whole or '0') + frac.ljust(2, '0'))
+    return sign * _parse_decimal(text.replace(',', ''), value)
+
+
+def _parse_decimal(value, orig_value=None):
+    """ Reads an amount with Decimal, rounded half to even to cents"""
+    from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+
+    try:
+        amount = Decimal(value)
+        # Beyond the precision of the context (e.g. '1e30') this raises
+        # InvalidOperation too
+        return int(amount.scaleb(2).quantize(Decimal(1),
+                                              rounding=ROUND_HALF_EVEN))
+    except (InvalidOperation, TypeError, ValueError, OverflowError):
+        raise ValueError(f'Not an amount of money: '
+                         f'{value if orig_value is None else orig_value!r}') \
+            from None
+
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def format_cents(cents):
+    """ Function that formats cents as dollars - '$1,234.56', '-$0.05' -
+    with the same digits as '{:,.2f}' on the amount in dollars"""
+
+    if cents < 0:
+        return '-' + format_cents(-cents)
+    dollars, cents = divmod(cents, 100)
+    return f'${dollars:,}{CENT_SUFFIXES[cents]}'
+
+
+def scale_half_even(cents, numerator, denominator):
+    """ Function that returns cents * numerator / denominator rounded half to
+    even, in exact integer arithmetic. cents can be an int or a NumPy array
+    of integers, which is scaled element by element"""
+
+    quotient, remainder = divmod(cents * numerator, denominator)
+    twice = 2 * remainder
+    return quotient + ((twice > denominator) |
+                       ((twice == denominator) & (quotient % 2 == 1)))
+
+
+def _money(cents):
+    """ Money of whole cents already known to be an int - results of Money
+    arithmetic, without the type check of the constructor"""
+    money = _new_object(Money)
+    money.cents = cents
+    return money
+
+
+class Money():
+    """ Money class - an amount of money in whole cents (the cents
+    attribute). Money(1234) is $12.34; Money.of reads an amount in dollars.
+
+    Money adds to and subtracts from Money, and multiplies by whole numbers;
+    anything else (scale for rates) raises TypeError rather than going
+    through floats. Plain ints mix in as whole dollars. Money objects are
+    values: do not change their cents.
+    """
+
+    __slots__ = ('cents',)
+
+    def __init__(self, cents=0):
+        """Constructor takes the amount in whole cents"""
+
+        if not isinstance(cents, int):
+            raise TypeError(f'Money takes whole cents, not {cents!r}; use '
+                            f'Money.of for an amount in dollars')
+        self.cents = cents
+
+    @classmethod
+    def of(cls, value):
+        """ Returns the Money of an amount in dollars (see parse_cents)"""
+        if isinstance(value, Money):
+            return value
+        return cls(parse_cents(value))
+
+    def __repr__(self):
+        """ Representation of Money"""
+        return f'Money({self.cents})'
+
+    def __str__(self):
+        """ Amount in dollars, e.g. '$1,234.56'"""
+        return format_cents(self.cents)
+
+    def __format__(self, format_spec):
+        """ Formats the amount in dollars - str(self) with no format_spec,
+        else the Decimal amount in dollars with format_spec"""
+        if not format_spec:
+            return format_cents(self.cents)
+        from decimal import Decimal
+        return format(Decimal(self.cents).scaleb(-2), format_spec)
+
+    def __float__(self):
+        """ Amount in dollars as a float"""
+        return self.cents / 100
+
+    def __bool__(self):
+        """ True unless the amount is zero"""
+        return self.cents != 0
+
+    def __hash__(self):
+        """ Hash - whole dollars hash as their int, as they compare equal"""
+        if self.cents % 100:
+            return hash((Money, self.cents))
+        return hash(self.cents // 100)
+
+    @staticmethod
+    def _cents_of(other):
+        """ Cents of Money or of an int of dollars, None for anything else"""
+        if isinstance(other, Money):
+            return other.cents
+        if isinstance(other, int):
+            return other * 100
+        return None
+
+    def __eq__(self, other):
+        """ Equal to the same amount as Money or as an int of dollars"""
+        other_cents = Money._cents_of(other)
+        if other_cents is None:
+            return NotImplemented
+        return self.cents == other_cents
+
+    def __lt__(self, other):
+        """ Less than Money or an int of dollars"""
+        other_cents = Money._cents_of(other)
+        if other_cents is None:
+            return NotImplemented
+        return self.cents < other_cents
+
+    def __le__(self, other):
+        """ Less than or equal to Money or an int of dollars"""
+        other_cents = Money._cents_of(other)
+        if other_cents is None:
+            return NotImplemented
+        return self.cents <= other_cents
+
+    def __gt__(self, other):
+        """ Greater than Money or an int of dollars"""
+        other_cents = Money._cents_of(other)
+        if other_cents is None:
+            return NotImplemented
+        return self.cents > other_cents
+
+    def __ge__(self, other):
+        """ Greater than or equal to Money or an int of dollars"""
+        other_cents = Money._cents_of(other)
+        if other_cents is None:
+            return NotImplemented
+        return self.cents >= other_cents
+
+    def __add__(self, other):
+        """ Sum with Money or an int of dollars"""
+        if type(other) is Money:
+            return _money(self.cents + other.cents)
+        other_cents = Money._cents_of(other)
+        if other_cents is None:
+            raise TypeError(f'Cannot add {other!r} to Money')
+        return _money(self.cents + other_cents)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        """ Difference with Money or an int of dollars"""
+        if type(other) is Money:
+            return _money(self.cents - other.cents)
+        other_cents = Money._cents_of(other)
+        if other_cents is None:
+            raise TypeError(f'Cannot subtract {other!r} from Money')
+        return _money(self.cents - other_cents)
+
+    def __rsub__(self, other):
+        """ Money or an int of dollars less this amount"""
+        other_cents = Money._cents_of(other)
+        if other_cents is None:
+            raise TypeError(f'Cannot subtract Money from {other!r}')
+        return _money(other_cents - self.cents)
+
+    def __mul__(self, other):
+        """ Product with a whole number"""
+        if not isinstance(other, int):
+            raise TypeError(f'Money can only be multiplied by whole numbers, '
+                            f'not {other!r}; use scale for rates')
+        return _money(self.cents * other)
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        """ The amount with the opposite sign"""
+        return _money(-self.cents)
+
+    def __abs__(self):
+        """ The amount without its sign"""
+        return _money(abs(self.cents))
+
+    def scale(self, numerator, denominator=1):
+        """ Returns the amount times numerator / denominator, rounded half to
+        even to cents. A Decimal rate can be passed as the numerator alone,
+        e.g. scale(Decimal('0.015'))"""
+
+        if not isinstance(numerator, int):
+            numerator, rate_denominator = numerator.as_integer_ratio()
+            denominator *= rate_denominator
+        return _money(scale_half_even(self.cents, numerator, denominator))
+
+
+# Unit Tests
+if __name__ == '__main__':
+    import random
+    from decimal import Decimal
+
+    # Amounts are read exactly as written
+    assert [parse_cents(value) for value in
+            ('12.5', '$1,234.56', '-3', ' 7 ', '.05', '5.', '+0.1', 10, 0.1,
+             0.2, 2000.458, Decimal('1.005'), '1e3', '0.125', '-$2.50')] == \
+        [1250, 123456, -300, 700, 5, 500, 10, 1000, 10, 20, 200046, 100,
+         100000, 12, -250], "Amounts were not read exactly"
+    assert parse_cents(0.1) + parse_cents(0.2) == parse_cents('0.3'), \
+        "Float amounts drifted"
+    assert parse_cents(str(MAX_CENTS)[:-2] + '.' + str(MAX_CENTS)[-2:]) == \
+        MAX_CENTS, "Largest amount was refused"
+    for bad_value in ('', '.', 'abc', '1 00', '1.2.3', 'nan', 'inf', '$',
+                      None, '1e30', 1e300, '9' * 27 + '.123', '1' * 25,
+                      10 ** 20, Decimal('1e30'), '-$' + '9' * 20):
+        try:
+            parse_cents(bad_value)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f'{bad_value!r} was read as an amount')
+
+    # Formatting matches '{:,.2f}' and never goes through floats
+    random.seed(1)
+    samples = [random.randrange(10 ** random.randint(1, 12))
+               for _ in range(500)]
+    for cents in [0, 5, 99, 100, 123456, 10 ** 9 + 1] + samples:
+        assert format_cents(cents) == f'${cents / 100:,.2f}', \
+            f"{cents} cents formatted wrong"
+    assert format_cents(-5) == '-$0.05' and \
+        format_cents(10 ** 17 + 1) == '$1,000,000,000,000,000.01', \
+        "Negative or very large amounts formatted wrong"
+
+    # Exact half even scaling, on ints and on arrays
+    assert [scale_half_even(cents, 1, 2) for cents in (1, 3, 5, -1, -3)] == \
+        [0, 2, 2, 0, -2], "Halves should round to the even cent"
+    assert scale_half_even(36500, 1, 36500) == 1 and \
+        scale_half_even(100000, 15, 1000 * 365) == 4, \
+        "Scaled amounts are wrong"
+    try:
+        import numpy as np
+    except ImportError:
+        pass
+    else:
+        balances = np.array([1, 3, 5, 36500, 100000, -3], dtype=np.int64)
+        assert scale_half_even(balances, 1, 2).tolist() == \
+            [scale_half_even(int(cents), 1, 2) for cents in balances], \
+            "Array was scaled differently from ints"
+
+    # Money arithmetic stays in cents
+    price = Money.of('19.99')
+    assert price == Money(1999) and repr(price) == 'Money(1999)' and \
+        str(price) == '$19.99' and f'{price}' == '$19.99' and \
+        f'{price:,.1f}' == '20.0' and float(price) == 19.99, \
+        "Money does not show its amount"
+    assert price * 3 == Money.of('59.97') and 3 * price == price * 3 and \
+        price + 1 == Money(2099) and 1 - price == Money(-1899) and \
+        -price == Money(-1999) and abs(-price) == price and \
+        sum([price, price]) == Money(3998), "Money arithmetic is wrong"
+    assert Money.of(10) == 10 and hash(Money.of(10)) == hash(10) and \
+        Money(5) != 0 and Money(0) == 0 and not Money(0) and \
+        Money(5) < Money(6) <= 1 < Money(101) and Money(7) >= Money(7), \
+        "Money comparisons are wrong"
+    assert Money.of(1000).scale(Decimal('0.0365'), 365) == Money(10) and \
+        Money(5).scale(1, 2) == Money(2), "Money scaling is wrong"
+    for bad_op in (lambda: price + 0.5, lambda: price * 1.5,
+                   lambda: price * price, lambda: Money(1.5),
+                   lambda: 0.5 - price):
+        try:
+            bad_op()
+        except TypeError:
+            pass
+        else:
+            raise AssertionError("Money was mixed with a float")
+    assert Money.of(price) is price and Money(5) != 0.05, \
+        "Money should only equal Money and whole dollars"
+
+    # All tests passed!
+    print("\nAll Money unit tests passed!")
@@ -0,0 +1,404 @@
+"""
+Term Project - Bank Account Manager (ATM Style)
+
+This file contains the per-operation profiler. While it is on, every call of
+an instrumented account operation (deposit, withdraw, transfer,
+mini_statement and the rendering of the mini statement) runs under cProfile,
+and tracemalloc records the memory it allocates. Only the SLOWEST_OPS
+slowest calls are kept; the rest are thrown away as they finish, so a whole
+session can run with it on.
+
+dump() writes, for each kept call:
+- NN_<operation>.cpu.collapsed - its call stacks in the collapsed-stack
+  format (one "frame;frame;frame microseconds" line per stack), which
+  flamegraph.pl or speedscope turn into a flame graph
+- NN_<operation>.alloc.collapsed - the stacks that allocated the memory the
+  call still held when it returned, in bytes
+and summary.txt, with the time and peak allocation of every kept call and
+its top allocation sites.
+
+The profiler is off by default. Setting the environment variable
+BANK_PROFILE_OPS to a directory (or passing --profile-ops DIR to
+bank_acc_mgr.py or AtmServer.py) turns it on and dumps to that directory
+when the program exits.
+"""
+import os
+import time
+import heapq
+import atexit
+import cProfile
+import threading
+import functools
+import itertools
+
+# tracemalloc is imported when the profiler is turned on - it pulls in pickle
+# and fnmatch, which the ATM would otherwise load at every startup
+
+# Environment variable naming the directory profiles are dumped to at exit
+PROFILE_ENV = 'BANK_PROFILE_OPS'
+
+# Calls kept - the slowest ones
+SLOWEST_OPS = 10
+
+# Frames kept per traced allocation, and allocation sites listed per call
+TRACE_FRAMES = 25
+ALLOC_SITES = 5
+
+# Deepest call stack written to a collapsed-stack file
+MAX_DEPTH = 64
+
+
+def frame_label(func):
+    """ Function that returns the flame graph label of a cProfile function
+    key (file, line, name) - 'name (file:line)', or the name of a builtin"""
+
+    file_name, line_no, func_name = func
+    if file_name == '~':
+        return func_name
+    return f'{func_name} ({os.path.basename(file_name)}:{line_no})'
+
+
+def collapse_stats(stats):
+    """ Function that turns cProfile stats into collapsed stacks - a
+    dictionary of 'frame;frame;...' to the microseconds spent in the last
+    frame. cProfile only records caller/callee pairs, so the time of a
+    function called from several places is split between them in proportion
+    to the time each caller spent in it"""
+
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller in callers:
+            callees.setdefault(caller, []).append(func)
+    stacks = {}
+
+    def walk(func, path, on_path, share):
+        """ Adds the time of func along path, then of its callees"""
+        path = path + (frame_label(func),)
+        own_us = stats[func][2] * share * 1e6
+        if own_us >= 1:
+            stack = ';'.join(path)
+            stacks[stack] = stacks.get(stack, 0) + own_us
+        if len(path) >= MAX_DEPTH:
+            return
+        for callee in callees.get(func, ()):
+            callee_ct = stats[callee][3]
+            if callee in on_path or not callee_ct:
+                continue
+            walk(callee, path, on_path | {callee},
+                 share * stats[callee][4][func][3] / callee_ct)
+
+    # Roots are the functions no profiled function called - the operation
+    # itself, less the call that stopped the profiler
+    for func, (_, _, _, _, callers) in stats.items():
+        if not callers and '_lsprof.Profiler' not in func[2]:
+            walk(func, (), {func}, 1.0)
+    return {stack: round(us) for stack, us in stacks.items() if round(us)}
+
+
+def collapse_snapshot(snapshot):
+    """ Function that turns a tracemalloc snapshot into collapsed stacks - a
+    dictionary of 'file:line;file:line;...' (outermost frame first) to the
+    bytes allocated there"""
+
+    stacks = {}
+    for stat in snapshot.statistics('traceback'):
+        stack = ';'.join(f'{os.path.basename(frame.filename)}:{frame.lineno}'
+                         for frame in stat.traceback)
+        stacks[stack] = stacks.get(stack, 0) + stat.size
+    return stacks
+
+
+def write_collapsed(path, stacks):
+    """ Function that writes collapsed stacks to path, largest first"""
+    with open(path, 'w') as out_file:
+        for stack, value in sorted(stacks.items(), key=lambda kv: -kv[1]):
+            out_file.write(f'{stack} {value}\n')
+
+
+class OpProfiler():
+    """ Op Profiler class - profiles instrumented calls while it is enabled
+    and keeps the slowest ones, with their cProfile stats and the memory
+    they allocated.
+
+    Concurrency Note: cProfile runs per thread, so calls on different
+    threads (e.g. of AccountEngine) are profiled side by side. tracemalloc
+    is process wide: allocations are captured for one call at a time, and
+    allocations made meanwhile by other threads are counted with it. A call
+    made inside another profiled call is part of the outer one's profile.
+    """
+
+    def __init__(self):
+        """Constructor starts a disabled profiler"""
+
+        self.enabled = False
+        self.out_dir = None
+        self.slowest = SLOWEST_OPS
+        self.trace_allocs = True
+        self.__slow = []
+        self.__seq = itertools.count()
+        self.__lock = threading.Lock()
+        self.__alloc_lock = threading.Lock()
+        self.__local = threading.local()
+        self.__started_tracing = False
+        self.__exit_dump = False
+
+    def __repr__(self):
+        """ Representation of OpProfiler"""
+        return f'OpProfiler({len(self.__slow)} calls kept, ' \
+               f'enabled={self.enabled})'
+
+    def enable(self, out_dir=None, slowest=SLOWEST_OPS, trace_allocs=True):
+        """ Starts profiling, keeping the slowest calls. With out_dir the
+        kept calls are dumped there when the program exits"""
+
+        import tracemalloc
+
+        self.slowest = slowest
+        self.trace_allocs = trace_allocs
+        if trace_allocs and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+            self.__started_tracing = True
+        if out_dir:
+            self.out_dir = out_dir
+            if not self.__exit_dump:
+                atexit.register(self.dump)
+                self.__exit_dump = True
+        self.enabled = True
+
+    def disable(self):
+        """ Stops profiling; the calls kept so far stay until reset"""
+
+        self.enabled = False
+        if self.__started_tracing:
+            import tracemalloc
+            tracemalloc.stop()
+            self.__started_tracing = False
+
+    def reset(self):
+        """ Drops every kept call"""
+        with self.__lock:
+            self.__slow = []
+
+    def slowest_calls(self):
+        """ Returns the kept calls, slowest first, as dictionaries of the
+        operation name, seconds, cProfile stats, tracemalloc snapshot and
+        peak bytes allocated (None without allocation tracing)"""
+
+        with self.__lock:
+            kept = sorted(self.__slow, reverse=True)
+        return [call for _, _, call in kept]
+
+    def __is_slow(self, elapsed):
+        """ Returns whether a call of elapsed seconds would be kept"""
+        with self.__lock:
+            return len(self.__slow) < self.slowest or \
+                elapsed > self.__slow[0][0]
+
+    def __keep(self, call):
+        """ Keeps a call if it is among the slowest"""
+        item = (call['seconds'], next(self.__seq), call)
+        with self.__lock:
+            if len(self.__slow) < self.slowest:
+                heapq.heappush(self.__slow, item)
+            elif item[0] > self.__slow[0][0]:
+                heapq.heapreplace(self.__slow, item)
+
+    def __run(self, name, func, args, kwargs):
+        """ Runs one call under the profilers"""
+        import tracemalloc
+
+        self.__local.active = True
+        allocs = self.trace_allocs and tracemalloc.is_tracing() and \
+            self.__alloc_lock.acquire(blocking=False)
+        try:
+            profiler = cProfile.Profile()
+            if allocs:
+                tracemalloc.clear_traces()
+                tracemalloc.reset_peak()
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.disable()
+                elapsed = time.perf_counter() - start
+                if self.__is_slow(elapsed):
+                    snapshot = peak = None
+                    if allocs:
+                        # Leave out what the profilers themselves allocated
+                        peak = tracemalloc.get_traced_memory()[1]
+                        snapshot = tracemalloc.take_snapshot().filter_traces(
+                            [tracemalloc.Filter(False, tracemalloc.__file__),
+                             tracemalloc.Filter(False, __file__)])
+                    profiler.create_stats()
+                    self.__keep({'name': name, 'seconds': elapsed,
+                                 'stats': profiler.stats,
+                                 'snapshot': snapshot, 'peak_bytes': peak})
+        finally:
+            if allocs:
+                self.__alloc_lock.release()
+            self.__local.active = False
+
+    def profiled(self, name):
+        """ Decorator that profiles every call of the function as the
+        operation name while the profiler is enabled. While it is disabled
+        the function is called straight through"""
+
+        def decorate(func):
+            @functools.wraps(func)
+            def profiled_func(*args, **kwargs):
+                if not self.enabled or getattr(self.__local, 'active', False):
+                    return func(*args, **kwargs)
+                return self.__run(name, func, args, kwargs)
+            return profiled_func
+        return decorate
+
+    def dump(self, out_dir=None):
+        """ Writes the collapsed stacks of the kept calls and summary.txt to
+        out_dir (by default the one given to enable), replacing an earlier
+        dump there. Returns the paths written"""
+
+        out_dir = out_dir or self.out_dir
+        os.makedirs(out_dir, exist_ok=True)
+        for old_name in os.listdir(out_dir):
+            if old_name[:2].isdigit() and old_name.endswith('.collapsed'):
+                os.remove(os.path.join(out_dir, old_name))
+
+        paths, summary = [], [f'{"Rank":<6}{"Operation":<18}{"ms":>10}'
+                              f'{"Peak KiB":>10}']
+        for rank, call in enumerate(self.slowest_calls(), 1):
+            base = os.path.join(out_dir, f'{rank:02d}_{call["name"]}')
+            write_collapsed(base + '.cpu.collapsed',
+                            collapse_stats(call['stats']))
+            paths.append(base + '.cpu.collapsed')
+            peak = '-' if call['peak_bytes'] is None else \
+                f'{call["peak_bytes"] / 1024:,.1f}'
+            summary.append(f'{rank:<6}{call["name"]:<18}'
+                           f'{call["seconds"] * 1e3:>10,.3f}{peak:>10}')
+            if call['snapshot'] is not None:
+                write_collapsed(base + '.alloc.collapsed',
+                                collapse_snapshot(call['snapshot']))
+                paths.append(base + '.alloc.collapsed')
+                for stat in call['snapshot'].statistics('lineno')[
+                        :ALLOC_SITES]:
+                    summary.append(f'{"":<6}{stat.size:>10,} B in '
+                                   f'{stat.count:,} blocks at '
+                                   f'{stat.traceback[0]}')
+
+        summary_path = os.path.join(out_dir, 'summary.txt')
+        with open(summary_path, 'w') as summary_file:
+            summary_file.write('\n'.join(summary) + '\n')
+        return paths + [summary_path]
+
+
+# Profiler of the process - the account classes and the ATM are instrumented
+# with it
+PROFILER = OpProfiler()
+
+
+def enable(out_dir=None, slowest=SLOWEST_OPS, trace_allocs=True):
+    """ Function that starts the process profiler (see OpProfiler.enable)"""
+    PROFILER.enable(out_dir, slowest, trace_allocs)
+
+
+def disable():
+    """ Function that stops the process profiler"""
+    PROFILER.disable()
+
+
+def profiled(name):
+    """ Function that returns a decorator profiling calls with the process
+    profiler (see OpProfiler.profiled)"""
+    return PROFILER.profiled(name)
+
+
+if os.environ.get(PROFILE_ENV):
+    enable(os.environ[PROFILE_ENV])
+
+
+# Unit Tests
+if __name__ == '__main__':
+    import json
+    import tempfile
+    import tracemalloc
+
+    profiler = OpProfiler()
+
+    def leaf(wait):
+        """ Sleeps and keeps an allocation alive. The allocation is made in
+        the json module, as allocations made in this file are left out"""
+        time.sleep(wait)
+        return json.loads(json.dumps(['x' * 1000] * 10))
+
+    @profiler.profiled('op')
+    def op(wait):
+        """ Profiled test function"""
+        return leaf(wait), leaf(0)
+
+    @profiler.profiled('outer')
+    def outer():
+        """ Profiled function that calls another one"""
+        return op(0)
+
+    # Nothing is kept while disabled
+    op(0)
+    assert profiler.slowest_calls() == [] and op.__name__ == 'op', \
+        "Disabled profiler kept a call"
+
+    # Only the slowest calls are kept, slowest first
+    profiler.enable(slowest=3)
+    for wait in (0.001, 0.02, 0, 0.01, 0.005, 0):
+        op(wait)
+    kept = profiler.slowest_calls()
+    assert len(kept) == 3 and kept[0]['seconds'] >= 0.02 and \
+        kept[1]['seconds'] >= 0.01 and kept[2]['seconds'] >= 0.005, \
+        "Slowest calls were not kept"
+    assert kept[0]['peak_bytes'] >= 10000, "Allocations were not traced"
+
+    # A call inside a profiled call belongs to the outer profile
+    profiler.reset()
+    outer()
+    assert [call['name'] for call in profiler.slowest_calls()] == ['outer'], \
+        "Nested call was profiled on its own"
+
+    # Collapsed stacks: the sleep sits under op and the first leaf, and the
+    # time of leaf is split between its two calls from op
+    profiler.reset()
+    op(0.02)
+    call = profiler.slowest_calls()[0]
+    cpu_stacks = collapse_stats(call['stats'])
+    sleep_stack = [stack for stack in cpu_stacks if 'sleep' in stack]
+    assert len(sleep_stack) == 1 and \
+        sleep_stack[0].startswith('op (Profiling.py:') and \
+        ';leaf (Profiling.py:' in sleep_stack[0], \
+        "Collapsed CPU stack is wrong"
+    assert 15000 <= sum(cpu_stacks.values()) <= call['seconds'] * 1e6 + 1, \
+        "Collapsed CPU times do not add up"
+    alloc_stacks = collapse_snapshot(call['snapshot'])
+    assert sum(alloc_stacks.values()) >= 20000 and \
+        all(';' in stack for stack in alloc_stacks), \
+        "Collapsed allocation stacks are wrong"
+
+    # Dumps replace the earlier one
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for wait in (0, 0.001):
+            op(wait)
+        assert len(profiler.dump(tmp_dir)) == 3 * 2 + 1, "Dump is incomplete"
+        profiler.reset()
+        op(0)
+        paths = profiler.dump(tmp_dir)
+        assert sorted(os.listdir(tmp_dir)) == ['01_op.alloc.collapsed',
+                                               '01_op.cpu.collapsed',
+                                               'summary.txt'], \
+            "Earlier dump was not replaced"
+        with open(paths[-1]) as summary_file:
+            summary_lines = summary_file.read().splitlines()
+        assert summary_lines[1].startswith('1     op') and \
+            ' B in ' in summary_lines[2], "Summary is wrong"
+
+    # Disabling stops the tracing the profiler started
+    profiler.disable()
+    assert not tracemalloc.is_tracing(), "tracemalloc was left running"
+
+    # All tests passed!
+    print("\nAll Profiling unit tests passed!")
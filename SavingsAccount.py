@@ -8,180 +8,45 @@ This file contains the SavingsAccount class that will be used by BankMgr
 
 Ensure to call SavingsAccount.close_db_connection if instantiated!
 """
-import os
-import time
-import random
-import string as st
-import sqlite3
+from decimal import Decimal
 
+from Account import Account
 
-class SavingsAccount():
+
+class SavingsAccount(Account):
     """ Savings Account class - creates account, able to withdraw and
     deposit money, also print out a mini statement of the last 10 transactions
 
-    Concurrency Note: This class is not designed to be thread-safe.
-    - The `acc_num` class attribute is generated once when the class is defined.
-      If multiple instances were created across different sessions or processes without
-      re-initializing the script (which re-runs `random.randrange`), it could lead
-      to non-unique account numbers. In the current `bank_acc_mgr.py` usage,
-      each run generates new account numbers as the script/class is reloaded.
-    - Database operations: While each instance creates its own "SavingsAccount.db"
-      (deleting any existing one), if the design were changed to allow shared database
-      files or connections across multiple concurrent instances/threads,
-      concurrent database writes could lead to data corruption or race conditions
-      without proper locking mechanisms. SQLite's default concurrency support
-      depends heavily on connection management and threading model.
+    Savings accounts earn interest at INTEREST_RATE a year, accrued daily
+    and credited as 'Interest' transactions by InterestEngine.
+
+    All of the functionality comes from Account; see there for the
+    Concurrency Note.
     """
 
-    # class attribute - account number
-    acc_num = str(random.randrange(100001, 999999))
-    # Concurrency Note on acc_num: This is a class-level attribute. If this script were part of a
-    # larger system where multiple SavingsAccount instances could be created by different
-    # threads/processes without restarting the Python interpreter (and thus re-running this
-    # class definition), all instances would share the acc_num generated by the first
-    # execution of this line. This would make acc_num non-unique. The current bank_acc_mgr.py
-    # re-runs the script for each user session, mitigating this for that specific use case.
-
-    def __init__(self, owner, balance=0):
-        """Constructor creates
-      - An account for the owner supplied with the default balance is 0
-      - A sqlite database that would store transaction information"""
-
-        self.owner = owner
-        self.balance = balance
-
-        # Create connection to sqlite and create a database
-        try:
-            if os.path.exists("SavingsAccount.db"):
-                os.remove("SavingsAccount.db")
-
-            db_conn = sqlite3.connect('SavingsAccount.db')
-        except (OSError, PermissionError):
-            print(
-                '\nDatabase error on SavingsAccount. Close any programs '
-                'that might be using the file "SavingsAccount.db" and try '
-                'again. Exiting...')
-            time.sleep(2)
-            exit()
-        else:
-            # Create a Savings Account table on SavingsAccount db to
-            # store transactions
-            self.__dbconn = db_conn
-            self.cur = db_conn.cursor()
-            self.tb_name = 'SAV_' + SavingsAccount.acc_num
-
-            create_tb_str = 'CREATE TABLE ' + self.tb_name + ' ('\
-            '"Trans.ID" text, Timestamp text, "Remark" text,'\
-            '"Trans. Amt" text, "Running Bal." text)'
-
-            self.cur.execute(create_tb_str)
-
-    def __str__(self):
-        """ User friendly description of SavingsAccount"""
-        return f'Savings Account #{SavingsAccount.acc_num}\n' \
-               f'Available balance: ${self.balance:,.2f}'
-
-    def __repr__(self):
-        """ Representation of SavingsAccount"""
-        return f'SavingsAccount({self.owner}, {self.balance})\n'
-
-    def deposit(self, dep_amt):
-        """ Function that verifies the input amount and deposits into Account"""
-
-        # Verify if amount being deposited is positive
-        if dep_amt < 0:
-            return f'Cannot deposit negative amounts! Current balance is ' \
-                   f'${self.balance:,.2f}'
-        elif dep_amt == 0:
-            return f'Nothing to deposit. Current balance is ${self.balance:,.2f}'
-        else:
-            # If yes, add to balance and insert a transaction record
-            self.balance += dep_amt
-
-            trans_id = ''.join(random.choices(st.ascii_uppercase + st.digits, k=8))
-            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-            trans_remark = 'Credit'
-            trans_amt = "{:,.2f}". format(dep_amt)
-            curr_bal = "{:,.2f}". format(self.balance)
-
-            insert_str = "INSERT INTO " + self.tb_name + " VALUES ('" \
-                         + trans_id + "','" + timestamp + "','" + \
-                         trans_remark + "','$" + trans_amt +\
-                         "','$" + curr_bal + "')"
-
-            self.cur.execute(insert_str)
-            self.__dbconn.commit()
-
-            # Return the deposited amount and the new balance
-            return f'Deposit of ${dep_amt} accepted! \nThe new balance is ' \
-                   f'${curr_bal}'
-
-    def withdraw(self, w_amt):
-        """ Function that verifies the input amount and withdraws from
-        SavingsAccount"""
-
-        # Verify if withdrawal amount is under the balance
-        if w_amt > self.balance:
-            return f'Cannot overdraw! Available balance is ${self.balance:,.2f}'
-        else:
-            # If yes, deduct from balance and insert a transaction record
-            self.balance -= w_amt
-
-            trans_id = ''.join(random.choices(st.ascii_uppercase + st.digits, k=8))
-            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-            trans_remark = 'Debit'
-            trans_amt = "{:,.2f}". format(w_amt)
-            curr_bal = "{:,.2f}". format(self.balance)
-
-            insert_str = "INSERT INTO " + self.tb_name + " VALUES ('" \
-                         + trans_id + "','" + timestamp + "','" + \
-                         trans_remark + "','$" + trans_amt +\
-                         "','$" + curr_bal + "')"
-
-            self.cur.execute(insert_str)
-            self.__dbconn.commit()
-
-            # Return the withdrawn amount and the new balance
-            return f'Withdrawn ${w_amt}. The new balance is ${curr_bal}'
-
-    def mini_statement(self):
-        """ Function that produces a list of list of transactions for Account
-        """
-
-        # Start with an empty list
-        stmt_list = []
-
-        # Iterate through the and append to list, as list
-        for i in self.cur.execute('SELECT * FROM ' + self.tb_name +
-                                  ' ORDER BY "Timestamp" DESC LIMIT 10'):
-            stmt_list.append(list(i))
-
-        # If transactions exist, add the header to index 0
-        if len(stmt_list) > 0:
-            headers = [i[0] for i in self.cur.description]
-            stmt_list.insert(0, headers)
-
-        # Finally return the list containing transactions
-        return stmt_list
-
-    def close_db_connection(self):
-        """ Closes the database connection when called"""
-        self.__dbconn.close()
+    __slots__ = ()
+
+    ACC_PREFIX = 'SAV'
+    ACC_LABEL = 'Savings'
+    INTEREST_RATE = Decimal('0.0150')
 
 
 # Unit Tests
 if __name__ == '__main__':
+    import os
+    import sqlite3
+    from LedgerStore import DEFAULT_DB
 
     # Instantiate Class
     acc_owner = 'John Doe'
     sav_acc = SavingsAccount(acc_owner, 20002)
 
     # Constructor tests
-    assert int(sav_acc.acc_num) in range(100001, 999999), \
+    assert int(sav_acc.acc_num) >= 100001, \
         "Account number invalid!"
     assert (sav_acc.owner, sav_acc.balance) == ('John Doe', 20002), \
         "Account owner and initial balance invalid!"
-    assert os.path.exists("SavingsAccount.db"), "Database was not created!"
+    assert os.path.exists(DEFAULT_DB), "Database was not created!"
     assert sav_acc.tb_name == 'SAV_' + sav_acc.acc_num, \
         "Invalid SavingsAccount table name in database!"
 
@@ -247,15 +112,74 @@ if __name__ == '__main__':
     # Verify header is present
     assert mini_stmt[0] == ["Trans.ID", "Timestamp", "Remark", "Trans. Amt", "Running Bal."], \
         "Mini statement header is incorrect or missing for SavingsAccount"
+    # Verify amounts are recorded as cents, latest transaction first
+    assert mini_stmt[1][2:] == ['Credit', 10000, 1120000], \
+        "Mini statement amounts should be in cents, newest first"
+    assert isinstance(mini_stmt[1][1], int), \
+        "Mini statement timestamps should be epoch seconds"
+    stmt_ids = [i[0] for i in mini_stmt[1:]]
+    assert stmt_ids == sorted(set(stmt_ids), reverse=True), \
+        "Transaction ids should be unique and ordered newest first"
     sav_acc_stmt_test.close_db_connection()
 
 
-    # Comment on Account Number Generation:
-    # acc_num is a class attribute. If multiple SavingsAccount objects are created
-    # in the same script run without re-importing or re-defining the class,
-    # they might share the same account number because random.randrange() is called
-    # only once when the class is defined. For true uniqueness per instance,
-    # acc_num should be generated within the __init__ method.
+    # Every instance gets its own account number
+    assert sav_acc_stmt_test.acc_num != sav_acc.acc_num, \
+        "Account number shared between instances"
+
+    # Re-opening an existing account restores its balance and history
+    sav_acc_reopened = SavingsAccount.open_account(sav_acc_stmt_test.acc_num)
+    assert sav_acc_reopened.balance == sav_acc_stmt_test.balance, \
+        "Re-opened account has a different balance"
+    assert sav_acc_reopened.mini_statement() == mini_stmt, \
+        "Re-opened account has a different transaction history"
+    sav_acc_reopened.close_db_connection()
+
+    # Opening an account that does not exist fails
+    try:
+        SavingsAccount.open_account('0')
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("Opening an unknown account should raise KeyError")
+
+    # Batch posting tests
+    sav_acc_batch_test = SavingsAccount("Batch Test User", 10000, profile="bulk")
+    batch_results = sav_acc_batch_test.post_batch(
+        [('deposit', 100), ('withdraw', 10000 + 500), ('withdraw', 50),
+         ('deposit', -5)])
+    assert len(batch_results) == 4, "post_batch should return one result per item"
+    assert "Cannot overdraw!" in batch_results[1], \
+        "post_batch did not reject the overdraft in the batch"
+    assert "Cannot deposit negative amounts" in batch_results[3], \
+        "post_batch did not reject the negative deposit in the batch"
+    assert sav_acc_batch_test.balance == 10000 + 50, \
+        "Invalid balance after posting a batch"
+    assert len(sav_acc_batch_test.mini_statement()) == 3, \
+        "post_batch should record only the accepted transactions"
+
+    # Group commit tests - nothing is written until the block exits
+    with sav_acc_batch_test.group_commit():
+        sav_acc_batch_test.deposit(10)
+        sav_acc_batch_test.withdraw(20)
+        assert len(sav_acc_batch_test.mini_statement()) == 3, \
+            "group_commit wrote transactions before the block exited"
+    assert len(sav_acc_batch_test.mini_statement()) == 5, \
+        "group_commit did not write the transactions on exit"
+
+    # A failing group commit block writes nothing and restores the balance
+    initial_balance = sav_acc_batch_test.balance
+    try:
+        with sav_acc_batch_test.group_commit():
+            sav_acc_batch_test.deposit(10)
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert sav_acc_batch_test.balance == initial_balance, \
+        "Balance not restored after a failed group commit"
+    assert len(sav_acc_batch_test.mini_statement()) == 5, \
+        "Failed group commit should not write any transactions"
+    sav_acc_batch_test.close_db_connection()
 
     # Comment on Database Interaction Testing:
     # Testing for database corruption, non-writable scenarios (e.g., due to file permissions),
@@ -265,11 +189,9 @@ if __name__ == '__main__':
     # file system states and permissions.
 
     # Close database connections after unit tests
-    # The original sav_acc's db was removed when sav_acc_stmt_test was created.
-    # We need a valid sav_acc object to test its close_db_connection.
-    # The original sav_acc's db was removed when sav_acc_stmt_test was created.
-    # So, we create a new one for this specific test.
-    final_test_acc = SavingsAccount("Final Test SAV", 100) # This creates a new SavingsAccount.db
+    # sav_acc was already closed, so create a new account with its own
+    # connection to test close_db_connection on.
+    final_test_acc = SavingsAccount("Final Test SAV", 100) # Opens its own connection
     final_test_acc.close_db_connection() # Now close it
     db_status = False
 
@@ -0,0 +1,426 @@
+"""
+Term Project - Bank Account Manager (ATM Style)
+
+This file contains the ShardedLedger class that spreads accounts over
+several ledger databases - shards - each owned by a worker process of its
+own, so that deposits and withdrawals on different shards are written in
+parallel instead of queueing for the one write lock of a single database.
+
+An account lives on the shard its account number hashes to. Calls are
+handed to a dispatcher thread per shard, which sends everything queued for
+its shard to the worker in one message. The worker runs the batch on its
+accounts and commits it in one transaction. Account numbers are claimed
+from the first shard, so they are unique across all of them.
+
+Transfers are not offered: the two accounts of a transfer can be on
+different shards, which one transaction cannot span.
+
+Ensure to call ShardedLedger.close if instantiated!
+"""
+import os
+import zlib
+import queue
+import pickle
+import sqlite3
+import threading
+import multiprocessing
+from concurrent.futures import Future
+
+from CheckingAccount import CheckingAccount
+from SavingsAccount import SavingsAccount
+from Money import Money
+from LedgerStore import LedgerStore, DEFAULT_PROFILE
+from AccNumAllocator import allocator_for
+from TransIdGenerator import generator_for
+
+# Database file of each shard, by shard number
+SHARD_DB = 'BankLedger_{:02d}.db'
+
+# Most calls sent to a worker in one message
+MAX_BATCH = 256
+
+# Account classes by the prefix of their account ids
+ACCOUNT_CLASSES = {acc_cls.ACC_PREFIX: acc_cls
+                   for acc_cls in (CheckingAccount, SavingsAccount)}
+
+
+def shard_for(acc_num, num_shards):
+    """ Function that returns the shard of an account number - the same in
+    every process and on every run"""
+    return zlib.crc32(acc_num.encode()) % num_shards
+
+
+def _shard_account(store, accs, account_id):
+    """ Returns the account of a shard worker, opened on its connection the
+    first time it is used"""
+
+    acc = accs.get(account_id)
+    if acc is None:
+        prefix, _, acc_num = account_id.partition('_')
+        acc_cls = ACCOUNT_CLASSES.get(prefix)
+        if acc_cls is None:
+            raise KeyError(f'Not an account id: {account_id!r}')
+        acc = accs[account_id] = acc_cls.open_account(acc_num, store=store)
+    return acc
+
+
+def _create(store, accs, account_id, owner, cents):
+    """ Creates an account with a given id, returns the id"""
+    store.create_account(account_id, owner, cents)
+    accs.pop(account_id, None)
+    _shard_account(store, accs, account_id)
+    return account_id
+
+
+def _total(store, accs, prefix):
+    """ Returns the number of accounts and their total balance in cents"""
+    return tuple(store.total_balance(prefix))
+
+
+# Calls a shard worker runs, each with its connection and accounts first
+SHARD_CALLS = {
+    'create': _create,
+    'deposit': lambda store, accs, account_id, amt:
+        _shard_account(store, accs, account_id).deposit(amt),
+    'withdraw': lambda store, accs, account_id, amt:
+        _shard_account(store, accs, account_id).withdraw(amt),
+    'balance': lambda store, accs, account_id:
+        _shard_account(store, accs, account_id).cents,
+    'mini_statement': lambda store, accs, account_id:
+        _shard_account(store, accs, account_id).mini_statement(),
+    'total': _total,
+}
+
+
+def run_shard_batch(store, accs, batch):
+    """ Function that runs a batch of (call, args) on a shard and commits
+    its writes in one transaction. Returns (True, result) or (False,
+    exception) per call - a call that raises fails on its own, and the
+    worker carries on. If the database fails, or the commit does, every
+    call of the batch fails, and the accounts are dropped so that they are
+    opened again from the database"""
+
+    results = []
+    try:
+        with store.hold_commits():
+            for call, args in batch:
+                try:
+                    results.append((True, SHARD_CALLS[call](store, accs,
+                                                            *args)))
+                except sqlite3.Error:
+                    raise
+                except Exception as exc:
+                    results.append((False, exc))
+    except Exception as exc:
+        accs.clear()
+        return [(False, exc)] * len(batch)
+    return results
+
+
+def serve_shard(conn, db_path, profile):
+    """ Function that a shard worker process runs - answers batches received
+    on conn until it receives None"""
+
+    store = LedgerStore(db_path, profile)
+    # Batches keep write transactions open, so the transaction id node is
+    # claimed now rather than on the first id
+    generator_for(db_path).claim_node(store)
+    accs = {}
+    try:
+        # The shard database is ready
+        conn.send(None)
+        while True:
+            batch = conn.recv()
+            if batch is None:
+                break
+            results = run_shard_batch(store, accs, batch)
+            try:
+                conn.send(results)
+            except (pickle.PicklingError, TypeError, AttributeError):
+                # An exception that cannot be sent back goes as its repr
+                conn.send([(ok, result if ok else RuntimeError(repr(result)))
+                           for ok, result in results])
+    finally:
+        store.close()
+        conn.close()
+
+
+class ShardedLedger():
+    """ Sharded Ledger class - deposits, withdrawals, balances and mini
+    statements of accounts spread over num_shards ledger databases in
+    db_dir, each served by its own worker process.
+
+    Accounts are known by their account id (e.g. 'CHK_100001'). Calls
+    return Futures; calls on one account are run in the order they were
+    made.
+
+    Concurrency Note: Thread-safe. A shard's accounts are only ever touched
+    by its worker, one batch at a time, so no locks are needed on them. While
+    a ShardedLedger is open its databases must not be written to any other
+    way.
+    """
+
+    def __init__(self, db_dir='.', num_shards=4, profile=DEFAULT_PROFILE,
+                 max_batch=MAX_BATCH):
+        """Constructor starts a worker process and a dispatcher thread for
+        every shard, creating the shard databases in db_dir if needed"""
+
+        self.db_dir = db_dir
+        self.num_shards = num_shards
+        self.profile = profile
+        self.max_batch = max_batch
+        self.shard_paths = [os.path.join(db_dir, SHARD_DB.format(i))
+                            for i in range(num_shards)]
+
+        # Workers first, so they are not forked while a thread is running
+        self.__workers = []
+        self.__conns = []
+        for db_path in self.shard_paths:
+            conn, worker_conn = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                target=serve_shard, args=(worker_conn, db_path, profile),
+                daemon=True)
+            worker.start()
+            worker_conn.close()
+            self.__workers.append(worker)
+            self.__conns.append(conn)
+        # Each worker answers once its shard database is open
+        for conn in self.__conns:
+            conn.recv()
+
+        self.__queues = [queue.SimpleQueue() for _ in range(num_shards)]
+        self.__threads = [threading.Thread(target=self.__dispatch, args=(i,),
+                                           name=f'ShardedLedger-{i}',
+                                           daemon=True)
+                          for i in range(num_shards)]
+        for thread in self.__threads:
+            thread.start()
+        self.__closed = False
+        self.__closed_lock = threading.Lock()
+
+    def __repr__(self):
+        """ Representation of ShardedLedger"""
+        return f'ShardedLedger({self.db_dir!r}, {self.num_shards})'
+
+    def __enter__(self):
+        """ Lets the ledger be used in a with block"""
+        return self
+
+    def __exit__(self, *exc_info):
+        """ Closes the ledger at the end of the with block"""
+        self.close()
+
+    def __dispatch(self, shard):
+        """ Dispatcher thread of a shard - sends the calls queued for it to
+        its worker, as many at once as have queued up while the last batch
+        ran, and settles their Futures"""
+
+        calls, conn = self.__queues[shard], self.__conns[shard]
+        broken = None
+        stopping = False
+        while not stopping:
+            batch = [calls.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(calls.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+                batch.remove(None)
+            if not batch:
+                continue
+
+            if broken is None:
+                try:
+                    conn.send([(call, args) for call, args, _ in batch])
+                    results = conn.recv()
+                except (EOFError, OSError):
+                    broken = RuntimeError(f'Worker of shard {shard} exited')
+            if broken is not None:
+                results = [(False, broken)] * len(batch)
+            for (_, _, future), (ok, result) in zip(batch, results):
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(result)
+
+    def __submit(self, shard, call, *args):
+        """ Queues a call for a shard, returns its Future"""
+
+        future = Future()
+        with self.__closed_lock:
+            if self.__closed:
+                raise RuntimeError('ShardedLedger is closed')
+            self.__queues[shard].put((call, args, future))
+        return future
+
+    def shard_of(self, account_id):
+        """ Returns the shard of an account id"""
+        return shard_for(account_id.rpartition('_')[2], self.num_shards)
+
+    def create_account(self, acc_cls, owner, balance=0):
+        """ Queues the creation of an account of class acc_cls (e.g.
+        CheckingAccount) with an opening balance in dollars, returns a Future
+        of its account id"""
+
+        acc_num = allocator_for(self.shard_paths[0]).next_acc_num()
+        return self.__submit(shard_for(acc_num, self.num_shards), 'create',
+                             acc_cls.ACC_PREFIX + '_' + acc_num, owner,
+                             Money.of(balance).cents)
+
+    def deposit(self, account_id, dep_amt):
+        """ Queues a deposit, returns a Future of the result message"""
+        return self.__submit(self.shard_of(account_id), 'deposit',
+                             account_id, dep_amt)
+
+    def withdraw(self, account_id, w_amt):
+        """ Queues a withdrawal, returns a Future of the result message"""
+        return self.__submit(self.shard_of(account_id), 'withdraw',
+                             account_id, w_amt)
+
+    def balance(self, account_id):
+        """ Queues a balance query, returns a Future of the balance in
+        cents"""
+        return self.__submit(self.shard_of(account_id), 'balance',
+                             account_id)
+
+    def mini_statement(self, account_id):
+        """ Queues a mini statement, returns a Future of it"""
+        return self.__submit(self.shard_of(account_id), 'mini_statement',
+                             account_id)
+
+    def balances(self, account_ids):
+        """ Returns the balances in cents of accounts on any shards, in the
+        order of account_ids. Each is read after the calls queued on its
+        account before"""
+
+        futures = [self.balance(account_id) for account_id in account_ids]
+        return [future.result() for future in futures]
+
+    def total_balance(self, prefix=''):
+        """ Returns the number of accounts on all shards whose id starts with
+        prefix (e.g. 'SAV_'), all accounts by default, and their balances in
+        total in cents"""
+
+        futures = [self.__submit(shard, 'total', prefix)
+                   for shard in range(self.num_shards)]
+        totals = [future.result() for future in futures]
+        return (sum(num_accs for num_accs, _ in totals),
+                sum(cents for _, cents in totals))
+
+    def close(self):
+        """ Runs the calls still queued, then stops the dispatcher threads and
+        the worker processes"""
+
+        with self.__closed_lock:
+            if self.__closed:
+                return
+            self.__closed = True
+            for calls in self.__queues:
+                calls.put(None)
+        for thread in self.__threads:
+            thread.join()
+        for conn, worker in zip(self.__conns, self.__workers):
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            worker.join()
+            conn.close()
+
+
+# Unit Tests
+if __name__ == '__main__':
+    import tempfile
+
+    # Routing is stable and spreads the accounts
+    assert shard_for('100001', 4) == zlib.crc32(b'100001') % 4, \
+        "Account number hashed differently"
+    assert len({shard_for(str(n), 4) for n in range(100001, 100101)}) == 4, \
+        "Accounts were not spread over every shard"
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with ShardedLedger(tmp_dir, num_shards=3) as ledger:
+            assert all(os.path.exists(db_path)
+                       for db_path in ledger.shard_paths), \
+                "Shard databases were not created"
+
+            # Accounts land on the shard their number hashes to
+            chk_ids = [ledger.create_account(CheckingAccount, f'Owner {i}',
+                                             100).result() for i in range(30)]
+            sav_id = ledger.create_account(SavingsAccount, 'Owner 0',
+                                           1000.5).result()
+            assert len(set(chk_ids)) == 30 and \
+                {ledger.shard_of(acc_id) for acc_id in chk_ids} == {0, 1, 2}, \
+                "Accounts were not spread over the shards"
+            for acc_id in chk_ids:
+                store = LedgerStore(ledger.shard_paths[ledger.shard_of(acc_id)])
+                assert store.load_account(acc_id) is not None, \
+                    f"{acc_id} is not on its shard"
+                store.close()
+
+            # Calls on an account run in order, with the account's messages
+            futures = [ledger.withdraw(acc_id, 30) for acc_id in chk_ids
+                       for _ in range(4)]
+            futures.append(ledger.deposit(chk_ids[0], 5.25))
+            results = [future.result() for future in futures]
+            assert results[:4] == [
+                'Withdrawn $30.00. The new balance is $70.00',
+                'Withdrawn $30.00. The new balance is $40.00',
+                'Withdrawn $30.00. The new balance is $10.00',
+                'Cannot overdraw! Available balance is $10.00'], \
+                "Withdrawals were not run in order"
+            assert results[-1].startswith('Deposit of $5.25 accepted!'), \
+                "Deposit was refused"
+
+            # Balances across shards
+            assert ledger.balances([chk_ids[0], sav_id, chk_ids[1]]) == \
+                [1525, 100050, 1000], "Balances read wrong"
+            assert ledger.total_balance() == (31, 30 * 1000 + 525 + 100050), \
+                "Total balance across shards is wrong"
+            assert ledger.total_balance('SAV_') == (1, 100050), \
+                "Total balance of savings accounts is wrong"
+            stmt = ledger.mini_statement(chk_ids[0]).result()
+            assert [row[2:] for row in stmt[1:3]] == \
+                [['Credit', 525, 1525], ['Debit', -3000, 1000]], \
+                "Mini statement is wrong"
+
+            # Unknown accounts fail their own call only
+            missing = ledger.deposit('CHK_999999', 5)
+            other = ledger.deposit(chk_ids[0], 1)
+            try:
+                missing.result()
+            except KeyError:
+                pass
+            else:
+                raise AssertionError("Deposit to a missing account passed")
+            assert other.result().startswith('Deposit of $1'), \
+                "Call batched with a failed one was lost"
+
+            # So do amounts that cannot be read, and the worker stays up
+            for bad_amt in (10 ** 20, '1e30', 'abc'):
+                try:
+                    ledger.deposit(chk_ids[0], bad_amt).result()
+                except ValueError:
+                    pass
+                else:
+                    raise AssertionError(f"Deposit of {bad_amt!r} passed")
+            assert ledger.balance(chk_ids[0]).result() == 1625, \
+                "Failed deposits changed the balance"
+
+        # Accounts are kept on the shards across runs
+        with ShardedLedger(tmp_dir, num_shards=3) as ledger:
+            assert ledger.balances(chk_ids[:2]) == [1625, 1000], \
+                "Balances were not kept on the shards"
+            new_id = ledger.create_account(CheckingAccount, 'Jane Doe').result()
+            assert new_id not in chk_ids, "Account number was handed out twice"
+        try:
+            ledger.balance(chk_ids[0])
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("Closed ledger accepted a call")
+
+    # All tests passed!
+    print("\nAll ShardedLedger unit tests passed!")
@@ -0,0 +1,129 @@
+"""
+Term Project - Bank Account Manager (ATM Style)
+
+This file contains the functions that export the full statement of an account
+from the ledger database to a CSV or JSON Lines file, e.g. for an audit.
+
+Rows are streamed from the database in chunks and written as they come, so an
+export of millions of transactions needs no more memory than one of ten.
+Amounts and balances are written as integer cents and timestamps as epoch
+seconds, the way they are stored.
+
+Accounts export their own statement with Account.export_statement.
+"""
+import csv
+import json
+import time
+
+from LedgerStore import STATEMENT_HEADERS, STREAM_CHUNK_SIZE
+
+# Export formats, by file suffix
+FORMATS = ('csv', 'jsonl')
+
+
+def write_csv(chunks, out_file):
+    """ Function that writes chunks of statement rows to an open text file as
+    CSV, headers first, and returns the number of rows written"""
+
+    writer = csv.writer(out_file)
+    writer.writerow(STATEMENT_HEADERS)
+    num_rows = 0
+    for rows in chunks:
+        writer.writerows(rows)
+        num_rows += len(rows)
+    return num_rows
+
+
+def write_jsonl(chunks, out_file):
+    """ Function that writes chunks of statement rows to an open text file as
+    JSON Lines - one object per transaction, keyed by the statement headers -
+    and returns the number of rows written"""
+
+    num_rows = 0
+    for rows in chunks:
+        out_file.writelines(json.dumps(dict(zip(STATEMENT_HEADERS, row))) + '\n'
+                            for row in rows)
+        num_rows += len(rows)
+    return num_rows
+
+
+def export_statement(store, account_id, out_path, fmt=None, after_id=None,
+                     start_ts=None, end_ts=None, chunk_size=STREAM_CHUNK_SIZE):
+    """ Function that exports the transactions of an account, oldest first,
+    from an open LedgerStore to out_path and returns the number of rows
+    written. fmt is 'csv' or 'jsonl' and defaults to the suffix of out_path.
+    after_id, start_ts and end_ts filter the rows as in
+    LedgerStore.stream_transactions"""
+
+    if fmt is None:
+        fmt = out_path.rsplit('.', 1)[-1].lower()
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown export format: {fmt!r}. '
+                         f'Choose from {", ".join(FORMATS)}')
+
+    chunks = store.stream_transactions(account_id, after_id, start_ts, end_ts,
+                                       chunk_size)
+    with open(out_path, 'w', newline='', encoding='utf-8') as out_file:
+        if fmt == 'csv':
+            return write_csv(chunks, out_file)
+        return write_jsonl(chunks, out_file)
+
+
+def date_to_ts(date_str):
+    """ Function that converts a YYYY-MM-DD date to epoch seconds at local
+    midnight, the way statement dates are shown"""
+    return int(time.mktime(time.strptime(date_str, '%Y-%m-%d')))
+
+
+# Unit Tests
+if __name__ == '__main__':
+    import os
+    import tempfile
+    from LedgerStore import LedgerStore
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = LedgerStore(os.path.join(tmp_dir, 'test_ledger.db'))
+        store.create_account('CHK_100001', 'John Doe', 0)
+        day_ts = date_to_ts('2021-04-18')
+        store.insert_transactions(
+            'CHK_100001',
+            [(1000 + i, day_ts + i * 3600, 'Credit', 100, (i + 1) * 100)
+             for i in range(48)], 4800)
+
+        # CSV - header row, then every transaction oldest first
+        csv_file = os.path.join(tmp_dir, 'statement.csv')
+        assert export_statement(store, 'CHK_100001', csv_file,
+                                chunk_size=7) == 48, "Row count is wrong"
+        with open(csv_file, newline='') as in_file:
+            csv_rows = list(csv.reader(in_file))
+        assert csv_rows[0] == STATEMENT_HEADERS, "CSV headers are wrong"
+        assert csv_rows[1] == ['1000', str(day_ts), 'Credit', '100', '100'] \
+            and len(csv_rows) == 49, "CSV rows are wrong"
+
+        # JSON Lines with a date range - only the 24 hours of the 18th
+        jsonl_file = os.path.join(tmp_dir, 'statement.jsonl')
+        assert export_statement(store, 'CHK_100001', jsonl_file,
+                                start_ts=day_ts,
+                                end_ts=date_to_ts('2021-04-19')) == 24, \
+            "Date range was not applied"
+        with open(jsonl_file) as in_file:
+            json_rows = [json.loads(line) for line in in_file]
+        assert json_rows[-1] == {
+            'Trans.ID': 1023, 'Timestamp': day_ts + 23 * 3600,
+            'Remark': 'Credit', 'Trans. Amt': 100, 'Running Bal.': 2400}, \
+            "JSONL rows are wrong"
+
+        # Keyset pagination and explicit format
+        txt_file = os.path.join(tmp_dir, 'statement.txt')
+        assert export_statement(store, 'CHK_100001', txt_file, 'jsonl',
+                                after_id=1040) == 7, "after_id was not applied"
+        try:
+            export_statement(store, 'CHK_100001', txt_file)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Unknown format should raise ValueError")
+        store.close()
+
+    # All tests passed!
+    print("\nAll StatementExport unit tests passed!")
@@ -0,0 +1,345 @@
+"""
+Term Project - Bank Account Manager (ATM Style)
+
+This file contains the TransIdGenerator class that hands out transaction ids,
+and the module-level next_id function the account classes call.
+
+Ids are unique per ledger database: every process leases a node id of its
+own from the ledger it writes to, and generator_for keeps one generator per
+ledger. A node id is only leased again once the process holding it has
+ended. The
+generator in use can be swapped with set_generator - any object with
+next_id() and next_ids(count) methods returning unique integers will do.
+"""
+import os
+import time
+import socket
+import threading
+
+import Metrics
+
+# Snowflake style layout of a 63-bit id (fits a sqlite integer):
+# | 41 bits milliseconds since ID_EPOCH | 10 bits node | 12 bits sequence |
+ID_EPOCH_MS = 1609459200000  # 2021-01-01 00:00:00 UTC
+NODE_BITS = 10
+SEQ_BITS = 12
+MAX_NODE = (1 << NODE_BITS) - 1
+MAX_SEQ = (1 << SEQ_BITS) - 1
+
+# Crockford's base32 alphabet used for the display form of an id
+ENCODING = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+
+class TransIdGenerator():
+    """ Transaction Id Generator class - generates time-ordered 63-bit ids
+    made up of a millisecond timestamp, a node (worker) id and a sequence
+    number, so ids from one generator always increase and inserts keyed on
+    them land at the end of the ledger index
+
+    Concurrency Note: Thread-safe. Ids never repeat across processes as long
+    as every process has its own node id. Without a fixed one, the node id
+    is leased from the ledger database - the same for every process that
+    writes to it - and leased again in a forked child. A lease lasts as long
+    as the process that holds it, so up to 1024 processes on a ledger can
+    hand out ids at once; one more raises RuntimeError rather than share a
+    node id.
+    """
+
+    def __init__(self, node_id=None, db_path=None):
+        """Constructor sets the node id, 0 to 1023. Without one, the node id
+        is leased from the ledger database at db_path (LedgerStore's default
+        if None) when the first id is asked for"""
+
+        if node_id is not None and not 0 <= node_id <= MAX_NODE:
+            raise ValueError(f'Node id must be between 0 and {MAX_NODE}')
+
+        self.__fixed_node = node_id
+        self.db_path = db_path
+        self.__reset()
+        if node_id is None:
+            # A forked child must not keep handing out its parent's ids
+            os.register_at_fork(after_in_child=self.__reset)
+
+    def __repr__(self):
+        """ Representation of TransIdGenerator"""
+        return f'TransIdGenerator({self.node_id}, {self.db_path!r})'
+
+    def __reset(self):
+        """ (Re)starts the generator on its node, with a fresh lock as the
+        old one may have been held by another thread at fork time. Without
+        a fixed node the node id is claimed again on first use"""
+        self.node_id = self.__fixed_node
+        self.__node_bits = None if self.node_id is None else \
+            self.node_id << SEQ_BITS
+        self.__last_ms = 0
+        self.__seq = 0
+        self.__lock = threading.Lock()
+
+    def claim_node(self, store=None):
+        """ Claims the node id from the ledger database, unless the
+        generator has one. It is claimed through store if one is passed in,
+        else on a connection of its own, which has to wait for any write
+        transaction open on the ledger - a process that opens one before
+        its first id should claim the node up front. Returns the node id"""
+
+        with self.__lock:
+            if self.__node_bits is None:
+                self.__claim_node(store)
+            return self.node_id
+
+    def __claim_node(self, store=None):
+        """ Claims the node id, with the lock held"""
+
+        # sqlite3 is only loaded once ids are needed
+        from LedgerStore import LedgerStore, DEFAULT_DB
+
+        lease = (socket.gethostname(), os.getpid(), MAX_NODE + 1,
+                 process_is_live)
+        if store is not None:
+            self.node_id = store.claim_node_id(*lease)
+        else:
+            store = LedgerStore(self.db_path or DEFAULT_DB)
+            try:
+                self.node_id = store.claim_node_id(*lease)
+            finally:
+                store.close()
+        self.__node_bits = self.node_id << SEQ_BITS
+
+    def next_ids(self, count):
+        """ Reserves count ids in one go and returns them as a list"""
+
+        ids = []
+        with self.__lock:
+            if self.__node_bits is None:
+                self.__claim_node()
+            now_ms = time.time_ns() // 1000000 - ID_EPOCH_MS
+            if now_ms > self.__last_ms:
+                self.__last_ms = now_ms
+                self.__seq = 0
+            while count:
+                # The clock went back or this millisecond's sequence numbers
+                # are used up - carry on in the next millisecond to keep ids
+                # unique and increasing
+                if self.__seq > MAX_SEQ:
+                    self.__last_ms += 1
+                    self.__seq = 0
+                take = min(count, MAX_SEQ + 1 - self.__seq)
+                base = (self.__last_ms << (NODE_BITS + SEQ_BITS)) | \
+                    self.__node_bits
+                ids.extend(range(base + self.__seq, base + self.__seq + take))
+                self.__seq += take
+                count -= take
+        return ids
+
+    def next_id(self):
+        """ Returns the next id"""
+
+        with self.__lock:
+            if self.__node_bits is None:
+                self.__claim_node()
+            now_ms = time.time_ns() // 1000000 - ID_EPOCH_MS
+            if now_ms > self.__last_ms:
+                self.__last_ms = now_ms
+                self.__seq = 0
+            elif self.__seq > MAX_SEQ:
+                self.__last_ms += 1
+                self.__seq = 0
+            seq = self.__seq
+            self.__seq += 1
+            return (self.__last_ms << (NODE_BITS + SEQ_BITS)) | \
+                self.__node_bits | seq
+
+
+def process_is_live(host, pid):
+    """ Function that tells whether the process holding a node id lease may
+    still be running. Processes on other hosts are taken to be"""
+
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running, as another user
+        pass
+    return True
+
+
+def encode(trans_id):
+    """ Returns the 13 character base32 display form of an id. The strings
+    sort in the same order as the ids"""
+
+    chars = []
+    for _ in range(13):
+        chars.append(ENCODING[trans_id & 31])
+        trans_id >>= 5
+    return ''.join(reversed(chars))
+
+
+def timestamp_of(trans_id):
+    """ Returns the epoch time in seconds at which an id was generated"""
+    return ((trans_id >> (NODE_BITS + SEQ_BITS)) + ID_EPOCH_MS) / 1000
+
+
+# One generator per ledger database in this process, by the path as given
+# and by its absolute path
+_generators = {}
+_generators_lock = threading.Lock()
+
+# Generator set with set_generator, used for every ledger
+_generator = None
+
+
+def generator_for(db_path=None):
+    """ Returns the generator of this process for a ledger database
+    (LedgerStore's default if None)"""
+
+    generator = _generators.get(db_path)
+    if generator is None:
+        key = os.path.abspath(db_path) if db_path else None
+        with _generators_lock:
+            generator = _generators.get(key)
+            if generator is None:
+                generator = _generators[key] = TransIdGenerator(
+                    db_path=db_path)
+            _generators[db_path] = generator
+    return generator
+
+
+def set_generator(generator):
+    """ Replaces the generators next_id and next_ids draw from with one for
+    every ledger; None goes back to a generator per ledger"""
+    global _generator
+    _generator = generator
+
+
+@Metrics.timed('trans_id_seconds', 'Time to generate a transaction id')
+def next_id(db_path=None):
+    """ Returns the next transaction id for a ledger database from the
+    generator in use"""
+    return (_generator or generator_for(db_path)).next_id()
+
+
+@Metrics.timed('trans_ids_seconds',
+               'Time to generate a block of transaction ids')
+def next_ids(count, db_path=None):
+    """ Returns count consecutive transaction ids for a ledger database
+    from the generator in use"""
+    return (_generator or generator_for(db_path)).next_ids(count)
+
+
+def _ids_in_child(args):
+    """ Helper for the unit tests - generates ids for a ledger in a worker
+    process and writes them to it, returns the node id and the ids"""
+    from LedgerStore import LedgerStore
+
+    db_path, count = args
+    ids = [next_id(db_path) for _ in range(count)]
+    store = LedgerStore(db_path)
+    try:
+        store.insert_transactions('CHK_100001', [
+            (trans_id, 0, 'Credit', 1, 0) for trans_id in ids], 0)
+    finally:
+        store.close()
+    return generator_for(db_path).node_id, ids
+
+
+# Unit Tests
+if __name__ == '__main__':
+    import tempfile
+    import multiprocessing
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Constructor tests
+    gen = TransIdGenerator(5)
+    assert gen.node_id == 5, "Invalid node id!"
+    try:
+        TransIdGenerator(MAX_NODE + 1)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Out of range node id should raise ValueError")
+
+    # Ids increase, carry the node id and the time they were generated at
+    ids = [gen.next_id() for _ in range(20000)]
+    assert ids == sorted(ids) and len(set(ids)) == len(ids), \
+        "Ids from one generator should be unique and increasing"
+    assert all((i >> SEQ_BITS) & MAX_NODE == 5 for i in ids), \
+        "Node id is missing from the ids"
+    assert abs(timestamp_of(ids[-1]) - time.time()) < 5, \
+        "Ids do not carry the time they were generated at"
+    assert 0 < ids[-1] < 2 ** 63, "Ids must fit a sqlite integer"
+
+    # Reserved ranges do not overlap single ids, even past MAX_SEQ a
+    # millisecond
+    id_range = gen.next_ids(MAX_SEQ * 3)
+    more_ids = [gen.next_id() for _ in range(10)]
+    assert id_range[0] > ids[-1] and more_ids[0] > id_range[-1], \
+        "Reserved ids overlap other ids"
+    assert id_range == sorted(set(id_range)) and \
+        all((i >> SEQ_BITS) & MAX_NODE == 5 for i in id_range), \
+        "Reserved ids should be unique, increasing and keep the node id"
+
+    # Display form sorts like the ids
+    assert len(encode(ids[0])) == 13, "Invalid display form length"
+    assert sorted(encode(i) for i in ids[::997]) == \
+        [encode(i) for i in ids[::997]], "Display form does not sort like ids"
+
+    # No collisions across threads
+    thread_gen = TransIdGenerator(7)
+    with ThreadPoolExecutor(8) as pool:
+        thread_ids = list(pool.map(
+            lambda _: [thread_gen.next_id() for _ in range(20000)], range(8)))
+    all_ids = [i for chunk in thread_ids for i in chunk]
+    assert len(set(all_ids)) == len(all_ids), "Ids collided across threads"
+
+    # No collisions across processes writing to one ledger - each leases a
+    # node of its own from it, whatever its process id, and forked children
+    # lease again
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, 'test_ledger.db')
+        assert generator_for(db_file) is generator_for(db_file) and \
+            generator_for(db_file).node_id is None, \
+            "Node id should be claimed on first use"
+        parent_node, parent_ids = _ids_in_child((db_file, 5000))
+        for start_method in ('fork', 'spawn'):
+            with multiprocessing.get_context(start_method).Pool(2) as pool:
+                proc_results = pool.map(_ids_in_child, [(db_file, 5000)] * 2)
+                pool.close()
+                pool.join()
+            nodes = [node for node, _ in proc_results]
+            assert parent_node not in nodes and nodes[0] != nodes[1], \
+                f"Processes ({start_method}) share a node id"
+            parent_ids += [i for _, ids in proc_results for i in ids]
+        assert len(set(parent_ids)) == len(parent_ids) == 25000, \
+            "Ids collided across processes"
+        assert next_id(db_file) >> SEQ_BITS & MAX_NODE == parent_node, \
+            "Parent lost its node id"
+
+        # Leases outlive any number of claims while their holders run: the
+        # nodes of the ended pool workers are leased again, the parent's is
+        # not, and once all 1024 are held the next claim fails
+        holders = [TransIdGenerator(db_path=db_file) for _ in range(MAX_NODE)]
+        held_nodes = [holder.claim_node() for holder in holders]
+        assert sorted(held_nodes + [parent_node]) == \
+            list(range(MAX_NODE + 1)), "Node ids were leased twice"
+        try:
+            TransIdGenerator(db_path=db_file).next_id()
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("Node id of a live process was leased again")
+        assert next_id(db_file) >> SEQ_BITS & MAX_NODE == parent_node and \
+            holders[-1].next_id() >> SEQ_BITS & MAX_NODE == held_nodes[-1], \
+            "Holders lost their node ids"
+
+    # Pluggable generator
+    set_generator(TransIdGenerator(9))
+    assert (next_id() >> SEQ_BITS) & MAX_NODE == 9 and \
+        (next_id('other.db') >> SEQ_BITS) & MAX_NODE == 9, \
+        "set_generator did not replace the generator"
+    set_generator(None)
+
+    # All tests passed!
+    print("\nAll TransIdGenerator unit tests passed!")
@@ -6,36 +6,89 @@ Term Project - Bank Account Manager (ATM Style)
 This program is a Bank Account Manager app that works with the terminal
 
 It works with a user to initially create a checking and a savings account,
-then provide options to withdraw money, deposit money, check balances and
-print out mini statement
+then provide options to withdraw money, deposit money, check balances,
+print out mini statement and transfer money between the two accounts
 
 Concurrency Note: This application is designed for single-user interactive use and is
 not currently set up for concurrent users.
 If this application were to be adapted for multi-user or concurrent access,
 several aspects would need significant redesign, including but not limited to:
-- Account Number Generation: The current method of generating account numbers in
-  CheckingAccount and SavingsAccount classes (class-level attribute initialized
-  once per script run) would not guarantee uniqueness across concurrent users.
-- Database Transaction Management: SQLite can handle some level of concurrency,
-  but the current implementation (each account class creating/deleting its own DB file
-  like "CheckingAccount.db") is not suited for shared access. A robust multi-user
-  system would require a centralized database, potentially with thread-safe connection
-  pools, and careful transaction management (e.g., row-level locking, or serialized
-  access for critical operations) to prevent race conditions and data corruption.
+- Account Number Generation: Account numbers come from AccNumAllocator and are
+  unique per account, across threads and processes.
+- Database Transaction Management: All accounts share one ledger database
+  ("BankLedger.db", see LedgerStore) and the two accounts of a session share one
+  connection to it. A robust multi-user system would still need thread-safe connection pools and
+  careful transaction management (e.g., row-level locking, or serialized access for
+  critical operations) to prevent race conditions and data corruption.
 - State Management: Ensuring that the state of each user's session and account
   data is properly isolated and managed would be critical.
-- File Handling: The `os.remove()` calls in account class `__init__` methods would
-  cause issues if multiple users were simultaneously trying to initialize accounts.
 """
-import re as regex
 import time
-import random
-from tabulate import tabulate
-
-# Import the Checking and Savings Account classes
-from CheckingAccount import CheckingAccount
-from SavingsAccount import SavingsAccount
 
+import Profiling
+from Money import Money
+from Helpers import valid_name, random_balance
+from MiniStatement import StatementRenderer
+
+# Only what the first prompt needs is imported at startup. The account
+# classes (with sqlite3), re and random are imported when first used - see
+# AccountSession and Helpers. tabulate is imported by MiniStatement when the
+# first statement is printed
+
+
+class AccountSession():
+    """ Account Session class - the Checking and Savings accounts of the user
+    of a terminal session. Each account is created, with a random opening
+    balance, the first time a menu action needs it. Both share one ledger
+    connection, opened with the first of them and closed by close.
+    """
+
+    def __init__(self, owner):
+        """Constructor keeps the owner - nothing is opened yet"""
+
+        self.owner = owner
+        self.store = None
+        self.__chk_acc = None
+        self.__sav_acc = None
+
+    def __repr__(self):
+        """ Representation of AccountSession"""
+        return f'AccountSession({self.owner!r})'
+
+    def __ledger(self):
+        """ Returns the ledger connection, opening it on first use"""
+        if self.store is None:
+            from LedgerStore import LedgerStore, DEFAULT_DB
+            self.store = LedgerStore(DEFAULT_DB)
+        return self.store
+
+    @property
+    def checking(self):
+        """ Checking account of the user, created on first use"""
+        if self.__chk_acc is None:
+            from CheckingAccount import CheckingAccount
+            self.__chk_acc = CheckingAccount(
+                self.owner, random_balance(1000, 5000), store=self.__ledger())
+        return self.__chk_acc
+
+    @property
+    def savings(self):
+        """ Savings account of the user, created on first use"""
+        if self.__sav_acc is None:
+            from SavingsAccount import SavingsAccount
+            self.__sav_acc = SavingsAccount(
+                self.owner, random_balance(5000, 100000),
+                store=self.__ledger())
+        return self.__sav_acc
+
+    def close(self):
+        """ Closes the ledger connection, if one was opened"""
+        if self.store is not None:
+            self.store.close()
+
+
+# Statements of the accounts of the terminal session
+STATEMENTS = StatementRenderer()
 
 
 def atm_func(acc_type):
@@ -50,7 +103,7 @@ def atm_func(acc_type):
     # Define other variables
     ops_bool = True
     dashes_str = "-" * 50
-    orig_bal = round(acc_type.balance, 2)
+    orig_bal = acc_type.balance
 
     # Show ATM options
     while ops_bool:
@@ -80,17 +133,16 @@ def atm_func(acc_type):
                 #    The ATM could ideally pre-validate to prevent negative withdrawals if that's desired behavior.
                 # 3. Zero (e.g., 0). Expected: Account class handles this (withdraws $0.00).
                 # 4. Amount greater than balance. Expected: Account class returns "Cannot overdraw!".
-                # 5. Very large number (e.g., 999999999999999). Expected: Handled by float conversion, then by balance check.
-                # 6. Empty input (just press Enter). Expected: "Not a valid input! Please enter only numbers." (due to float conversion failure).
+                # 5. Very large number (e.g., 999999999999999). Expected: Read exactly by Money.of, then by balance check.
+                # 6. Empty input (just press Enter). Expected: "Not a valid input! Please enter only numbers." (Money.of cannot read it).
                 # 7. Input with spaces (e.g., "1 00"). Expected: "Not a valid input! Please enter only numbers."
                 try:
-                    w_amt = float(input(('Enter the amount to be withdrawn: ')))
+                    w_amt = Money.of(input('Enter the amount to be withdrawn: '))
                 except ValueError:
                     print('Not a valid input! Please enter only numbers.')
                     continue
                 else:
                     print(acc_type.withdraw(w_amt))
-                    time.sleep(1)
 
             if input_str == '2':
                 # Deposit
@@ -98,39 +150,34 @@ def atm_func(acc_type):
                 # 1. Non-numeric input (e.g., "xyz"). Expected: "Not a valid input! Please enter only numbers."
                 # 2. Negative value (e.g., -100). Expected: Account class returns "Cannot deposit negative amounts!".
                 # 3. Zero (e.g., 0). Expected: Account class returns "Nothing to deposit.".
-                # 4. Very large number (e.g., 999999999999999). Expected: Should deposit successfully if it's a valid float.
-                # 5. Empty input (just press Enter). Expected: "Not a valid input! Please enter only numbers." (due to float conversion failure).
+                # 4. Very large number (e.g., 999999999999999). Expected: Should deposit successfully, to the exact cent.
+                # 5. Empty input (just press Enter). Expected: "Not a valid input! Please enter only numbers." (Money.of cannot read it).
                 # 6. Input with spaces (e.g., "1 00"). Expected: "Not a valid input! Please enter only numbers."
                 try:
-                    dep_amt = float(input(('Enter the amount to be deposited: ')))
+                    dep_amt = Money.of(input('Enter the amount to be deposited: '))
                 except ValueError:
                     print('Not a valid input! Please enter only numbers.')
                     continue
                 else:
                     print(acc_type.deposit(dep_amt))
-                    time.sleep(1)
 
             if input_str == '3':
                 # Check balance
                 print(acc_type)
-                time.sleep(1)
 
             if input_str == '4':
                 # Mini Statement
-                stmt_list = acc_type.mini_statement()
+                stmt_table = STATEMENTS.render(acc_type)
 
-                if len(stmt_list) > 0:
+                if stmt_table:
                     print(f'{acc_type}\nAccount Owner:'
                           f' {acc_type.owner}\nStatement Printed Time: '
                           f'{time.asctime()}\n\n{"-" * 77}')
-                    print(tabulate(stmt_list, headers="firstrow",
-                               numalign= "center", stralign="center",
-                               tablefmt="presto"))
+                    print(stmt_table)
                     print(f'\nBalance at account creation was: '
-                          f'${orig_bal:,.2f}')
+                          f'{orig_bal}')
                 else:
                     print(f'{dashes_str} \nNo activity since account creation.')
-                time.sleep(2)
 
             if input_str == '5':
                 # Exit from current account session
@@ -138,15 +185,51 @@ def atm_func(acc_type):
                 # 1. After exiting an account (e.g., Checking), the loop for `acc_choice` (main menu) should appear.
                 # 2. User should be able to choose the other account (e.g., Savings) and perform operations.
                 #    Verify that the state of the first account (e.g., Checking) is preserved if accessed again later in the same overall ATM session.
-                # 3. User should be able to choose to exit the ATM entirely (option 3 on `acc_choice` menu).
+                # 3. User should be able to choose to exit the ATM entirely (option 4 on `acc_choice` menu).
                 #    Expected: Program terminates, "Thanks for using ATM..." message is displayed.
-                #    The main script ensures `close_db_connection()` is called for both `chk_acc` and `sav_acc` upon full program exit.
+                #    The main script closes the ledger connection shared by the accounts of the session upon full program exit.
                 print(f'Exiting from {acc_type}')
-                time.sleep(2)
                 ops_bool = False
 
 
+def transfer_func(chk_acc, sav_acc):
+    """ Moves money between the Checking and Savings accounts of the user.
+    Both legs of the transfer are written in one transaction"""
+
+    # Manual Test Cases for Transfer Input:
+    # 1. Direction other than 1 or 2 (e.g., "3", "a"). Expected: "Not a valid input! Try again.."
+    # 2. Non-numeric amount (e.g., "abc"). Expected: "Not a valid input! Please enter only numbers."
+    # 3. Amount greater than the source balance. Expected: "Cannot overdraw!" and neither balance changes.
+    # 4. Negative or zero amount. Expected: Account class refuses it, neither balance changes.
+    direction = input('\nTransfer from\n1: Checking to Savings\n'
+                      '2: Savings to Checking\n')
+    if direction not in ('1', '2'):
+        print('Not a valid input! Try again..')
+        return
+    src, dst = (chk_acc, sav_acc) if direction == '1' else (sav_acc, chk_acc)
+
+    try:
+        amt = Money.of(input('Enter the amount to be transferred: '))
+    except ValueError:
+        print('Not a valid input! Please enter only numbers.')
+        return
+    print(src.transfer(dst, amt))
+    print(f'\n{chk_acc}\n\n{sav_acc}')
+
+
 if __name__ == '__main__':
+    import sys
+
+    # argparse is only loaded when there are options to parse
+    if len(sys.argv) > 1:
+        import argparse
+        parser = argparse.ArgumentParser(description='Bank Account Manager ATM')
+        parser.add_argument('--profile-ops', metavar='DIR',
+                            help='profile the slowest account operations and '
+                                 'dump them to this directory at exit')
+        args = parser.parse_args()
+        if args.profile_ops:
+            Profiling.enable(args.profile_ops)
 
     print('\n\t\t \U0001F4B5\U0001F4B5\U0001F4B5 Welcome to ATM at 521 '
           'Commonwealth Ave \U0001F4B5\U0001F4B5\U0001F4B5 ')
@@ -172,44 +255,35 @@ if __name__ == '__main__':
         # 6. Name with leading/trailing spaces (e.g., "  John Doe  "). Expected: Should be stripped, "John Doe" used. (The code does use .strip() later).
         name_str = input('\nTo start, enter your first and last name to '
                          'create Checking and Savings accounts: \n')
-        match = regex.search(r"(\w+)$", name_str) # Note: This regex only checks if the string *ends* with a word character.
-                                                 # It doesn't strictly validate "first and last name" format or disallow internal numbers/symbols.
-
-        if match:
-            print('Thanks! Please wait.. Creating and loading accounts...')
-            time.sleep(3)
 
+        if valid_name(name_str):
             # Derive first name from full name and make it account owner
             name_str = name_str.strip().title()
             name_list = name_str.split()
 
-            # Generate accounts and balances
-            chk_acc = CheckingAccount(name_str,
-                                      random.randrange(1000,5000) / 1.11)
-            sav_acc = SavingsAccount(name_str,
-                                     random.randrange(5000, 100000) / 1.11)
-
-            # Print out info about generated accounts
-            print(f'\nCongratulations {name_list[0]}! Your accounts '
-                  f'have been created!\n')
+            # Accounts and balances are generated when first used
+            session = AccountSession(name_str)
+            print(f'\nCongratulations {name_list[0]}! Your Checking and '
+                  f'Savings accounts are created as soon as you use them.\n')
             print(f'Account owner: {name_str} \n+{dashes_str}+')
-            print(f'{chk_acc}\n\n{sav_acc}\n+{dashes_str}+')
 
             # Ask which account before providing ATM options
             while acc_sess_bool:
                 # Manual Test Cases for Account Choice Input:
                 # 1. Non-numeric input (e.g., "a", "test"). Expected: "Not a valid input! Try again.."
-                # 2. Numbers outside range (e.g., "0", "4", "-1"). Expected: "Not a valid input! Try again.."
+                # 2. Numbers outside range (e.g., "0", "5", "-1"). Expected: "Not a valid input! Try again.."
                 # 3. Empty input (just press Enter). Expected: "Not a valid input! Try again.."
                 acc_choice = input(('\nWhich account do you want to use for '
                                   'this session?\n1: Checking\n2: Savings '
-                                    '\n3: Exit ATM\n'))
+                                    '\n3: Transfer Between Accounts'
+                                    '\n4: Exit ATM\n'))
 
                 if acc_choice == '1':
                     # Call atm_func to provide working options for Checking
                     # Manual Test Flow Suggestion:
                     # 1. After choosing Checking, perform a sequence: Deposit -> Withdraw -> Check Balance -> Print Statement.
                     # 2. Try to exit this account session (option 5 in atm_func) and then select Checking again to ensure state is preserved or reset as expected.
+                    chk_acc = session.checking
                     print(f'\n{dashes_str} \n{chk_acc}')
                     atm_func(chk_acc)
 
@@ -218,18 +292,25 @@ if __name__ == '__main__':
                     # Manual Test Flow Suggestion:
                     # 1. After choosing Savings, perform a sequence: Withdraw (try to overdraw) -> Deposit -> Print Statement -> Check Balance.
                     # 2. Try to exit this account session (option 5 in atm_func) and then select Savings again.
+                    sav_acc = session.savings
                     print(f'\n{dashes_str} \n{sav_acc}')
                     atm_func(sav_acc)
 
                 elif acc_choice == '3':
+                    # Move money between Checking and Savings
+                    # Manual Test Flow Suggestion:
+                    # 1. Transfer from Checking to Savings, then open each account and check both balances and mini statements.
+                    # 2. Transfer more than the Savings balance back to Checking. Expected: "Cannot overdraw!".
+                    transfer_func(session.checking, session.savings)
+
+                elif acc_choice == '4':
                     # Exit full program
                     print('\n\t\U0001F4B5\U0001F4B5 Thanks for using ATM '
                           'at 521 Commonwealth Ave! \U0001F4B5\U0001F4B5\n')
                     acc_sess_bool = False
                     sent_bool = False
-                    # Close database connections
-                    chk_acc.close_db_connection()
-                    sav_acc.close_db_connection()
+                    # Close the database connection, if one was opened
+                    session.close()
 
                 else:
                     # Loop back if choice is not one of options
@@ -0,0 +1,26 @@
+"""
+Benchmarks for the Bank Account Manager account classes.
+
+Run each one from the repository root as a module, e.g.
+python -m benchmarks.batch_posting
+
+The scratch directory the benchmarks work in is kept here; the percentile
+of their latency samples comes from Helpers.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def scratch_dir():
+    """ Works in a new temporary directory for the with block, so the
+    repo's database files are untouched, then goes back and removes it"""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        orig_dir = os.getcwd()
+        os.chdir(tmp_dir)
+        try:
+            yield tmp_dir
+        finally:
+            os.chdir(orig_dir)
@@ -0,0 +1,58 @@
+"""
+Benchmark - account numbers allocated per second by block size, across
+several processes, and full CheckingAccount creations per second.
+
+Usage: python -m benchmarks.account_creation [num_accounts]
+"""
+import sys
+import time
+import multiprocessing
+
+from benchmarks import scratch_dir
+from AccNumAllocator import AccNumAllocator
+from CheckingAccount import CheckingAccount
+
+
+def allocate(args):
+    """ Allocates n account numbers with a new allocator, returns them"""
+    db_path, block_size, n = args
+    allocator = AccNumAllocator(db_path, block_size)
+    return [allocator.next_acc_num() for _ in range(n)]
+
+
+def run(n):
+    """ Times account number allocation and account creation, prints the
+    rates"""
+    print(f'{"Case":<34}{"Per second":>14}')
+    results = {}
+    for block_size in (1, 100, 1000):
+        start = time.perf_counter()
+        allocate(('bench.db', block_size, n))
+        results[f'numbers, block of {block_size}'] = \
+            n / (time.perf_counter() - start)
+
+    workers = 4
+    start = time.perf_counter()
+    with multiprocessing.get_context('fork').Pool(workers) as pool:
+        proc_nums = pool.map(allocate, [('bench.db', 1000, n)] * workers)
+    results[f'numbers, {workers} processes'] = \
+        n * workers / (time.perf_counter() - start)
+    all_nums = [i for chunk in proc_nums for i in chunk]
+    assert len(set(all_nums)) == len(all_nums), "Account numbers repeated!"
+
+    start = time.perf_counter()
+    for _ in range(min(n, 2000)):
+        CheckingAccount('Bench User', 100, 'bench.db').close_db_connection()
+    results['CheckingAccount()'] = \
+        min(n, 2000) / (time.perf_counter() - start)
+
+    for name, rate in results.items():
+        print(f'{name:<34}{rate:>14,.0f}')
+    return results
+
+
+if __name__ == '__main__':
+    num_accounts = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    with scratch_dir():
+        run(num_accounts)
@@ -0,0 +1,82 @@
+"""
+Benchmark - memory per account and attribute access time of the slotted,
+integer-cents Account against the layout the account classes had before it
+(a plain class with a __dict__, a float balance and a cursor per instance).
+
+Both kinds of accounts share one LedgerStore here, so the numbers are for the
+objects alone - before Account, every instance also held its own connection.
+
+Usage: python -m benchmarks.account_footprint [num_accounts]
+"""
+import sys
+import timeit
+import tracemalloc
+
+from benchmarks import scratch_dir
+from CheckingAccount import CheckingAccount
+from LedgerStore import LedgerStore
+
+
+class LegacyCheckingAccount():
+    """ Attribute layout of CheckingAccount before Account existed"""
+
+    def __init__(self, store, acc_num, owner, balance):
+        self.owner = owner
+        self.balance = balance
+        self.acc_num = acc_num
+        self._pending = None
+        self._store = store
+        self.cur = store.conn.cursor()
+        self.tb_name = 'CHK_' + acc_num
+
+
+def measure(make, n):
+    """ Returns the accounts made by make(i) for n accounts and the bytes
+    allocated per account"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    accounts = [make(i) for i in range(n)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return accounts, (after - before) / n
+
+
+def run(n):
+    """ Creates n accounts of each layout and prints bytes per account and
+    nanoseconds per attribute access"""
+    store = LedgerStore('bench.db', 'bulk')
+    acc_nums = []
+    with store.conn:
+        for i in range(n):
+            acc = CheckingAccount('Bench User', 1234.56, store=store)
+            acc_nums.append(acc.acc_num)
+
+    legacy_accs, legacy_bytes = measure(
+        lambda i: LegacyCheckingAccount(store, acc_nums[i], 'Bench User',
+                                        1234.56), n)
+    new_accs, new_bytes = measure(
+        lambda i: CheckingAccount.open_account(acc_nums[i], store=store), n)
+
+    print(f'{"Layout":<28}{"Bytes/account":>15}')
+    print(f'{"before (__dict__, float)":<28}{legacy_bytes:>15,.0f}')
+    print(f'{"Account (__slots__, cents)":<28}{new_bytes:>15,.0f}')
+
+    print(f'\n{"Attribute access":<28}{"ns/access":>15}')
+    for name, stmt, acc in (('before: balance', 'acc.balance', legacy_accs[0]),
+                            ('Account: cents', 'acc.cents', new_accs[0]),
+                            ('Account: balance', 'acc.balance', new_accs[0]),
+                            ('before: owner', 'acc.owner', legacy_accs[0]),
+                            ('Account: owner', 'acc.owner', new_accs[0])):
+        loops = 1000000
+        secs = min(timeit.repeat(stmt, globals={'acc': acc}, number=loops,
+                                 repeat=3))
+        print(f'{name:<28}{secs / loops * 1e9:>15,.1f}')
+    store.close()
+    return legacy_bytes, new_bytes
+
+
+if __name__ == '__main__':
+    num_accounts = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    with scratch_dir():
+        run(num_accounts)
@@ -0,0 +1,110 @@
+"""
+Benchmark - deposits and withdrawals per second of short ATM sessions:
+- connection per session: each call opens the account with a ledger
+  connection of its own, as the account classes do, and closes it again
+- service, one per round trip: through an AccountService on a Unix socket,
+  one request per round trip
+- service, pipelined: through the same service, PIPELINE requests per round
+  trip with IN_FLIGHT round trips under way
+
+The balances are checked through the service after the runs, and every
+ledger connection the service opened is counted.
+
+Usage: python -m benchmarks.account_service [num_calls] [num_accounts]
+"""
+import sys
+import time
+import asyncio
+import threading
+
+from benchmarks import scratch_dir
+from CheckingAccount import CheckingAccount
+from AccountService import AccountService, AccountClient, STATUS_OK
+
+PIPELINE = 100
+# Pipelines sent ahead of their replies - more could fill the socket buffers
+IN_FLIGHT = 4
+OPENING_BALANCE = 1000
+
+
+def calls(n, acc_ids):
+    """ Returns n calls spread over the accounts, each account getting
+    deposits of $2 and withdrawals of $1 in turn"""
+    return [('withdraw', acc_ids[i % len(acc_ids)], 1)
+            if i // len(acc_ids) % 2 else
+            ('deposit', acc_ids[i % len(acc_ids)], 2) for i in range(n)]
+
+
+def run(n, num_accounts):
+    """ Runs n calls each way and prints calls per second"""
+
+    results = {}
+    accs = [CheckingAccount(f'Owner {i}', OPENING_BALANCE, 'bench.db')
+            for i in range(num_accounts)]
+    for acc in accs:
+        acc.close_db_connection()
+    acc_ids = [acc.tb_name for acc in accs]
+
+    start = time.perf_counter()
+    for op, acc_id, amt in calls(n, acc_ids):
+        acc = CheckingAccount.open_account(acc_id.partition('_')[2],
+                                           'bench.db')
+        if op == 'withdraw':
+            acc.withdraw(amt)
+        else:
+            acc.deposit(amt)
+        acc.close_db_connection()
+    results['connection per session'] = time.perf_counter() - start
+
+    # The service runs its own event loop on a thread
+    service = AccountService('bench.db')
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    server = asyncio.run_coroutine_threadsafe(
+        service.start_unix('service.sock'), loop).result()
+
+    with AccountClient(unix='service.sock') as client:
+        start = time.perf_counter()
+        for op, acc_id, amt in calls(n, acc_ids):
+            assert client.pipeline([(op, acc_id, amt)])[0][0] == STATUS_OK, \
+                "Call was refused"
+        results['service, one per round trip'] = time.perf_counter() - start
+
+        requests = calls(n, acc_ids)
+        replies = []
+        start = time.perf_counter()
+        for num_sent, i in enumerate(range(0, n, PIPELINE), 1):
+            client.send(requests[i:i + PIPELINE])
+            if num_sent > IN_FLIGHT:
+                replies += client.receive()
+        while len(replies) < n:
+            replies += client.receive()
+        results['service, pipelined'] = time.perf_counter() - start
+        assert all(status == STATUS_OK for status, _, _ in replies), \
+            "Pipelined call was refused"
+
+        # Every run added a dollar per two calls on an account
+        expected = OPENING_BALANCE * 100 + 3 * (n // num_accounts // 2) * 100
+        assert {cents for _, cents, _ in client.pipeline(
+            [('balance', acc_id) for acc_id in acc_ids])} == {expected}, \
+            "Balances are wrong"
+
+    server.close()
+    asyncio.run_coroutine_threadsafe(server.wait_closed(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    service.close()
+
+    print(f'{n:,} calls over {num_accounts:,} accounts, '
+          f'{service.pool_size} service connections')
+    print(f'{"Run":<32}{"calls/s":>12}')
+    for name, elapsed in results.items():
+        print(f'{name:<32}{n / elapsed:>12,.0f}')
+    return results
+
+
+if __name__ == '__main__':
+    num_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    accounts = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    with scratch_dir():
+        run(num_calls, accounts)
@@ -0,0 +1,64 @@
+"""
+Load generator - runs many simultaneous ATM sessions against an in-process
+AtmServer on a localhost TCP port and reports sessions per second.
+
+Every simulated session creates the accounts, makes a deposit, a withdrawal
+and a balance check on Checking, prints its mini statement, transfers money
+from Checking to Savings and exits.
+
+Usage: python -m benchmarks.atm_load [num_sessions] [concurrency]
+"""
+import sys
+import time
+import asyncio
+
+from benchmarks import scratch_dir
+from AtmServer import AtmServer, PROMPT
+
+# Answers of one session, in order
+SESSION_SCRIPT = ['Load Tester', '1', '2', '125.50', '1', '40', '3', '4',
+                  '5', '3', '1', '25', '4']
+
+
+async def run_session(port):
+    """ Plays SESSION_SCRIPT on a new connection, waiting for each prompt"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    for answer in SESSION_SCRIPT:
+        await reader.readuntil(PROMPT.encode())
+        writer.write((answer + '\n').encode())
+    await writer.drain()
+    output = await reader.read()
+    writer.close()
+    assert b'Thanks for using ATM' in output, "Session did not finish"
+
+
+async def run(n, concurrency):
+    """ Runs n sessions, concurrency at a time, and prints sessions/s"""
+    atm_server = AtmServer('bench.db', 'balanced')
+    server = await atm_server.start_tcp()
+    port = server.sockets[0].getsockname()[1]
+    limit = asyncio.Semaphore(concurrency)
+
+    async def limited_session():
+        async with limit:
+            await run_session(port)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(limited_session() for _ in range(n)))
+    elapsed = time.perf_counter() - start
+
+    server.close()
+    await server.wait_closed()
+    atm_server.close()
+    assert atm_server.sessions_served == n, "Not every session was served"
+    print(f'{n:,} sessions, {concurrency:,} at a time: '
+          f'{n / elapsed:,.0f} sessions/s')
+    return n / elapsed
+
+
+if __name__ == '__main__':
+    num_sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    num_concurrent = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    with scratch_dir():
+        asyncio.run(run(num_sessions, num_concurrent))
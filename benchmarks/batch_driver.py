@@ -0,0 +1,76 @@
+"""
+Benchmark - replays one generated workload with BatchDriver on 1, 2 and 4
+processes, each on a fresh ledger database, and prints the throughput and
+the latency of every operation.
+
+After each run the ledger is checked: every account's balance is the
+running balance of its latest transaction, and every transfer has both of
+its legs.
+
+Usage: python -m benchmarks.batch_driver [num_sessions] [ops_per_session]
+"""
+import sys
+import sqlite3
+
+from benchmarks import scratch_dir
+from BatchDriver import BatchDriver, generate_workload
+from LedgerStore import TRANSFER_IN_REMARK, TRANSFER_OUT_REMARK
+
+PROCESSES = (1, 2, 4)
+
+LATEST_BALANCES_SQL = '''
+SELECT a.account_id, a.balance, (SELECT t.balance FROM transactions t
+                                 WHERE t.account_id = a.account_id
+                                 ORDER BY t.trans_id DESC LIMIT 1)
+FROM accounts a'''
+COUNT_REMARK_SQL = 'SELECT count(*) FROM transactions WHERE remark = ?'
+
+
+def check_ledger(db_path):
+    """ Asserts that the ledger at db_path is consistent"""
+
+    with sqlite3.connect(db_path) as conn:
+        for account_id, balance, latest in conn.execute(LATEST_BALANCES_SQL):
+            assert latest is None or balance == latest, \
+                f'{account_id} balance {balance} is not its running ' \
+                f'balance {latest}'
+        legs = [conn.execute(COUNT_REMARK_SQL, (remark,)).fetchone()[0]
+                for remark in (TRANSFER_OUT_REMARK, TRANSFER_IN_REMARK)]
+        assert legs[0] == legs[1], f'Transfer legs do not match: {legs}'
+    conn.close()
+
+
+def run(num_sessions, ops_per_session):
+    """ Runs the workload on each number of processes and prints a line per
+    run and the latencies of the single process run"""
+
+    generate_workload('workload.jsonl', num_sessions, ops_per_session)
+    reports = []
+    for processes in PROCESSES:
+        db_path = f'batch_{processes}.db'
+        reports.append(BatchDriver(db_path, processes=processes).run(
+            'workload.jsonl'))
+        check_ledger(db_path)
+
+    print(f'{num_sessions:,} sessions of {ops_per_session} operations')
+    print(f'{"Processes":<12}{"seconds":>10}{"sessions/s":>12}{"ops/s":>10}')
+    for report in reports:
+        print(f'{report["processes"]:<12}{report["seconds"]:>10,.2f}'
+              f'{report["sessions_per_s"]:>12,.0f}'
+              f'{report["ops_per_s"]:>10,.0f}')
+
+    print(f'\n{"Operation":<12}{"p50 (us)":>10}{"p99 (us)":>10}'
+          f'{"p999 (us)":>11}   (1 process)')
+    for op, op_latency in reports[0]['latency'].items():
+        print(f'{op:<12}{op_latency["p50_us"]:>10,.1f}'
+              f'{op_latency["p99_us"]:>10,.1f}'
+              f'{op_latency["p999_us"]:>11,.1f}')
+    return reports
+
+
+if __name__ == '__main__':
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    ops = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    with scratch_dir():
+        run(sessions, ops)
@@ -0,0 +1,59 @@
+"""
+Benchmark - transactions per second of the one-commit-per-call path
+(deposit/withdraw) against post_batch and group_commit.
+
+Usage: python -m benchmarks.batch_posting [num_transactions]
+"""
+import sys
+import time
+
+from benchmarks import scratch_dir
+from CheckingAccount import CheckingAccount
+
+
+def one_commit_per_call(acc, n):
+    """ Posts n transactions with a commit after every call"""
+    for i in range(n):
+        if i % 2:
+            acc.withdraw(5)
+        else:
+            acc.deposit(10)
+
+
+def batched(acc, n):
+    """ Posts n transactions as one batch"""
+    acc.post_batch(('withdraw', 5) if i % 2 else ('deposit', 10)
+                   for i in range(n))
+
+
+def group_committed(acc, n):
+    """ Posts n transactions with deposit/withdraw inside one group commit"""
+    with acc.group_commit():
+        one_commit_per_call(acc, n)
+
+
+def run(n):
+    """ Runs every posting path on a fresh account and prints the results"""
+    results = {}
+    for name, func in (('one commit per call', one_commit_per_call),
+                       ('post_batch', batched),
+                       ('group_commit', group_committed)):
+        acc = CheckingAccount('Bench User', 1000)
+        start = time.perf_counter()
+        func(acc, n)
+        elapsed = time.perf_counter() - start
+        acc.close_db_connection()
+        results[name] = n / elapsed
+
+    base = results['one commit per call']
+    print(f'{"Path":<22}{"Trans./s":>14}{"Speedup":>10}')
+    for name, rate in results.items():
+        print(f'{name:<22}{rate:>14,.0f}{rate / base:>9.1f}x')
+    return results
+
+
+if __name__ == '__main__':
+    num_trans = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    with scratch_dir():
+        run(num_trans)
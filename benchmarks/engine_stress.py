@@ -0,0 +1,60 @@
+"""
+Stress benchmark - AccountEngine throughput with 1 to 16 worker threads on a
+mix of deposits and withdrawals that try hard to overdraw, checking after
+every run that no overdraft got through.
+
+Usage: python -m benchmarks.engine_stress [num_calls] [num_accounts]
+"""
+import sys
+import time
+import random
+
+from benchmarks import scratch_dir
+from AccountEngine import AccountEngine
+from CheckingAccount import CheckingAccount
+from LedgerStore import LedgerStore
+
+
+def run(n, num_accounts):
+    """ Runs n calls per thread count and prints calls/s, checking balances
+    after every run"""
+    print(f'{"Threads":>8}{"Calls/s":>12}{"Rejected":>10}')
+    results = {}
+    for threads in (1, 2, 4, 8, 16):
+        db_file = f'bench_{threads}.db'
+        accs = [CheckingAccount('Bench User', 50, db_file)
+                for _ in range(num_accounts)]
+        calls = [(random.choice(accs), random.random() < 0.7,
+                  random.randint(1, 2000) / 100) for _ in range(n)]
+
+        start = time.perf_counter()
+        with AccountEngine(db_file, max_workers=threads) as engine:
+            futures = [engine.withdraw(acc, amt) if is_withdraw
+                       else engine.deposit(acc, amt)
+                       for acc, is_withdraw, amt in calls]
+            msgs = [f.result() for f in futures]
+        results[threads] = n / (time.perf_counter() - start)
+
+        # Linearizability check - balances never went below zero and the
+        # database agrees with the accounts
+        store = LedgerStore(db_file)
+        assert store.cur.execute(
+            'SELECT min(balance) FROM transactions').fetchone()[0] >= 0, \
+            "Overdraft got through!"
+        for acc in accs:
+            assert store.load_account(acc.tb_name)[1] == acc.cents >= 0, \
+                "Balance on the database differs from the account"
+            acc.close_db_connection()
+        store.close()
+
+        rejected = sum(m.startswith('Cannot') for m in msgs)
+        print(f'{threads:>8}{results[threads]:>12,.0f}{rejected:>10,}')
+    return results
+
+
+if __name__ == '__main__':
+    num_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    num_accs = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    with scratch_dir():
+        run(num_calls, num_accs)
@@ -0,0 +1,54 @@
+"""
+Benchmark - transaction ids per second from TransIdGenerator, one at a time,
+reserved in blocks and from several threads, against the random 8 character
+ids the account classes used before.
+
+Usage: python -m benchmarks.id_generation [num_ids]
+"""
+import sys
+import time
+import random
+import string as st
+from concurrent.futures import ThreadPoolExecutor
+
+from TransIdGenerator import TransIdGenerator
+
+
+def random_ids(n):
+    """ The old way - 8 random uppercase letters and digits"""
+    for _ in range(n):
+        ''.join(random.choices(st.ascii_uppercase + st.digits, k=8))
+
+
+def run(n):
+    """ Times n ids for each way of generating them and prints ids/s"""
+    gen = TransIdGenerator(1)
+    next_id = gen.next_id
+
+    def single(n):
+        for _ in range(n):
+            next_id()
+
+    def blocks(n):
+        for _ in range(n // 1000):
+            gen.next_ids(1000)
+
+    def threads(n):
+        with ThreadPoolExecutor(4) as pool:
+            list(pool.map(single, [n // 4] * 4))
+
+    print(f'{"Generator":<28}{"Ids/s":>14}')
+    results = {}
+    for name, func in (('random.choices (old)', random_ids),
+                       ('next_id', single),
+                       ('next_ids(1000)', blocks),
+                       ('next_id, 4 threads', threads)):
+        start = time.perf_counter()
+        func(n)
+        results[name] = n / (time.perf_counter() - start)
+        print(f'{name:<28}{results[name]:>14,.0f}')
+    return results
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
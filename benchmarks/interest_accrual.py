@@ -0,0 +1,95 @@
+"""
+Benchmark - daily savings interest accrual (InterestEngine) on 1, 2 and 4
+processes, against posting the interest one account at a time.
+
+num_accounts savings accounts are loaded with restore_accounts. Each run
+accrues a new day, so every run does the full work. The interest is worked
+out in parallel, but sqlite takes one write transaction at a time, so only
+the computing part scales with the processes - and only up to the CPUs of
+the machine (printed first).
+
+Usage: python -m benchmarks.interest_accrual [num_accounts]
+"""
+import os
+import sys
+import time
+
+from benchmarks import scratch_dir
+from LedgerStore import LedgerStore
+from SavingsAccount import SavingsAccount
+from InterestEngine import InterestEngine, daily_interest
+from TransIdGenerator import next_ids
+
+FIRST_DAY = 18718
+
+# Accounts posted one at a time for the comparison
+LOOP_SAMPLE = 5000
+
+
+def build_accounts(db_path, n):
+    """ Loads n savings accounts with balances from $1 to $100,000"""
+
+    store = LedgerStore(db_path, 'bulk')
+    store.restore_accounts(((f'SAV_{100001 + i}', 'Bench User',
+                             100 + i * 7919 % 10000000) for i in range(n)),
+                           (), 100001 + n)
+    store.close()
+
+
+def timed(func, *args):
+    """ Runs func, returns (result, seconds)"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def run(n):
+    """ Runs the accruals and prints the results"""
+
+    build_accounts('bench.db', n)
+    print(f'{n:,} savings accounts, {os.cpu_count()} CPUs')
+    results = {}
+
+    # Computing only - Decimal interest on every balance
+    balances = [100 + i * 7919 % 10000000 for i in range(n)]
+    _, results['interest only, no posting'] = timed(
+        lambda: [daily_interest(bal, SavingsAccount.INTEREST_RATE)
+                 for bal in balances])
+
+    # Posting one account at a time - an accrual and a commit per account
+    store = LedgerStore('bench.db')
+    sample = min(n, LOOP_SAMPLE)
+    acc_ids = store.account_ids('SAV_')[:sample]
+    start = time.perf_counter()
+    for acc_id in acc_ids:
+        ((_, balance),) = store.accrual_balances(acc_id, acc_id, FIRST_DAY)
+        amount = daily_interest(balance, SavingsAccount.INTEREST_RATE)
+        store.post_accruals(FIRST_DAY, [(acc_id, balance, next_ids(1, 'bench.db')[0],
+                                         int(time.time()), 'Interest',
+                                         amount)])
+    results['one account at a time'] = \
+        (time.perf_counter() - start) * n / sample
+    store.close()
+
+    day = FIRST_DAY + 1
+    for workers in (1, 2, 4):
+        engine = InterestEngine('bench.db', max_workers=workers)
+        (num_accrued, _), results[f'engine, {workers} workers'] = timed(
+            engine.accrue, day)
+        assert num_accrued == n, "Not every account was accrued"
+        day += 1
+
+    print(f'{"Run":<28}{"Seconds":>10}{"Accounts/s":>14}{"Speedup":>10}')
+    base = results['engine, 1 workers']
+    for name, elapsed in results.items():
+        note = ' (extrapolated)' if name.startswith('one') else ''
+        print(f'{name:<28}{elapsed:>10.3f}{n / elapsed:>14,.0f}'
+              f'{base / elapsed:>9.1f}x{note}')
+    return results
+
+
+if __name__ == '__main__':
+    num_accs = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    with scratch_dir():
+        run(num_accs)
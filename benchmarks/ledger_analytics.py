@@ -0,0 +1,166 @@
+"""
+Benchmark - month-end analytics (LedgerAnalytics) over a large memory-mapped
+ledger archive, against a Python loop over the transactions.
+
+A synthetic archive of num_transactions rows over num_accounts accounts and
+90 days is written block by block with new_archive, so it never has to fit
+in memory, then opened with load_ledger. The Python loop computes the
+average daily balances of a sample of accounts, from rows already read into
+lists, and is extrapolated.
+
+Usage: python -m benchmarks.ledger_analytics [num_transactions] [num_accounts]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+from benchmarks import scratch_dir
+from LedgerArchive import load_ledger, new_archive
+import LedgerAnalytics as la
+
+NUM_DAYS = 90
+FIRST_DAY = la.month_days(2021, 2)[0]
+YEAR, MONTH = 2021, 3
+
+# Accounts generated at a time
+BLOCK_ACCOUNTS = 10000
+
+# Accounts run through the Python loop
+LOOP_SAMPLE = 200
+
+
+def build_archive(archive_dir, n, num_accounts):
+    """ Writes a synthetic archive with n transactions spread evenly over
+    num_accounts accounts"""
+
+    rng = np.random.default_rng(1)
+    # Checking accounts first, then savings - archives keep accounts in id
+    # order
+    acc_ids = np.array([f'{"CHK" if i < num_accounts // 2 else "SAV"}_'
+                        f'{100001 + i}' for i in range(num_accounts)])
+    opening = rng.integers(0, 10000000, num_accounts)
+    per_acc = np.full(num_accounts, n // num_accounts)
+    per_acc[:n % num_accounts] += 1
+    ends = np.cumsum(per_acc)
+
+    # Balances are filled in below, once the amounts are known
+    ledger = new_archive(archive_dir, {
+        'account_id': acc_ids, 'owner': np.full(num_accounts, 'Bench User'),
+        'account_balance': np.zeros(num_accounts, dtype=np.int64)},
+        n, ['Credit', 'Debit'])
+    balances = np.zeros(num_accounts, dtype=np.int64)
+    for first_acc in range(0, num_accounts, BLOCK_ACCOUNTS):
+        last_acc = min(first_acc + BLOCK_ACCOUNTS, num_accounts)
+        start = ends[first_acc] - per_acc[first_acc]
+        end = ends[last_acc - 1]
+        account = np.repeat(np.arange(first_acc, last_acc, dtype=np.int32),
+                            per_acc[first_acc:last_acc])
+        # Random times, sorted within every account
+        offsets = rng.integers(0, NUM_DAYS * la.SECONDS_PER_DAY, end - start)
+        offsets = np.sort(account.astype(np.int64) << 32 | offsets) & \
+            0xFFFFFFFF
+        amount = rng.integers(-2000, 5000, end - start)
+
+        ledger.trans_id[start:end] = np.arange(start, end)
+        ledger.account[start:end] = account
+        ledger.ts[start:end] = FIRST_DAY * la.SECONDS_PER_DAY + offsets
+        ledger.remark[start:end] = amount < 0
+        ledger.amount[start:end] = amount
+        ledger.balance[start:end] = amount
+        del account, offsets, amount
+
+    # Running balances - a grouped cumulative sum per block
+    for first_acc in range(0, num_accounts, BLOCK_ACCOUNTS):
+        last_acc = min(first_acc + BLOCK_ACCOUNTS, num_accounts)
+        start = ends[first_acc] - per_acc[first_acc]
+        end = ends[last_acc - 1]
+        totals = np.cumsum(ledger.amount[start:end])
+        group_starts = ends[first_acc:last_acc] - per_acc[first_acc:last_acc]
+        before = np.append(0, totals)[group_starts - start] - \
+            opening[first_acc:last_acc]
+        totals -= np.repeat(before, per_acc[first_acc:last_acc])
+        ledger.balance[start:end] = totals
+        balances[first_acc:last_acc] = totals[ends[first_acc:last_acc] -
+                                              start - 1]
+    for name in ('trans_id', 'account', 'ts', 'remark', 'amount', 'balance'):
+        getattr(ledger, name).flush()
+    np.save(os.path.join(archive_dir, 'account_balance.npy'), balances)
+
+
+def loop_day_sums(opening, timestamps, amounts, start_day, end_day):
+    """ Sum of end of day balances of one account, one transaction at a
+    time"""
+
+    bal = opening
+    closing = {}
+    for ts, amount in zip(timestamps, amounts):
+        bal += amount
+        closing[ts // la.SECONDS_PER_DAY] = bal
+    bal = opening
+    total = 0
+    for day in range(min(closing), end_day):
+        bal = closing.get(day, bal)
+        if day >= start_day:
+            total += bal
+    return total
+
+
+def timed(func, *args):
+    """ Runs func, returns (result, seconds)"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def run(n, num_accounts):
+    """ Builds the archive, runs the analytics and prints the results"""
+
+    _, build_time = timed(build_archive, 'archive', n, num_accounts)
+    print(f'{n:,} transactions, {num_accounts:,} accounts - archive written '
+          f'in {build_time:.1f}s')
+
+    ledger, open_time = timed(load_ledger, 'archive')
+    start_day, end_day = la.month_days(YEAR, MONTH)
+    results = {'open archive (mmap)': open_time}
+    running, results['running balances'] = timed(la.running_balances, ledger)
+    assert np.array_equal(running, ledger.balance), \
+        "Running balances differ from the balance column"
+    del running
+    _, results['daily closing balances'] = timed(la.daily_closing_balances,
+                                                  ledger)
+    day_sums, results['average daily balances'] = timed(
+        la.balance_day_sums, ledger, start_day, end_day)
+    _, results['month end, all figures'] = timed(la.month_end, ledger, YEAR,
+                                                  MONTH, 0.02)
+
+    # The loop gets its rows as Python lists, read before the clock starts
+    sample = min(LOOP_SAMPLE, num_accounts)
+    opening = la.opening_balances(ledger)[:sample].tolist()
+    sample_rows = [ledger.account_rows(acc_id)
+                   for acc_id in ledger.account_ids[:sample]]
+    sample_rows = [(ledger.ts[rows].tolist(), ledger.amount[rows].tolist())
+                   for rows in sample_rows]
+    start = time.perf_counter()
+    loop_sums = [loop_day_sums(opening[acc], *sample_rows[acc], start_day,
+                               end_day) for acc in range(sample)]
+    results['average daily, Python loop'] = \
+        (time.perf_counter() - start) * num_accounts / sample
+    assert loop_sums == day_sums[:sample].tolist(), \
+        "Python loop and NumPy differ"
+
+    print(f'{"Step":<30}{"Seconds":>10}{"Rows/s":>16}')
+    for name, elapsed in results.items():
+        note = ' (extrapolated)' if 'loop' in name else ''
+        print(f'{name:<30}{elapsed:>10.3f}{n / elapsed:>16,.0f}{note}')
+    del ledger
+    return results
+
+
+if __name__ == '__main__':
+    num_trans = int(sys.argv[1]) if len(sys.argv) > 1 else 100000000
+    num_accs = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+    with scratch_dir():
+        run(num_trans, num_accs)
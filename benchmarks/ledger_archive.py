@@ -0,0 +1,131 @@
+"""
+Benchmark - columnar ledger archives (LedgerArchive) against working on the
+ledger database directly.
+
+1. A ledger database of num_transactions rows is exported to a .npy archive,
+   summed per account both from the archive and with SQL, and restored into
+   a new database. The restore is compared with replaying the transactions
+   one insert and commit at a time (on a sample, as that is slow).
+2. A synthetic archive of archive_rows rows is saved straight from NumPy,
+   then memory-mapped and summed per account, to show the time to open and
+   analyze a large ledger.
+
+Usage: python -m benchmarks.ledger_archive [num_transactions] [archive_rows]
+"""
+import sys
+import time
+
+import numpy as np
+
+from benchmarks import scratch_dir
+from LedgerStore import LedgerStore
+from LedgerArchive import LedgerColumns, export_ledger, load_ledger, \
+    restore_ledger, save_ledger
+
+NUM_ACCOUNTS = 1000
+
+# Transactions replayed one at a time for the comparison
+REPLAY_SAMPLE = 20000
+
+
+def build_ledger(store, n):
+    """ Loads n transactions spread over NUM_ACCOUNTS accounts"""
+
+    acc_ids = [f'CHK_{100001 + i}' for i in range(NUM_ACCOUNTS)]
+    store.restore_accounts(
+        ((acc_id, 'Bench User', 0) for acc_id in acc_ids),
+        ([(acc_ids[i % NUM_ACCOUNTS], i + 1, 1618740000 + i, 'Credit', 100,
+           (i // NUM_ACCOUNTS + 1) * 100)
+          for i in range(first, min(first + 100000, n))]
+         for first in range(0, n, 100000)),
+        100001 + NUM_ACCOUNTS)
+
+
+def sum_per_account(ledger):
+    """ Totals the amounts of every account from the archive columns"""
+
+    starts = np.searchsorted(ledger.account, np.arange(len(ledger.account_ids)))
+    return np.add.reduceat(ledger.amount, starts)
+
+
+def timed(func, *args):
+    """ Runs func, returns (result, seconds)"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def run(n, archive_rows):
+    """ Runs both parts and prints the results"""
+
+    store = LedgerStore('bench.db', 'bulk')
+    build_ledger(store, n)
+    results = {}
+
+    _, results['export to .npy'] = timed(export_ledger, store, 'archive')
+    ledger, results['open archive (mmap)'] = timed(load_ledger, 'archive')
+    archive_sums, results['sum per account, archive'] = timed(
+        sum_per_account, ledger)
+    sql_sums, results['sum per account, SQL'] = timed(
+        lambda: store.cur.execute('SELECT sum(amount) FROM transactions '
+                                  'GROUP BY account_id ORDER BY account_id'
+                                  ).fetchall())
+    assert archive_sums.tolist() == [i[0] for i in sql_sums], \
+        "Archive and database totals differ"
+    store.close()
+
+    restore_store = LedgerStore('restored.db', 'bulk')
+    _, results['restore from archive'] = timed(restore_ledger, 'archive',
+                                                restore_store)
+    restore_store.close()
+
+    # Replaying as the accounts post - one insert and commit per transaction
+    replay_store = LedgerStore('replayed.db', 'bulk')
+    sample = min(n, REPLAY_SAMPLE)
+    replay_rows = next(ledger.transaction_chunks(sample))
+    start = time.perf_counter()
+    for row in replay_rows:
+        replay_store.insert_transactions(row[0], [row[1:]], row[5])
+    results['replay one at a time'] = \
+        (time.perf_counter() - start) * n / sample
+    replay_store.close()
+    del ledger
+
+    print(f'{n:,} transactions, {NUM_ACCOUNTS:,} accounts')
+    print(f'{"Step":<28}{"Seconds":>10}{"Rows/s":>14}')
+    for name, elapsed in results.items():
+        note = ' (extrapolated)' if name.startswith('replay') else ''
+        print(f'{name:<28}{elapsed:>10.3f}{n / elapsed:>14,.0f}{note}')
+
+    # A large archive saved straight from NumPy
+    rng = np.random.default_rng(1)
+    account = np.sort(rng.integers(0, NUM_ACCOUNTS, archive_rows,
+                                   dtype=np.int32))
+    amount = rng.integers(-5000, 10000, archive_rows)
+    save_ledger(LedgerColumns(
+        {'trans_id': np.arange(archive_rows), 'account': account,
+         'ts': np.arange(archive_rows) + 1618740000,
+         'remark': (amount < 0).astype(np.int8), 'amount': amount,
+         'balance': np.zeros(archive_rows, dtype=np.int64),
+         'account_id': np.array([f'CHK_{100001 + i}'
+                                 for i in range(NUM_ACCOUNTS)]),
+         'owner': np.array(['Bench User'] * NUM_ACCOUNTS),
+         'account_balance': np.zeros(NUM_ACCOUNTS, dtype=np.int64)},
+        ['Credit', 'Debit']), 'big_archive')
+    del account, amount
+
+    big_ledger, open_time = timed(load_ledger, 'big_archive')
+    _, sum_time = timed(sum_per_account, big_ledger)
+    print(f'\nArchive of {archive_rows:,} transactions: opened in '
+          f'{open_time:.3f}s, summed per account in {sum_time:.2f}s')
+    del big_ledger
+    results['big archive'] = (open_time, sum_time)
+    return results
+
+
+if __name__ == '__main__':
+    num_trans = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    num_archive_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 50000000
+
+    with scratch_dir():
+        run(num_trans, num_archive_rows)
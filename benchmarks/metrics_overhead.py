@@ -0,0 +1,67 @@
+"""
+Benchmark - cost of the Metrics instrumentation: deposit(), withdraw() and
+mini_statement() called undecorated (unwrapped), instrumented with
+metrics disabled and instrumented with metrics enabled. The same is done
+for an empty function, which shows the cost per call on its own.
+
+Usage: python -m benchmarks.metrics_overhead [num_calls]
+"""
+import sys
+import time
+import inspect
+
+from benchmarks import scratch_dir
+import Metrics
+from Account import Account
+from CheckingAccount import CheckingAccount
+
+# Calls of the empty function per run
+EMPTY_CALLS = 1000000
+
+
+@Metrics.timed('bench_empty_seconds', 'Empty function')
+def empty():
+    """ Instrumented function that does nothing"""
+
+
+def time_calls(func, args, n):
+    """ Returns the average time of n calls of func, in nanoseconds"""
+    start = time.perf_counter()
+    for _ in range(n):
+        func(*args)
+    return (time.perf_counter() - start) / n * 1e9
+
+
+def run(n):
+    """ Times every operation three ways and prints nanoseconds per call"""
+
+    acc = CheckingAccount('Bench User', 10 ** 6, 'bench.db')
+    ops = [('empty function', empty, (), EMPTY_CALLS)] + \
+        [(name, getattr(Account, name), args, n) for name, args in
+         (('deposit', (acc, 1.25)), ('withdraw', (acc, 1.25)),
+          ('mini_statement', (acc,)))]
+
+    results = {}
+    for name, func, args, calls in ops:
+        undecorated = time_calls(inspect.unwrap(func), args, calls)
+        Metrics.disable()
+        disabled = time_calls(func, args, calls)
+        Metrics.enable()
+        enabled = time_calls(func, args, calls)
+        Metrics.disable()
+        results[name] = (undecorated, disabled, enabled)
+    acc.close_db_connection()
+
+    print(f'{"Operation":<16}{"Undecorated":>13}{"Disabled":>11}'
+          f'{"Enabled":>11}  (ns per call)')
+    for name, (undecorated, disabled, enabled) in results.items():
+        print(f'{name:<16}{undecorated:>13,.0f}{disabled:>11,.0f}'
+              f'{enabled:>11,.0f}')
+    return results
+
+
+if __name__ == '__main__':
+    num_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    with scratch_dir():
+        run(num_calls)
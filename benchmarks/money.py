@@ -0,0 +1,130 @@
+"""
+Benchmark - nanoseconds per amount of the money arithmetic of the ATM, done
+with floats (as the account classes once did), with decimal.Decimal and with
+integer cents (Money and the functions of Money.py):
+- parse: an amount typed at the ATM, e.g. '1234.56'
+- add: a running balance of n amounts
+- format: an amount as '$1,234.56', over amounts that repeat as balances
+  and statement rows do (format_cents keeps the recent ones), and uncached
+- interest: a day's interest on n balances, rounded half to even to cents -
+  a Decimal per balance, scale_half_even per int, and scale_half_even on a
+  NumPy array of all of them (skipped without NumPy)
+
+The float running balance is checked for drift against the exact one, and
+every way of working out the interest must give the same cents.
+
+Usage: python -m benchmarks.money [num_amounts]
+"""
+import sys
+import time
+import random
+from decimal import Decimal, ROUND_HALF_EVEN
+
+from Money import Money, parse_cents, format_cents, scale_half_even
+
+# Rate of the interest case, and the distinct amounts of the cached format
+# case
+ANNUAL_RATE = Decimal('0.015')
+DAY_COUNT = 365
+REPEATED_AMOUNTS = 1000
+
+
+def timed(func, n):
+    """ Returns the nanoseconds per amount of func(), the best of 3 runs,
+    and what func returned"""
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / n * 1e9, result
+
+
+def run(n):
+    """ Times every case each way over n amounts and prints ns per amount"""
+
+    rng = random.Random(1)
+    cents = [rng.randrange(-50000, 100000) for _ in range(n)]
+    texts = [f'{"-" if c < 0 else ""}{abs(c) // 100}.{abs(c) % 100:02d}'
+             for c in cents]
+    floats = [float(text) for text in texts]
+    decimals = [Decimal(text) for text in texts]
+    monies = [Money(c) for c in cents]
+    results = {}
+
+    results['parse'] = [
+        ('float', timed(lambda: [float(text) for text in texts], n)),
+        ('Decimal', timed(lambda: [Decimal(text) for text in texts], n)),
+        ('parse_cents', timed(lambda: [parse_cents(text) for text in texts],
+                              n))]
+
+    def running(amounts, total):
+        """ Returns the running balance of amounts, starting at total"""
+        for amt in amounts:
+            total += amt
+        return total
+
+    results['add'] = [
+        ('float', timed(lambda: running(floats, 0.0), n)),
+        ('Decimal', timed(lambda: running(decimals, Decimal(0)), n)),
+        ('int cents', timed(lambda: running(cents, 0), n)),
+        ('Money', timed(lambda: running(monies, Money(0)), n))]
+    exact = sum(cents)
+    assert results['add'][1][1][1] == Decimal(exact).scaleb(-2) and \
+        results['add'][2][1][1] == results['add'][3][1][1].cents == exact, \
+        "Exact running balances differ"
+    float_drift = abs(results['add'][0][1][1] * 100 - exact)
+
+    # Balances and statement rows repeat the same few amounts
+    repeated = [cents[i % REPEATED_AMOUNTS] for i in range(n)]
+    format_cents.cache_clear()
+    results['format'] = [
+        ('float', timed(lambda: ['${:,.2f}'.format(c / 100)
+                                 for c in repeated], n)),
+        ('Decimal', timed(lambda: ['${:,.2f}'.format(Decimal(c).scaleb(-2))
+                                   for c in repeated], n)),
+        ('format_cents', timed(lambda: [format_cents(c) for c in repeated],
+                               n)),
+        ('format_cents, uncached',
+         timed(lambda: [format_cents.__wrapped__(c) for c in repeated], n))]
+    assert results['format'][2][1][1] == results['format'][3][1][1] == \
+        [format_cents.__wrapped__(c) for c in repeated], \
+        "Cached amounts were formatted wrong"
+
+    balances = [abs(c) * 100 for c in cents]
+    numerator, denominator = ANNUAL_RATE.as_integer_ratio()
+    denominator *= DAY_COUNT
+    results['interest'] = [
+        ('Decimal', timed(lambda: [
+            int((Decimal(bal) * ANNUAL_RATE / DAY_COUNT).quantize(
+                Decimal(1), rounding=ROUND_HALF_EVEN)) for bal in balances],
+            n)),
+        ('scale_half_even, ints', timed(lambda: [
+            scale_half_even(bal, numerator, denominator)
+            for bal in balances], n))]
+    try:
+        import numpy as np
+    except ImportError:
+        pass
+    else:
+        balance_array = np.array(balances, dtype=np.int64)
+        results['interest'].append(
+            ('scale_half_even, array', timed(lambda: scale_half_even(
+                balance_array, numerator, denominator).tolist(), n)))
+    assert all(result == results['interest'][0][1][1]
+               for _, (_, result) in results['interest']), \
+        "Interest worked out differently"
+
+    print(f'{n:,} amounts; the float running balance is off by '
+          f'{float_drift:.2g} cents')
+    for case, timings in results.items():
+        print(f'\n{case:<28}{"ns/amount":>12}')
+        for name, (ns, _) in timings:
+            print(f'{name:<28}{ns:>12,.1f}')
+    return results
+
+
+if __name__ == '__main__':
+    num_amounts = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    run(num_amounts)
@@ -0,0 +1,45 @@
+"""
+Benchmark - p50/p99 latency of deposit() and withdraw() under each ledger
+durability/performance profile (see LedgerStore.PROFILES).
+
+Usage: python -m benchmarks.profile_latency [num_calls]
+"""
+import sys
+import time
+
+from Helpers import percentile
+from benchmarks import scratch_dir
+from CheckingAccount import CheckingAccount
+from LedgerStore import PROFILES
+
+
+def run(n):
+    """ Times n deposits and n withdrawals per profile, each on a new
+    database, and prints the latency percentiles in microseconds"""
+    print(f'{"Profile":<10}{"Operation":<11}{"p50 (us)":>10}{"p99 (us)":>10}')
+    results = {}
+    for profile in PROFILES:
+        acc = CheckingAccount('Bench User', 1000, f'bench_{profile}.db',
+                              profile)
+        timings = {'deposit': [], 'withdraw': []}
+        for _ in range(n):
+            for op_name, op_amt in (('deposit', 10), ('withdraw', 5)):
+                start = time.perf_counter()
+                getattr(acc, op_name)(op_amt)
+                timings[op_name].append(time.perf_counter() - start)
+        acc.close_db_connection()
+
+        for op_name, samples in timings.items():
+            samples.sort()
+            p50 = percentile(samples, 50) * 1e6
+            p99 = percentile(samples, 99) * 1e6
+            results[(profile, op_name)] = (p50, p99)
+            print(f'{profile:<10}{op_name:<11}{p50:>10,.0f}{p99:>10,.0f}')
+    return results
+
+
+if __name__ == '__main__':
+    num_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    with scratch_dir():
+        run(num_calls)
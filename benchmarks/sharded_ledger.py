@@ -0,0 +1,79 @@
+"""
+Benchmark - deposits and withdrawals per second of many accounts written to
+one ledger database, one commit per call, against ShardedLedger with 1, 2
+and 4 shards (worker processes), where the calls queued for a shard are
+committed in one batch.
+
+All calls are queued at once and the time runs until the last one is
+written. The total balance across the shards is checked after every run.
+Shards only write in parallel with a CPU (and disk) each: on one CPU the
+gain is that of the batched commits alone.
+
+Usage: python -m benchmarks.sharded_ledger [num_calls] [num_accounts]
+"""
+import os
+import sys
+import time
+
+from benchmarks import scratch_dir
+from CheckingAccount import CheckingAccount
+from LedgerStore import LedgerStore
+from ShardedLedger import ShardedLedger
+
+SHARD_COUNTS = (1, 2, 4)
+OPENING_BALANCE = 1000
+
+
+def run(n, num_accounts):
+    """ Runs n calls over num_accounts accounts each way and prints calls
+    per second"""
+
+    results = {}
+
+    store = LedgerStore('single.db')
+    accs = [CheckingAccount(f'Owner {i}', OPENING_BALANCE, store=store)
+            for i in range(num_accounts)]
+    start = time.perf_counter()
+    for i in range(n):
+        if i % 2:
+            accs[i % num_accounts].withdraw(1)
+        else:
+            accs[i % num_accounts].deposit(2)
+    results['one database'] = time.perf_counter() - start
+    store.close()
+
+    for num_shards in SHARD_COUNTS:
+        shard_dir = f'shards_{num_shards}'
+        os.mkdir(shard_dir)
+        with ShardedLedger(shard_dir, num_shards) as ledger:
+            acc_ids = [future.result() for future in
+                       [ledger.create_account(CheckingAccount, f'Owner {i}',
+                                              OPENING_BALANCE)
+                        for i in range(num_accounts)]]
+            start = time.perf_counter()
+            futures = [ledger.withdraw(acc_ids[i % num_accounts], 1) if i % 2
+                       else ledger.deposit(acc_ids[i % num_accounts], 2)
+                       for i in range(n)]
+            for future in futures:
+                future.result()
+            results[f'{num_shards} shard(s)'] = time.perf_counter() - start
+
+            expected = num_accounts * OPENING_BALANCE * 100 + \
+                (n - n // 2) * 200 - n // 2 * 100
+            assert ledger.total_balance() == (num_accounts, expected), \
+                "Total balance across the shards is wrong"
+
+    print(f'{n:,} calls over {num_accounts:,} accounts, '
+          f'{os.cpu_count()} CPU(s)')
+    print(f'{"Run":<16}{"calls/s":>12}')
+    for name, elapsed in results.items():
+        print(f'{name:<16}{n / elapsed:>12,.0f}')
+    return results
+
+
+if __name__ == '__main__':
+    num_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    accounts = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    with scratch_dir():
+        run(num_calls, accounts)
@@ -0,0 +1,117 @@
+"""
+Benchmark - startup of the terminal ATM: the time from starting
+bank_acc_mgr.py in a new process to its first prompt, against the start of
+a bare interpreter, and what its imports cost (python -X importtime).
+
+The target is a first prompt within TARGET_MS milliseconds; the run exits
+with status 1 if the median misses it. A first, untimed start writes the
+bytecode caches (even if PYTHONDONTWRITEBYTECODE is set), as an installed
+ATM would have them.
+
+Usage: python -m benchmarks.startup [num_runs]
+"""
+import os
+import sys
+import time
+import statistics
+import subprocess
+
+from benchmarks import scratch_dir
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ATM_SCRIPT = os.path.join(REPO_DIR, 'bank_acc_mgr.py')
+
+# Text of the first prompt
+PROMPT_MARKER = b'enter your first and last name'
+
+TARGET_MS = 50
+
+# Imports listed in the breakdown
+TOP_IMPORTS = 8
+
+# Environment of the started processes - with bytecode caches written
+ENV = {name: value for name, value in os.environ.items()
+       if name != 'PYTHONDONTWRITEBYTECODE'}
+
+
+def time_to_prompt():
+    """ Starts the ATM, returns the milliseconds until the first prompt"""
+
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-u', ATM_SCRIPT],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, env=ENV)
+    output = b''
+    while PROMPT_MARKER not in output:
+        chunk = os.read(proc.stdout.fileno(), 4096)
+        if not chunk:
+            raise RuntimeError('ATM exited before its first prompt')
+        output += chunk
+    elapsed = (time.perf_counter() - start) * 1e3
+    proc.kill()
+    proc.communicate()
+    return elapsed
+
+
+def time_bare():
+    """ Returns the milliseconds a bare interpreter takes to start and exit"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], check=True, env=ENV)
+    return (time.perf_counter() - start) * 1e3
+
+
+def import_breakdown():
+    """ Returns the cumulative import time of bank_acc_mgr and of each
+    module it imports directly, in milliseconds, from python -X importtime"""
+
+    env = dict(ENV, PYTHONPATH=REPO_DIR)
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             'import bank_acc_mgr'], env=env, check=True,
+                            capture_output=True, text=True).stderr
+    # Lines read 'import time: self | cumulative | name', name indented two
+    # spaces per level; a module's imports are listed before it
+    total, direct, pending = None, [], []
+    for line in stderr.splitlines()[1:]:
+        _, cumulative, name = line.split('|')
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        if level == 1:
+            pending.append((name.strip(), int(cumulative) / 1e3))
+        elif level == 0:
+            if name.strip() == 'bank_acc_mgr':
+                total, direct = int(cumulative) / 1e3, pending
+            pending = []
+    return total, sorted(direct, key=lambda item: -item[1])
+
+
+def run(n):
+    """ Starts the ATM n times and prints the startup times and imports"""
+
+    time_to_prompt()
+    bare = sorted(time_bare() for _ in range(n))
+    prompt = sorted(time_to_prompt() for _ in range(n))
+    total, direct = import_breakdown()
+
+    print(f'{n} runs, milliseconds')
+    print(f'{"Run":<26}{"min":>8}{"median":>8}{"max":>8}')
+    for name, samples in (('bare interpreter', bare),
+                          ('bank_acc_mgr first prompt', prompt)):
+        print(f'{name:<26}{samples[0]:>8.1f}'
+              f'{statistics.median(samples):>8.1f}{samples[-1]:>8.1f}')
+
+    print(f'\nimport bank_acc_mgr: {total:.1f} ms, slowest direct imports:')
+    for name, cumulative in direct[:TOP_IMPORTS]:
+        print(f'  {name:<24}{cumulative:>8.1f}')
+
+    median = statistics.median(prompt)
+    verdict = 'met' if median <= TARGET_MS else 'MISSED'
+    print(f'\nTarget of {TARGET_MS} ms to first prompt {verdict} '
+          f'(median {median:.1f} ms)')
+    return median <= TARGET_MS
+
+
+if __name__ == '__main__':
+    num_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    with scratch_dir():
+        target_met = run(num_runs)
+    sys.exit(0 if target_met else 1)
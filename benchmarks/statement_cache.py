@@ -0,0 +1,111 @@
+"""
+Benchmark - cost per call of ledger SQL built by pasting values into the
+text, against the fixed parameterized statements of LedgerStore with and
+without the connection's statement cache.
+
+Transactions are spread over NUM_ACCOUNTS accounts and posted the way
+deposit/withdraw post them - one insert into transactions and one balance
+update - inside a single database transaction, so commits do not hide the
+parse/plan cost. Then a tenth as many mini statements are read.
+
+Usage: python -m benchmarks.statement_cache [num_transactions]
+"""
+import sys
+import time
+import sqlite3
+
+from benchmarks import scratch_dir
+import LedgerStore as ls
+
+NUM_ACCOUNTS = 1000
+
+
+def acc_id(i):
+    """ Account the i-th transaction or statement is for"""
+    return f'CHK_{100001 + i % NUM_ACCOUNTS}'
+
+
+def concatenated(conn, n):
+    """ Posts n transactions and reads n // 10 statements with the values
+    pasted into the SQL text - a new statement to prepare on every call"""
+
+    start = time.perf_counter()
+    for i in range(n):
+        conn.execute(f"INSERT INTO transactions (account_id, trans_id, ts, "
+                     f"remark, amount, balance) VALUES ('{acc_id(i)}', "
+                     f"{i + 1}, 1618740000, 'Credit', 100, {100 * (i + 1)})")
+        conn.execute(f"UPDATE accounts SET balance = {100 * (i + 1)} "
+                     f"WHERE account_id = '{acc_id(i)}'")
+    conn.commit()
+    write_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(n // 10):
+        conn.execute(f"SELECT {ls.STATEMENT_COLUMNS} FROM transactions "
+                     f"WHERE account_id = '{acc_id(i)}' "
+                     f"ORDER BY trans_id DESC LIMIT 10").fetchall()
+    return write_time, time.perf_counter() - start
+
+
+def parameterized(conn, n):
+    """ Posts n transactions and reads n // 10 statements through the fixed
+    statements of LedgerStore, with the values bound as parameters"""
+
+    start = time.perf_counter()
+    for i in range(n):
+        conn.execute(ls.INSERT_TRANSACTION_SQL, (acc_id(i), i + 1, 1618740000,
+                                                 'Credit', 100, 100 * (i + 1)))
+        conn.execute(ls.UPDATE_BALANCE_SQL, (100 * (i + 1), acc_id(i)))
+    conn.commit()
+    write_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(n // 10):
+        conn.execute(ls.LATEST_TRANSACTIONS_SQL, (acc_id(i), 10)).fetchall()
+    return write_time, time.perf_counter() - start
+
+
+def open_ledger(db_path, cached_statements):
+    """ Creates a ledger database with NUM_ACCOUNTS accounts, returns a
+    connection to it tuned as per the bulk profile"""
+
+    store = ls.LedgerStore(db_path, 'bulk')
+    for i in range(NUM_ACCOUNTS):
+        store.create_account(acc_id(i), 'Bench User', 0)
+    store.close()
+    conn = sqlite3.connect(db_path, cached_statements=cached_statements)
+    for pragma, value in ls.PROFILES['bulk'].items():
+        conn.execute(f'PRAGMA {pragma} = {value}')
+    return conn
+
+
+def run(n):
+    """ Runs every path on a fresh database and prints the results"""
+
+    results = {}
+    for name, func, cache_size in (
+            ('concatenated SQL', concatenated, ls.STATEMENT_CACHE_SIZE),
+            ('parameterized, no cache', parameterized, 0),
+            ('parameterized, cached', parameterized,
+             ls.STATEMENT_CACHE_SIZE)):
+        conn = open_ledger(f'{len(results)}.db', cache_size)
+        results[name] = func(conn, n)
+        conn.close()
+
+    base_write, base_read = results['concatenated SQL']
+    print(f'{n:,} transactions, {n // 10:,} statements')
+    print(f'{"Path":<26}{"us/trans.":>11}{"Speedup":>9}'
+          f'{"us/stmt.":>11}{"Speedup":>9}')
+    for name, (write_time, read_time) in results.items():
+        print(f'{name:<26}{write_time / n * 1e6:>11.2f}'
+              f'{base_write / write_time:>8.1f}x'
+              f'{read_time / (n // 10) * 1e6:>11.2f}'
+              f'{base_read / read_time:>8.1f}x')
+    return results
+
+
+if __name__ == '__main__':
+    num_trans = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    with scratch_dir():
+        run(num_trans)
@@ -0,0 +1,99 @@
+"""
+Benchmark - rows per second and peak memory of full statement exports to CSV
+and JSON Lines. The last tenth of the history is exported too (keyset
+pagination from the id where it starts), to show that peak memory stays the
+same when the history is ten times longer.
+
+Peak memory is how far the resident set size of the process grew during an
+export, sampled from /proc/self/statm (Linux only). Exports read through a
+connection with the strict profile, which has no memory map and the smallest
+page cache, so that database pages read do not show up as export memory.
+
+Usage: python -m benchmarks.statement_export [num_transactions]
+"""
+import os
+import sys
+import time
+import threading
+
+from benchmarks import scratch_dir
+from LedgerStore import LedgerStore
+from StatementExport import export_statement
+
+ACC_ID = 'CHK_100001'
+
+# Rows inserted per call while the ledger is built
+LOAD_BATCH = 100000
+
+
+def build_ledger(store, n):
+    """ Loads n transactions for one account"""
+
+    store.create_account(ACC_ID, 'Bench User', 0)
+    ts = int(time.time()) - n
+    for first in range(0, n, LOAD_BATCH):
+        last = min(first + LOAD_BATCH, n)
+        store.insert_transactions(
+            ACC_ID, ((i + 1, ts + i, 'Credit', 100, (i + 1) * 100)
+                     for i in range(first, last)), last * 100)
+    store.checkpoint()
+
+
+def rss_bytes():
+    """ Resident set size of this process"""
+    with open('/proc/self/statm') as statm_file:
+        return int(statm_file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def timed_export(store, fmt, after_id):
+    """ Exports the statement, returns (rows, seconds, peak RSS growth in
+    bytes)"""
+
+    base_rss = peak_rss = rss_bytes()
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak_rss
+        while not done.wait(0.005):
+            peak_rss = max(peak_rss, rss_bytes())
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    start = time.perf_counter()
+    num_rows = export_statement(store, ACC_ID, f'statement.{fmt}',
+                                after_id=after_id)
+    elapsed = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    os.remove(f'statement.{fmt}')
+    return num_rows, elapsed, max(peak_rss, rss_bytes()) - base_rss
+
+
+def run(n):
+    """ Builds a ledger of n transactions, exports it and prints the
+    results"""
+
+    store = LedgerStore('bench.db', 'bulk')
+    start = time.perf_counter()
+    build_ledger(store, n)
+    store.close()
+    print(f'Loaded {n:,} transactions in {time.perf_counter() - start:.1f}s')
+
+    store = LedgerStore('bench.db', 'strict')
+    results = {}
+    print(f'{"Export":<16}{"Rows":>12}{"Rows/s":>12}{"Peak memory":>14}')
+    for fmt in ('csv', 'jsonl'):
+        for after_id in (n - n // 10, None):
+            num_rows, elapsed, peak = timed_export(store, fmt, after_id)
+            results[fmt, num_rows] = (num_rows / elapsed, peak)
+            print(f'{fmt:<16}{num_rows:>12,}{num_rows / elapsed:>12,.0f}'
+                  f'{peak / 1024:>11,.0f} KB')
+    store.close()
+    return results
+
+
+if __name__ == '__main__':
+    num_trans = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+
+    with scratch_dir():
+        run(num_trans)
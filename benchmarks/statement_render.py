@@ -0,0 +1,73 @@
+"""
+Benchmark - cost of printing a mini statement at the ATM:
+- database + render: read from the database and formatted every time, as
+  the ATM did before the ring buffer
+- ring buffer + render: read from the account's ring buffer, formatted and
+  laid out every time (render_statement)
+- renderer, unchanged: StatementRenderer asked again with no transaction in
+  between - the kept table
+- renderer, after a deposit: a deposit (not timed) before every statement -
+  the statement rendered again
+
+The last renderer table is checked against one rendered from the database.
+
+Usage: python -m benchmarks.statement_render [num_calls]
+"""
+import sys
+import time
+
+from benchmarks import scratch_dir
+from CheckingAccount import CheckingAccount
+from MiniStatement import StatementRenderer, render_statement
+
+HISTORY = 1000
+
+
+def run(n):
+    """ Times n statements each way and prints microseconds per statement"""
+
+    acc = CheckingAccount('Bench User', 10 ** 6, 'bench.db')
+    acc.post_batch([('deposit', 1)] * HISTORY)
+    results = {}
+
+    start = time.perf_counter()
+    for _ in range(n):
+        render_statement(acc.mini_statement(refresh=True))
+    results['database + render'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(n):
+        render_statement(acc.mini_statement())
+    results['ring buffer + render'] = time.perf_counter() - start
+
+    renderer = StatementRenderer()
+    renderer.render(acc)
+    start = time.perf_counter()
+    for _ in range(n):
+        renderer.render(acc)
+    results['renderer, unchanged'] = time.perf_counter() - start
+
+    elapsed = 0
+    for _ in range(n):
+        acc.deposit(0.01)
+        start = time.perf_counter()
+        table = renderer.render(acc)
+        elapsed += time.perf_counter() - start
+    results['renderer, after a deposit'] = elapsed
+
+    assert table == render_statement(acc.mini_statement(refresh=True)), \
+        "Renderer table differs from the database"
+    acc.close_db_connection()
+
+    print(f'{n:,} statements of an account with {HISTORY:,} transactions')
+    print(f'{"Run":<28}{"us/statement":>14}')
+    for name, elapsed in results.items():
+        print(f'{name:<28}{elapsed / n * 1e6:>14,.1f}')
+    return results
+
+
+if __name__ == '__main__':
+    num_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    with scratch_dir():
+        run(num_calls)
@@ -0,0 +1,276 @@
+"""
+Benchmark suite - the hot paths of the account classes in one run, written
+out as JSON and compared against a stored baseline so that a slowdown shows
+up as a regression.
+
+Cases:
+- create_account: a CheckingAccount with its own connection, as
+  bank_acc_mgr creates them, and one on a shared LedgerStore
+- deposit, withdraw: one call, and commit, at a time
+- mini_statement/<rows>: mini statements read from the database, of an
+  account with a history of 10, 1,000, 100,000 and 10,000,000 transactions
+  (--max-history caps it)
+- mini_statement/cached: mini statements answered from the account's ring
+  buffer, with no database read
+- mixed: 80% mini statements read from the database, 10% deposits and 10%
+  withdrawals over MIXED_ACCOUNTS accounts
+
+Every case is timed ROUNDS times and the best figure of the rounds is kept,
+as the worse ones mostly measure other work on the machine. It reports
+operations per second, p50/p99/p999 latency in microseconds and the peak
+resident set size of the process while it ran (sampled from
+/proc/self/statm - Linux only, null elsewhere).
+
+A case regresses if its operations per second drop by more than --tolerance
+percent against the baseline, or its p99 latency grows by more than twice
+that - tail latencies are noisier. The run then exits with status 1. Baselines are machine specific: after a change that is
+meant to make things faster or slower, or on a new machine, store a new one
+with --update-baseline.
+
+Usage: python -m benchmarks.suite [--ops N] [--max-history ROWS]
+           [--output FILE] [--baseline FILE] [--tolerance PCT]
+           [--update-baseline]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+
+from Helpers import percentile
+from benchmarks import scratch_dir
+from CheckingAccount import CheckingAccount
+from LedgerStore import LedgerStore
+
+SUITE_VERSION = 2
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'baseline.json')
+
+# Calls timed per case - the mixed case runs 5 times as many - and rounds
+# per case
+OPS = 10000
+ROUNDS = 3
+
+# History sizes of the mini statement cases
+HISTORY_SIZES = (10, 1000, 100000, 10000000)
+
+# Rows loaded per chunk while a history is built
+LOAD_CHUNK = 100000
+
+MIXED_ACCOUNTS = 100
+MIXED_HISTORY = 100
+
+# Allowed change against the baseline, in percent
+TOLERANCE = 25
+
+
+def rss_bytes():
+    """ Resident set size of this process, None where /proc is missing"""
+    try:
+        with open('/proc/self/statm') as statm_file:
+            return int(statm_file.read().split()[1]) * \
+                os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return None
+
+
+def measure(calls, rounds=ROUNDS):
+    """ Times a case rounds times, returns the best of each figure - the
+    highest operations per second and the lowest latencies - and the peak
+    RSS of all rounds"""
+
+    cases = [measure_round(calls) for _ in range(rounds)]
+    best = {'ops': cases[0]['ops'],
+            'ops_per_s': max(case['ops_per_s'] for case in cases)}
+    for name in ('p50_us', 'p99_us', 'p999_us'):
+        best[name] = min(case[name] for case in cases)
+    peaks = [case['peak_rss_mb'] for case in cases
+             if case['peak_rss_mb'] is not None]
+    best['peak_rss_mb'] = max(peaks) if peaks else None
+    return best
+
+
+def measure_round(calls):
+    """ Runs every (func, args) pair, timing each one, and returns the case
+    results"""
+
+    peak_rss = rss_bytes()
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak_rss
+        while not done.wait(0.01):
+            peak_rss = max(peak_rss, rss_bytes())
+
+    if peak_rss is not None:
+        sampler = threading.Thread(target=sample)
+        sampler.start()
+    samples = []
+    start = time.perf_counter()
+    for func, args in calls:
+        call_start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    if peak_rss is not None:
+        done.set()
+        sampler.join()
+        peak_rss = max(peak_rss, rss_bytes())
+
+    samples.sort()
+    return {'ops': len(samples),
+            'ops_per_s': round(len(samples) / elapsed, 1),
+            'p50_us': round(percentile(samples, 50) * 1e6, 1),
+            'p99_us': round(percentile(samples, 99) * 1e6, 1),
+            'p999_us': round(percentile(samples, 99.9) * 1e6, 1),
+            'peak_rss_mb': None if peak_rss is None else
+            round(peak_rss / 2 ** 20, 1)}
+
+
+def build_history(store, acc_num, rows):
+    """ Loads an account with rows transactions, returns it opened"""
+
+    acc_id = f'CHK_{acc_num}'
+    ts = int(time.time()) - rows
+    store.restore_accounts(
+        [(acc_id, 'Bench User', rows * 100)],
+        ([(acc_id, acc_num * 10 ** 8 + i, ts + i, 'Credit', 100,
+           (i + 1) * 100) for i in range(first, min(first + LOAD_CHUNK,
+                                                      rows))]
+         for first in range(0, rows, LOAD_CHUNK)),
+        acc_num + 1)
+    return CheckingAccount.open_account(str(acc_num), store=store)
+
+
+def read_statement(acc):
+    """ Reads the mini statement of acc from the database, not from its
+    ring buffer"""
+    return acc.mini_statement(refresh=True)
+
+
+def run_cases(ops, max_history):
+    """ Runs every case and returns the results by case name"""
+
+    results = {}
+    store = LedgerStore('suite.db')
+
+    def create_own():
+        CheckingAccount('Bench User', 100, 'suite.db').close_db_connection()
+    results['create_account'] = measure([(create_own, ())] * ops)
+    results['create_account/shared_store'] = measure(
+        [(CheckingAccount, ('Bench User', 100, 'suite.db', 'balanced',
+                            store))] * ops)
+
+    acc = CheckingAccount('Bench User', 10 ** 6, store=store)
+    results['deposit'] = measure([(acc.deposit, (1.25,))] * ops)
+    results['withdraw'] = measure([(acc.withdraw, (1.25,))] * ops)
+
+    # History accounts get numbers far above the ones handed out so far
+    for size_num, rows in enumerate(HISTORY_SIZES):
+        if rows > max_history:
+            continue
+        start = time.perf_counter()
+        hist_acc = build_history(store, 900001 + size_num, rows)
+        print(f'  history of {rows:,} rows loaded in '
+              f'{time.perf_counter() - start:.1f}s', file=sys.stderr)
+        results[f'mini_statement/{rows}'] = measure(
+            [(read_statement, (hist_acc,))] * ops)
+    hist_acc.mini_statement()
+    results['mini_statement/cached'] = measure(
+        [(hist_acc.mini_statement, ())] * ops)
+
+    mixed_accs = [CheckingAccount('Bench User', 10 ** 6, store=store)
+                  for _ in range(MIXED_ACCOUNTS)]
+    for mixed_acc in mixed_accs:
+        mixed_acc.post_batch([('deposit', 1)] * MIXED_HISTORY)
+    rng = random.Random(1)
+    calls = []
+    for _ in range(ops * 5):
+        mixed_acc = rng.choice(mixed_accs)
+        pick = rng.random()
+        if pick < 0.8:
+            calls.append((read_statement, (mixed_acc,)))
+        elif pick < 0.9:
+            calls.append((mixed_acc.deposit, (2.5,)))
+        else:
+            calls.append((mixed_acc.withdraw, (2.5,)))
+    results['mixed'] = measure(calls)
+    store.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """ Prints the results against the baseline, returns the names of the
+    cases that regressed"""
+
+    regressed = []
+    print(f'{"Case":<30}{"Ops/s":>12}{"p50 (us)":>10}{"p99 (us)":>10}'
+          f'{"p999 (us)":>11}{"RSS (MB)":>10}  vs baseline')
+    for name, case in results.items():
+        note = ''
+        base = baseline.get(name)
+        if base:
+            speed = (case['ops_per_s'] / base['ops_per_s'] - 1) * 100
+            tail = (case['p99_us'] / base['p99_us'] - 1) * 100
+            note = f'{speed:+.0f}% ops/s, {tail:+.0f}% p99'
+            if speed < -tolerance or tail > 2 * tolerance:
+                note += ' REGRESSION'
+                regressed.append(name)
+        rss = '-' if case['peak_rss_mb'] is None else case['peak_rss_mb']
+        print(f'{name:<30}{case["ops_per_s"]:>12,.0f}{case["p50_us"]:>10,.1f}'
+              f'{case["p99_us"]:>10,.1f}{case["p999_us"]:>11,.1f}{rss:>10}'
+              f'  {note}')
+    return regressed
+
+
+def main(args):
+    """ Runs the suite, writes the JSON report and checks the baseline"""
+
+    with scratch_dir():
+        results = run_cases(args.ops, args.max_history)
+
+    report = {'suite_version': SUITE_VERSION,
+              'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+              'machine': {'python': platform.python_version(),
+                          'platform': platform.platform(),
+                          'cpus': os.cpu_count()},
+              'settings': {'ops': args.ops, 'max_history': args.max_history},
+              'cases': results}
+    if args.output:
+        with open(args.output, 'w') as out_file:
+            json.dump(report, out_file, indent=2)
+
+    baseline = {}
+    if args.update_baseline:
+        with open(args.baseline, 'w') as out_file:
+            json.dump(report, out_file, indent=2)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as base_file:
+            baseline = json.load(base_file)['cases']
+    regressed = compare(results, baseline, args.tolerance)
+    if regressed:
+        print(f'\nRegressed against {args.baseline}: {", ".join(regressed)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark suite of the account classes')
+    parser.add_argument('--ops', type=int, default=OPS,
+                        help='calls timed per case (mixed runs 5 times as '
+                             'many)')
+    parser.add_argument('--max-history', type=int,
+                        default=max(HISTORY_SIZES),
+                        help='largest mini statement history, in rows')
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--baseline', default=BASELINE_FILE,
+                        help='baseline JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='allowed change against the baseline, in %%')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='store this run as the new baseline')
+    sys.exit(main(parser.parse_args()))
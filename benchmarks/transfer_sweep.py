@@ -0,0 +1,99 @@
+"""
+Benchmark - sweeping money from checking into savings for many customers:
+a withdrawal and a deposit per customer (two commits, not atomic), a
+transfer per customer (one commit, both legs) and transfer_batch.
+
+Customers are loaded with restore_accounts and opened on one shared store.
+Afterwards the ledger is checked: no money made or lost, and every transfer
+has both of its legs.
+
+Usage: python -m benchmarks.transfer_sweep [num_customers]
+"""
+import sys
+import time
+
+from benchmarks import scratch_dir
+from Account import Account
+from CheckingAccount import CheckingAccount
+from SavingsAccount import SavingsAccount
+from LedgerStore import LedgerStore
+
+# Customers swept one call at a time, for the comparison
+CALL_SAMPLE = 5000
+
+# Transfers per transfer_batch call
+BATCH_SIZE = 10000
+
+SWEEP_AMT = 1.25
+
+
+def build_customers(store, n):
+    """ Loads n customers, each with a checking and a savings account, and
+    returns them opened as (checking, savings) pairs"""
+
+    store.restore_accounts(
+        [(f'{prefix}_{100001 + i}', 'Bench User', 100000)
+         for i in range(n) for prefix in ('CHK', 'SAV')], (), 100001 + n)
+    return [(CheckingAccount.open_account(str(100001 + i), store=store),
+             SavingsAccount.open_account(str(100001 + i), store=store))
+            for i in range(n)]
+
+
+def run(n):
+    """ Sweeps every customer once per way and prints the results"""
+
+    store = LedgerStore('bench.db')
+    customers = build_customers(store, n)
+    sample = customers[:min(n, CALL_SAMPLE)]
+    results = {}
+
+    start = time.perf_counter()
+    for chk_acc, sav_acc in sample:
+        chk_acc.withdraw(SWEEP_AMT)
+        sav_acc.deposit(SWEEP_AMT)
+    results['withdraw + deposit'] = \
+        (time.perf_counter() - start) * n / len(sample)
+
+    start = time.perf_counter()
+    for chk_acc, sav_acc in sample:
+        chk_acc.transfer(sav_acc, SWEEP_AMT)
+    results['transfer per customer'] = \
+        (time.perf_counter() - start) * n / len(sample)
+
+    start = time.perf_counter()
+    for first in range(0, n, BATCH_SIZE):
+        messages = Account.transfer_batch(
+            (chk_acc, sav_acc, SWEEP_AMT)
+            for chk_acc, sav_acc in customers[first:first + BATCH_SIZE])
+        assert all(msg.startswith('Transferred') for msg in messages), \
+            "A sweep transfer was refused"
+    results[f'transfer_batch of {BATCH_SIZE:,}'] = \
+        time.perf_counter() - start
+
+    # Money only moved, and every transfer has both legs
+    total, legs_out, legs_in, net = store.cur.execute(
+        "SELECT (SELECT sum(balance) FROM accounts), "
+        "sum(remark = 'Transfer Out'), sum(remark = 'Transfer In'), "
+        "sum(amount) FILTER (WHERE remark LIKE 'Transfer%') "
+        "FROM transactions").fetchone()
+    assert total == 2 * n * 100000 and net == 0 and \
+        legs_out == legs_in == n + len(sample), \
+        "Ledger does not balance after the sweep"
+    assert [acc.cents for pair in customers for acc in pair] == \
+        [store.load_account(acc.tb_name)[1] for pair in customers
+         for acc in pair], "Accounts in memory differ from the ledger"
+    store.close()
+
+    print(f'{n:,} customers swept')
+    print(f'{"Run":<28}{"Seconds":>10}{"Transfers/s":>14}')
+    for name, elapsed in results.items():
+        note = ' (extrapolated)' if 'batch' not in name else ''
+        print(f'{name:<28}{elapsed:>10.3f}{n / elapsed:>14,.0f}{note}')
+    return results
+
+
+if __name__ == '__main__':
+    num_customers = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    with scratch_dir():
+        run(num_customers)
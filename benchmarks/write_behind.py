@@ -0,0 +1,85 @@
+"""
+Benchmark - acknowledgement latency of deposits and withdrawals committed to
+the ledger one at a time (Account) against the write-behind BalanceCache,
+with each of its durability windows.
+
+For the cache, the time for the ledger to catch up (close) is reported as
+well, and the ledger is checked against the balances the cache gave out.
+
+Usage: python -m benchmarks.write_behind [num_calls]
+"""
+import sys
+import time
+
+from Helpers import percentile
+from benchmarks import scratch_dir
+from BalanceCache import BalanceCache
+from CheckingAccount import CheckingAccount
+from LedgerStore import LedgerStore
+
+NUM_ACCOUNTS = 100
+
+# sync_interval of the cache runs - fsync every call, every 10 ms, never
+SYNC_RUNS = (('cache, fsync each call', 0), ('cache, fsync every 10ms', 0.01),
+             ('cache, OS buffered', None))
+
+
+def time_calls(calls):
+    """ Runs every (func, args) pair, returns the sorted latencies and the
+    total time"""
+
+    samples = []
+    start = time.perf_counter()
+    for func, args in calls:
+        call_start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    samples.sort()
+    return samples, elapsed
+
+
+def run(n):
+    """ Times n calls per run and prints the latency percentiles in
+    microseconds and the calls per second"""
+
+    results = {}
+    accs = [CheckingAccount('Bench User', 1000, 'bench.db')
+            for _ in range(NUM_ACCOUNTS)]
+    results['commit per call'] = time_calls(
+        [(accs[i % NUM_ACCOUNTS].deposit if i % 2 else
+          accs[i % NUM_ACCOUNTS].withdraw, (1,)) for i in range(n)]) + (0,)
+    for acc in accs:
+        acc.close_db_connection()
+
+    acc_ids = [acc.tb_name for acc in accs]
+    for name, sync_interval in SYNC_RUNS:
+        cache = BalanceCache('bench.db', sync_interval=sync_interval)
+        samples, elapsed = time_calls(
+            [(cache.deposit if i % 2 else cache.withdraw,
+              (acc_ids[i % NUM_ACCOUNTS], 100)) for i in range(n)])
+        balances = [cache.balance(acc_id) for acc_id in acc_ids]
+        start = time.perf_counter()
+        cache.close()
+        results[name] = (samples, elapsed, time.perf_counter() - start)
+
+        store = LedgerStore('bench.db')
+        assert [store.load_account(acc_id)[1] for acc_id in acc_ids] == \
+            balances, "Ledger did not catch up with the cache"
+        store.close()
+
+    print(f'{n:,} calls over {NUM_ACCOUNTS} accounts')
+    print(f'{"Run":<26}{"p50 (us)":>10}{"p99 (us)":>10}{"Calls/s":>12}'
+          f'{"Catch-up (s)":>14}')
+    for name, (samples, elapsed, catch_up) in results.items():
+        print(f'{name:<26}{percentile(samples, 50) * 1e6:>10,.1f}'
+              f'{percentile(samples, 99) * 1e6:>10,.1f}{n / elapsed:>12,.0f}'
+              f'{catch_up:>14.3f}')
+    return results
+
+
+if __name__ == '__main__':
+    num_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    with scratch_dir():
+        run(num_calls)